@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from fastapi import Cookie, HTTPException, status
+from typing import Optional, Tuple
+from models.user import UserInDB, user_manager
+from auth.jwt_handler import decode_token
+import os
+import threading
+import time
+
+# Tokens ya verificados -> usuario (evita decodificar el JWT y buscar el usuario en cada petición)
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+
+class TokenCache:
+    """LRU acotada de token -> usuario; cada entrada caduca con el token (o el TTL, lo que llegue antes)
+
+    Se invalida entera si cambian los usuarios y por token al cerrar sesión.
+    """
+
+    def __init__(self, max_entries: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[UserInDB, float]]" = OrderedDict()
+        self._users_version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str, users_version: int) -> Optional[UserInDB]:
+        with self._lock:
+            if users_version != self._users_version:
+                self._entries.clear()
+                self._users_version = users_version
+            entry = self._entries.get(token)
+            if entry is None or entry[1] <= time.time():
+                self._entries.pop(token, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, token: str, user: UserInDB, token_expires: float, users_version: int):
+        with self._lock:
+            if users_version != self._users_version:
+                return
+            self._entries[token] = (user, min(time.time() + self.ttl, token_expires))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: Optional[str] = None):
+        """Olvidar un token (logout) o todos"""
+        with self._lock:
+            if token is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(token, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+token_cache = TokenCache()
+
+def _login_redirect() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_302_FOUND, detail="Redirect to login",
+                         headers={"Location": "/login"})
+
+async def get_current_user(access_token: str = Cookie(None)) -> UserInDB:
+    """Dependencia de las rutas protegidas: usuario de la cookie o redirección a /login"""
+    if not access_token:
+        raise _login_redirect()
+
+    users_version = user_manager.current_version()
+    user = token_cache.get(access_token, users_version)
+    if user is not None:
+        return user
+
+    try:
+        payload = decode_token(access_token)
+    except HTTPException:
+        raise _login_redirect()
+    user = user_manager.get_user(payload["sub"])
+    if not user:
+        raise _login_redirect()
+
+    token_cache.put(access_token, user, float(payload.get("exp", 0)), users_version)
+    return user
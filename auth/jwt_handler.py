@@ -45,6 +45,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 def verify_token(token: str) -> str:
     """Verificar token JWT y devolver email"""
+    return decode_token(token)["sub"]
+
+def decode_token(token: str) -> dict:
+    """Verificar token JWT y devolver su payload (sub, exp, iat...)"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         
@@ -62,7 +66,7 @@ def verify_token(token: str) -> str:
                 detail="Token sin usuario"
             )
         
-        return email
+        return payload
         
     except JWTError as e:
         print(f"❌ Error JWT: {e}")
@@ -0,0 +1,4 @@
+"""Benchmarks de TOmi (se ejecutan fuera de línea, contra servicios simulados)
+
+    python -m benchmarks.load_test --help
+"""
@@ -0,0 +1,519 @@
+"""Prueba de carga de punta a punta: webhook → cola → RAG → LLM → Telegram
+
+    python -m benchmarks.load_test --rate 20 --duration 30 --groq-latency-ms 400
+    python -m benchmarks.load_test --rate 50 --json results.json --max-p95-ms 3000
+
+Levanta los stubs de Groq y Telegram (benchmarks/stubs.py) y la app de main.py en
+procesos propios, envía updates sintéticos al webhook a un ritmo controlado y mide:
+
+- latencia del webhook (ack), hasta el primer mensaje y hasta la respuesta completa
+  (hora de la última llamada sendMessage/editMessageText que recibe el stub de Telegram)
+- throughput y tasas de error (webhook, cola, LLM, Telegram, updates sin respuesta)
+- latencia por etapa según /metrics de la app (diferencia antes/después de la carga)
+
+Todo corre en local y sin red. El modelo de embeddings debe estar ya descargado
+(HF_HUB_OFFLINE=1) y la app usa el índice de data/ del directorio de trabajo.
+Con --max-p95-ms / --max-error-rate el proceso termina con código 1 si se superan.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import httpx
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPLY_METHODS = ("sendMessage", "editMessageText")
+
+QUESTIONS = (
+    "¿Cómo reinicio el router modelo {n}?",
+    "La impresora {n} muestra el error E{m}, ¿qué hago?",
+    "¿Cuál es la garantía del equipo serie {n}?",
+    "No enciende la pantalla del modelo {n} después de actualizar",
+    "¿Dónde descargo el manual del producto {n}?",
+)
+
+# ===== MÉTRICAS DE LA APP (formato texto de Prometheus) =====
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+Samples = Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]
+
+def parse_metrics(text: str) -> Samples:
+    """{(nombre, etiquetas ordenadas): valor} de una exportación de /metrics"""
+    samples: Samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line.strip())
+        if not match or line.startswith("#"):
+            continue
+        name, labels, value = match.groups()
+        key = tuple(sorted(_LABEL_RE.findall(labels or "")))
+        samples[(name, key)] = float(value)
+    return samples
+
+def _delta(before: Samples, after: Samples, name: str) -> Dict[Tuple[Tuple[str, str], ...], float]:
+    return {labels: value - before.get((metric, labels), 0.0)
+            for (metric, labels), value in after.items() if metric == name}
+
+def histogram_deltas(before: Samples, after: Samples, name: str, by: str) -> Dict[str, Dict[str, Any]]:
+    """Histograma acumulado durante la carga, agrupado por la etiqueta `by`"""
+    series: Dict[str, Dict[str, Any]] = defaultdict(lambda: {"buckets": [], "sum": 0.0, "count": 0.0})
+    for labels, value in _delta(before, after, f"{name}_bucket").items():
+        labels = dict(labels)
+        le = labels.pop("le")
+        series[labels.get(by, "")]["buckets"].append((math.inf if le == "+Inf" else float(le), value))
+    for suffix in ("sum", "count"):
+        for labels, value in _delta(before, after, f"{name}_{suffix}").items():
+            series[dict(labels).get(by, "")][suffix] += value
+    for entry in series.values():
+        entry["buckets"].sort()
+    return {key: entry for key, entry in series.items() if entry["count"] > 0}
+
+def histogram_quantile(q: float, buckets: Sequence[Tuple[float, float]]) -> Optional[float]:
+    """Cuantil aproximado por interpolación lineal dentro del bucket (como en PromQL)"""
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    lower, lower_count = 0.0, 0.0
+    for upper, count in buckets:
+        if count >= rank:
+            if upper == math.inf:
+                return lower
+            if count == lower_count:
+                return upper
+            return lower + (upper - lower) * (rank - lower_count) / (count - lower_count)
+        lower, lower_count = upper, count
+    return lower
+
+def counter_delta(before: Samples, after: Samples, name: str) -> float:
+    return sum(_delta(before, after, name).values())
+
+# ===== ESTADÍSTICAS =====
+
+def percentile(values: Sequence[float], q: float) -> Optional[float]:
+    """Percentil por rango más cercano (None si no hay valores)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+def summarize(values_ms: Sequence[float]) -> Dict[str, Any]:
+    def r(value):
+        return round(value, 1) if value is not None else None
+
+    return {
+        "count": len(values_ms),
+        "mean_ms": r(sum(values_ms) / len(values_ms)) if values_ms else None,
+        "p50_ms": r(percentile(values_ms, 0.50)),
+        "p95_ms": r(percentile(values_ms, 0.95)),
+        "p99_ms": r(percentile(values_ms, 0.99)),
+        "max_ms": r(max(values_ms)) if values_ms else None
+    }
+
+def rate(part: float, total: float) -> float:
+    return round(part / total, 4) if total else 0.0
+
+# ===== PROCESOS =====
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_process(args: List[str], env: Dict[str, str], log_path: str, cwd: str) -> subprocess.Popen:
+    log = open(log_path, "ab")
+    try:
+        return subprocess.Popen([sys.executable, "-m", *args], cwd=cwd, env=env, stdout=log,
+                                stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+def stop_process(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+async def wait_ready(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"el proceso terminó al arrancar (código {process.returncode})")
+        try:
+            if (await client.get(url, timeout=2.0)).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {timeout:.0f} s")
+
+# ===== CARGA =====
+
+class UpdateFactory:
+    """Updates sintéticos: un chat por update (para correlacionar las respuestas en el stub)"""
+
+    def __init__(self, repeat: float = 0.0, seed: Optional[int] = None):
+        self.repeat = repeat
+        self.random = random.Random(seed)
+        self.sent: List[Dict[str, Any]] = []
+        self._questions: List[str] = []
+        self._next = 1
+
+    def new(self) -> Dict[str, Any]:
+        n = self._next
+        self._next += 1
+        if self._questions and self.random.random() < self.repeat:
+            # Pregunta ya hecha: debería resolverse desde la caché de respuestas
+            text = self.random.choice(self._questions)
+        else:
+            text = self.random.choice(QUESTIONS).format(n=n, m=100 + n % 900)
+            self._questions.append(text)
+        update = {
+            "update_id": 500_000_000 + n,
+            "message": {
+                "message_id": n,
+                "date": int(time.time()),
+                "chat": {"id": 100_000 + n, "type": "private"},
+                "from": {"id": 100_000 + n, "is_bot": False, "first_name": "Bench"},
+                "text": text
+            }
+        }
+        self.sent.append(update)
+        return update
+
+    def duplicate(self) -> Optional[Dict[str, Any]]:
+        """Reenviar un update ya enviado (como los reintentos de Telegram)"""
+        return self.random.choice(self.sent) if self.sent else None
+
+async def send_update(client: httpx.AsyncClient, url: str, update: Dict[str, Any], duplicate: bool) -> Dict[str, Any]:
+    record = {"update_id": update["update_id"], "chat_id": update["message"]["chat"]["id"],
+              "duplicate": duplicate, "sent": time.time()}
+    start = time.perf_counter()
+    try:
+        response = await client.post(url, json=update)
+        record["status"] = response.status_code
+        record["result"] = response.json().get("status") if response.status_code in (200, 503) else "http_error"
+    except Exception as e:
+        record["status"] = None
+        record["result"] = f"exception:{type(e).__name__}"
+    record["ack_ms"] = (time.perf_counter() - start) * 1000
+    return record
+
+async def run_load(client: httpx.AsyncClient, url: str, factory: UpdateFactory, rate_per_s: float,
+                   duration: float, arrival: str, duplicates: float) -> Tuple[List[Dict[str, Any]], float]:
+    """Lazo abierto: los envíos salen a su hora aunque la app tarde en responder"""
+    loop = asyncio.get_running_loop()
+    tasks = []
+    start = loop.time()
+    offset, max_lag = 0.0, 0.0
+    while offset < duration:
+        delay = start + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        max_lag = max(max_lag, -delay)
+        update = factory.duplicate() if factory.sent and factory.random.random() < duplicates else None
+        is_duplicate = update is not None
+        tasks.append(asyncio.create_task(send_update(client, url, update or factory.new(), is_duplicate)))
+        offset += factory.random.expovariate(rate_per_s) if arrival == "poisson" else 1.0 / rate_per_s
+    return list(await asyncio.gather(*tasks)), max_lag * 1000
+
+async def wait_drain(client: httpx.AsyncClient, base_url: str, processed_before: int, accepted: int,
+                     timeout: float) -> bool:
+    """Esperar a que la cola de la app procese todos los updates aceptados"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        queue = (await client.get(f"{base_url}/health")).json().get("queue", {})
+        done = queue.get("processed", 0) + queue.get("failed", 0) - processed_before
+        if done >= accepted and queue.get("queued", 0) == 0:
+            return True
+        await asyncio.sleep(0.25)
+    return False
+
+# ===== INFORME =====
+
+def build_report(config: Dict[str, Any], records: List[Dict[str, Any]], calls: List[Dict[str, Any]],
+                 before: Samples, after: Samples, telegram_stats: Dict[str, int], groq_stats: Dict[str, int],
+                 elapsed: float, send_lag_ms: float, drained: bool) -> Dict[str, Any]:
+    originals = [r for r in records if not r["duplicate"]]
+    accepted = [r for r in originals if r["result"] == "queued"]
+    results = defaultdict(int)
+    for r in records:
+        results[r["result"]] += 1
+
+    first_reply: Dict[Any, float] = {}
+    last_reply: Dict[Any, float] = {}
+    for call in calls:
+        if call["method"] not in REPLY_METHODS or not call["ok"]:
+            continue
+        chat = call["chat_id"]
+        if call["method"] == "sendMessage":
+            first_reply[chat] = min(first_reply.get(chat, call["t"]), call["t"])
+        last_reply[chat] = max(last_reply.get(chat, call["t"]), call["t"])
+
+    first_ms, complete_ms, completed_at = [], [], []
+    for r in accepted:
+        if r["chat_id"] in first_reply:
+            first_ms.append((first_reply[r["chat_id"]] - r["sent"]) * 1000)
+        if r["chat_id"] in last_reply:
+            complete_ms.append((last_reply[r["chat_id"]] - r["sent"]) * 1000)
+            completed_at.append(last_reply[r["chat_id"]])
+    undelivered = len(accepted) - len(complete_ms)
+    window = (max(completed_at) - min(r["sent"] for r in accepted)) if completed_at else 0.0
+
+    stages = {}
+    for stage, entry in sorted(histogram_deltas(before, after, "tomi_stage_seconds", "stage").items()):
+        quantile = {q: histogram_quantile(q, entry["buckets"]) for q in (0.5, 0.95, 0.99)}
+        stages[stage] = {
+            "count": int(entry["count"]),
+            "mean_ms": round(entry["sum"] / entry["count"] * 1000, 1),
+            **{f"p{int(q * 100)}_ms": round(v * 1000, 1) if v is not None else None for q, v in quantile.items()}
+        }
+
+    outcomes = {outcome: int(entry["count"]) for outcome, entry in
+                histogram_deltas(before, after, "tomi_update_seconds", "outcome").items()}
+    llm_attempts = defaultdict(int)
+    for labels, value in _delta(before, after, "tomi_llm_attempt_seconds_count").items():
+        llm_attempts[dict(labels).get("outcome", "")] += int(value)
+    llm_failed_attempts = sum(n for outcome, n in llm_attempts.items() if outcome != "200")
+    llm_errors = int(counter_delta(before, after, "tomi_llm_errors_total"))
+    webhook_errors = sum(n for result, n in results.items() if result not in ("queued", "duplicated", "busy"))
+
+    failures = webhook_errors + results.get("busy", 0) + undelivered + llm_errors
+    return {
+        "config": config,
+        "load": {
+            "duration_s": round(elapsed, 2),
+            "sent": len(records),
+            "sent_unique": len(originals),
+            "offered_rate": config["rate"],
+            "achieved_rate": round(len(records) / elapsed, 2) if elapsed else 0.0,
+            "max_send_lag_ms": round(send_lag_ms, 1),
+            "results": dict(results),
+            "drained": drained
+        },
+        "throughput": {
+            "completed": len(complete_ms),
+            "updates_per_s": round(len(complete_ms) / window, 2) if window else 0.0,
+            "llm_tokens": {kind: int(v) for kind, v in
+                           ((dict(labels).get("kind", ""), v) for labels, v in
+                            _delta(before, after, "tomi_llm_tokens_total").items())}
+        },
+        "latency": {
+            "webhook_ack": summarize([r["ack_ms"] for r in records]),
+            "first_message": summarize(first_ms),
+            "complete_reply": summarize(complete_ms)
+        },
+        "stages": stages,
+        "errors": {
+            "webhook_error_rate": rate(webhook_errors, len(records)),
+            "busy_rate": rate(results.get("busy", 0), len(originals)),
+            "duplicates_detected": results.get("duplicated", 0),
+            "duplicates_sent": len(records) - len(originals),
+            "queue_failed": int(counter_delta(before, after, "tomi_queue_failed_total")),
+            "update_outcomes": outcomes,
+            "llm_attempts": dict(llm_attempts),
+            "llm_attempt_error_rate": rate(llm_failed_attempts, sum(llm_attempts.values())),
+            "llm_retries": int(counter_delta(before, after, "tomi_llm_retries_total")),
+            "llm_fallbacks": int(counter_delta(before, after, "tomi_llm_fallbacks_total")),
+            "llm_errors": llm_errors,
+            "telegram_error_rate": rate(telegram_stats.get("errors", 0), telegram_stats.get("requests", 0)),
+            "groq_stub": groq_stats,
+            "undelivered": undelivered,
+            "failure_rate": rate(failures, len(originals))
+        }
+    }
+
+def _fmt(value: Optional[float]) -> str:
+    return f"{value:9.1f}" if value is not None else "        -"
+
+def print_report(report: Dict[str, Any]):
+    load, errors = report["load"], report["errors"]
+    print(f"\n📊 Carga: {load['sent']} updates en {load['duration_s']} s "
+          f"({load['achieved_rate']}/s de {load['offered_rate']}/s), resultados {load['results']}")
+    if load["max_send_lag_ms"] > 50:
+        print(f"⚠️ El generador se retrasó hasta {load['max_send_lag_ms']} ms: el ritmo ofrecido no es fiable")
+    if not load["drained"]:
+        print("⚠️ La cola no terminó de vaciarse: hay updates sin medir")
+    print(f"🚀 Throughput: {report['throughput']['updates_per_s']} respuestas/s "
+          f"({report['throughput']['completed']} completas), tokens {report['throughput']['llm_tokens']}")
+
+    header = f"{'':24}{'n':>7}{'media':>9}{'p50':>9}{'p95':>9}{'p99':>9}"
+    print(f"\n⏱️ Latencia de punta a punta (ms)\n{header}")
+    for name, row in report["latency"].items():
+        print(f"{name:24}{row['count']:7d}{_fmt(row['mean_ms'])}{_fmt(row['p50_ms'])}"
+              f"{_fmt(row['p95_ms'])}{_fmt(row['p99_ms'])}")
+
+    print(f"\n🔬 Etapas en la app (ms, percentiles aproximados por buckets)\n{header}")
+    for name, row in report["stages"].items():
+        print(f"{name:24}{row['count']:7d}{_fmt(row['mean_ms'])}{_fmt(row['p50_ms'])}"
+              f"{_fmt(row['p95_ms'])}{_fmt(row['p99_ms'])}")
+
+    print(f"\n❌ Errores: fallos {errors['failure_rate']:.2%} · webhook {errors['webhook_error_rate']:.2%} · "
+          f"503 {errors['busy_rate']:.2%} · sin respuesta {errors['undelivered']} · "
+          f"LLM intentos {errors['llm_attempt_error_rate']:.2%} (reintentos {errors['llm_retries']}, "
+          f"respaldo {errors['llm_fallbacks']}, fallidas {errors['llm_errors']}) · "
+          f"Telegram {errors['telegram_error_rate']:.2%}")
+    print(f"   Duplicados detectados {errors['duplicates_detected']}/{errors['duplicates_sent']} · "
+          f"updates {errors['update_outcomes']} · LLM {errors['llm_attempts']}")
+
+def check_gates(report: Dict[str, Any], max_p95_ms: Optional[float], max_p99_ms: Optional[float],
+                max_error_rate: Optional[float]) -> List[str]:
+    """Umbrales superados (lista vacía = OK)"""
+    failed = []
+    latency = report["latency"]["complete_reply"]
+    for name, limit in (("p95_ms", max_p95_ms), ("p99_ms", max_p99_ms)):
+        if limit is not None and (latency[name] is None or latency[name] > limit):
+            failed.append(f"complete_reply {name} = {latency[name]} > {limit}")
+    if max_error_rate is not None and report["errors"]["failure_rate"] > max_error_rate:
+        failed.append(f"failure_rate = {report['errors']['failure_rate']} > {max_error_rate}")
+    if not report["load"]["drained"]:
+        failed.append("la cola no se vació a tiempo")
+    return failed
+
+# ===== ORQUESTACIÓN =====
+
+def _app_env(args, groq_port: int, telegram_port: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        # Todo apunta a los stubs locales (ni Groq ni Telegram reales)
+        "GROQ_API_URL": f"http://127.0.0.1:{groq_port}/openai/v1/chat/completions",
+        "GROQ_API_KEY": "bench",
+        "LLM_FALLBACK_MODEL": "",
+        "LLM_FALLBACK_API_URL": "",
+        "TELEGRAM_API_BASE": f"http://127.0.0.1:{telegram_port}",
+        "TELEGRAM_TOKEN": "bench",
+        "TELEGRAM_STREAM": "1" if args.stream else "0",
+        "WEBHOOK_URL": "https://tu-app.railway.app",
+        "RAG_WARMUP": "1",
+        "METRICS_LOG_TRACES": "1" if args.traces else "0",
+        "PYTHONUNBUFFERED": "1"
+    })
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+async def run(args) -> Dict[str, Any]:
+    groq_port, telegram_port, app_port = free_port(), free_port(), free_port()
+    log_dir = args.log_dir or tempfile.mkdtemp(prefix="tomi-bench-")
+    os.makedirs(log_dir, exist_ok=True)
+    base_url = f"http://127.0.0.1:{app_port}"
+    stubs = app = None
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30.0), limits=limits) as client:
+        try:
+            stubs = start_process(
+                ["benchmarks.stubs", "--groq-port", str(groq_port), "--telegram-port", str(telegram_port),
+                 "--groq-latency-ms", str(args.groq_latency_ms), "--groq-jitter-ms", str(args.groq_jitter_ms),
+                 "--groq-token-ms", str(args.groq_token_ms), "--groq-tokens", str(args.groq_tokens),
+                 "--groq-error-rate", str(args.groq_error_rate), "--groq-429-rate", str(args.groq_429_rate),
+                 "--telegram-latency-ms", str(args.telegram_latency_ms),
+                 "--telegram-error-rate", str(args.telegram_error_rate)]
+                + (["--seed", str(args.seed)] if args.seed is not None else []),
+                dict(os.environ), os.path.join(log_dir, "stubs.log"), REPO_DIR)
+            app = start_process(["benchmarks.serve_app", "--port", str(app_port)],
+                                _app_env(args, groq_port, telegram_port), os.path.join(log_dir, "app.log"),
+                                args.workdir)
+            await wait_ready(client, f"http://127.0.0.1:{telegram_port}/_stats", stubs, 30)
+            await wait_ready(client, f"http://127.0.0.1:{groq_port}/_stats", stubs, 30)
+            print(f"⏳ Arrancando la app (logs en {log_dir})...")
+            await wait_ready(client, f"{base_url}/health", app, args.startup_timeout)
+
+            calls_before = len((await client.get(f"http://127.0.0.1:{telegram_port}/_calls")).json())
+            telegram_before = (await client.get(f"http://127.0.0.1:{telegram_port}/_stats")).json()
+            groq_before = (await client.get(f"http://127.0.0.1:{groq_port}/_stats")).json()
+            metrics_before = parse_metrics((await client.get(f"{base_url}/metrics")).text)
+            processed_before = (await client.get(f"{base_url}/health")).json()["queue"]["processed"]
+
+            print(f"🔥 {args.rate} updates/s durante {args.duration} s ({args.arrival})")
+            factory = UpdateFactory(args.repeat, args.seed)
+            started = time.monotonic()
+            records, send_lag_ms = await run_load(client, f"{base_url}/webhook", factory, args.rate,
+                                                  args.duration, args.arrival, args.duplicates)
+            elapsed = time.monotonic() - started
+            accepted = sum(1 for r in records if r["result"] == "queued")
+            drained = await wait_drain(client, base_url, processed_before, accepted, args.drain_timeout)
+
+            calls = (await client.get(f"http://127.0.0.1:{telegram_port}/_calls",
+                                      params={"since": calls_before})).json()
+            telegram_after = (await client.get(f"http://127.0.0.1:{telegram_port}/_stats")).json()
+            groq_after = (await client.get(f"http://127.0.0.1:{groq_port}/_stats")).json()
+            metrics_after = parse_metrics((await client.get(f"{base_url}/metrics")).text)
+        finally:
+            stop_process(app)
+            stop_process(stubs)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("json", "log_dir")}
+    return build_report(
+        config, records, calls, metrics_before, metrics_after,
+        {key: telegram_after[key] - telegram_before.get(key, 0) for key in telegram_after},
+        {key: groq_after[key] - groq_before.get(key, 0) for key in groq_after},
+        elapsed, send_lag_ms, drained)
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga de TOmi contra Groq y Telegram simulados")
+    load = parser.add_argument_group("carga")
+    load.add_argument("--rate", type=float, default=10, help="updates por segundo")
+    load.add_argument("--duration", type=float, default=30, help="segundos de carga")
+    load.add_argument("--arrival", choices=("constant", "poisson"), default="poisson")
+    load.add_argument("--repeat", type=float, default=0.0, help="fracción de preguntas repetidas (caché)")
+    load.add_argument("--duplicates", type=float, default=0.0, help="fracción de updates reenviados")
+    load.add_argument("--seed", type=int, default=None)
+    stubs = parser.add_argument_group("stubs")
+    stubs.add_argument("--groq-latency-ms", type=float, default=300, help="latencia hasta el primer token")
+    stubs.add_argument("--groq-jitter-ms", type=float, default=100)
+    stubs.add_argument("--groq-token-ms", type=float, default=15)
+    stubs.add_argument("--groq-tokens", type=int, default=60)
+    stubs.add_argument("--groq-error-rate", type=float, default=0.0)
+    stubs.add_argument("--groq-429-rate", type=float, default=0.0)
+    stubs.add_argument("--telegram-latency-ms", type=float, default=30)
+    stubs.add_argument("--telegram-error-rate", type=float, default=0.0)
+    app = parser.add_argument_group("app")
+    app.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True,
+                     help="respuestas en streaming (TELEGRAM_STREAM)")
+    app.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                     help="variable de entorno extra para la app (repetible)")
+    app.add_argument("--workdir", default=REPO_DIR, help="directorio de trabajo de la app (data/, templates/)")
+    app.add_argument("--traces", action="store_true", help="log JSON por update en app.log")
+    app.add_argument("--startup-timeout", type=float, default=180)
+    app.add_argument("--drain-timeout", type=float, default=120)
+    app.add_argument("--log-dir", default=None, help="logs de la app y los stubs (por defecto, temporal)")
+    out = parser.add_argument_group("salida")
+    out.add_argument("--json", default=None, help="guardar el informe en JSON ('-' = stdout)")
+    out.add_argument("--max-p95-ms", type=float, default=None, help="umbral de p95 de la respuesta completa")
+    out.add_argument("--max-p99-ms", type=float, default=None)
+    out.add_argument("--max-error-rate", type=float, default=None, help="umbral de la tasa de fallos")
+    args = parser.parse_args(argv)
+    if args.rate <= 0 or args.duration <= 0:
+        parser.error("--rate y --duration deben ser positivos")
+
+    report = asyncio.run(run(args))
+    if args.json == "-":
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+            print(f"💾 Informe guardado en {args.json}")
+
+    failed = check_gates(report, args.max_p95_ms, args.max_p99_ms, args.max_error_rate)
+    for reason in failed:
+        print(f"🚫 Umbral superado: {reason}", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,546 @@
+"""Benchmark de recuperación: ingesta, persistencia, búsqueda, memoria y recall por tamaño de corpus
+
+    python -m benchmarks.retrieval --sizes 1000,10000,100000 --json retrieval.json
+    python -m benchmarks.retrieval --sizes 1000000 --configs ivf:float32,ivf:int8,ivfpq:pq --nprobe 8,16,64
+    python -m benchmarks.retrieval --embeddings synthetic,onnx-int8 --sizes 1000,10000
+
+Por cada embedding y tamaño se crea una base nueva (RAGSystem real, en un directorio
+temporal) y se mide:
+
+- ingesta con _add_chunks (un documento cada --doc-chunks chunks) y compactación
+- save_database, load_database en un proceso "frío" (RSS) y bytes en disco
+- búsqueda completa (search_scored: embedding + híbrida + MMR) con el índice que el
+  sistema elige solo, y hit@k sobre las consultas etiquetadas
+- por cada configuración de índice (tipo:almacenamiento, nprobe, efSearch): tiempo de
+  construcción, bytes por chunk, latencia por consulta, consultas/s en lote y recall@k
+  frente a la búsqueda exacta (flat float32), con y sin re-ranking
+
+El corpus sintético es determinista (--seed) y los tamaños menores son prefijos de los
+mayores. Con embeddings "synthetic" (bolsa de palabras con proyección aleatoria) se
+llega a 1M de chunks sin modelo; con torch/onnx/onnx-int8 se mide el modelo real.
+También se puede usar un corpus propio (--corpus, JSONL {"text", "document"}) con
+consultas etiquetadas (--queries-file, JSONL {"query", "relevant": [nº de línea del corpus]}).
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+import faiss
+import numpy as np
+from utils.embedders import Embedder, get_embedder
+from utils.rag_system import RAGSystem
+from utils.vector_index import INDEX_TYPES, STORAGE_MODES, choose_index_type, choose_storage, index_nbytes, \
+    search_params
+
+DEFAULT_CONFIGS = "flat:float32,flat:int8,ivf:float32,ivf:int8,hnsw:float32,ivfpq:pq"
+
+# ===== CORPUS SINTÉTICO =====
+
+_SYLLABLES = ("ba", "ca", "de", "di", "fo", "ga", "gu", "je", "ki", "la", "le", "lo", "ma", "me", "mi", "na",
+              "ne", "no", "pa", "pe", "po", "qui", "ra", "re", "ri", "ro", "sa", "se", "si", "so", "ta", "te",
+              "ti", "to", "tu", "va", "ve", "vi", "za", "zo")
+
+class SyntheticCorpus:
+    """Chunks deterministas de pseudo-palabras con estructura de temas
+
+    Cada chunk mezcla palabras del tema de su sección (chunks consecutivos comparten
+    tema, como en un manual) con palabras generales de frecuencia Zipf; uno de cada
+    CODE_EVERY lleva un código de producto. Se genera por bloques con acceso aleatorio.
+    """
+
+    BLOCK = 4096
+    TOPIC_CHUNKS = 50     # chunks consecutivos con el mismo tema
+    TOPIC_WORDS = 25      # vocabulario propio de cada tema
+    WORDS_TOPIC = 24      # palabras de tema por chunk
+    WORDS_GENERAL = 16    # palabras generales por chunk
+    CODE_EVERY = 5
+
+    def __init__(self, seed: int = 0, vocab_size: int = 20000):
+        self.seed = seed
+        rng = np.random.default_rng([seed, 0])
+        words = set()
+        while len(words) < vocab_size:
+            n = int(rng.integers(2, 4))
+            words.add("".join(_SYLLABLES[i] for i in rng.integers(0, len(_SYLLABLES), n)))
+        self.vocab = np.array(sorted(words), dtype=object)
+        rng.shuffle(self.vocab)  # rango Zipf -> palabra
+
+    def _topic_words(self, topic: int) -> np.ndarray:
+        return np.random.default_rng([self.seed, 1, topic]).integers(0, len(self.vocab), self.TOPIC_WORDS)
+
+    def _block(self, block: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(palabras de tema, rangos de palabras generales, tiene código) de un bloque"""
+        rng = np.random.default_rng([self.seed, 2, block])
+        first = block * self.BLOCK
+        topics, rows = np.unique((first + np.arange(self.BLOCK)) // self.TOPIC_CHUNKS, return_inverse=True)
+        table = np.stack([self._topic_words(int(t)) for t in topics])
+        picks = rng.integers(0, self.TOPIC_WORDS, (self.BLOCK, self.WORDS_TOPIC))
+        topic = table[rows[:, None], picks]
+        general = np.minimum(rng.zipf(1.3, (self.BLOCK, self.WORDS_GENERAL)) - 1, len(self.vocab) - 1)
+        codes = rng.random(self.BLOCK) < 1 / self.CODE_EVERY
+        return topic, general, codes
+
+    @staticmethod
+    def _code(chunk_id: int) -> str:
+        return f"XR-{(chunk_id // SyntheticCorpus.TOPIC_CHUNKS) % 10000:04d}"
+
+    def texts(self, start: int, stop: int) -> List[str]:
+        texts = []
+        for block in range(start // self.BLOCK, (stop - 1) // self.BLOCK + 1 if stop > start else 0):
+            topic, general, codes = self._block(block)
+            rng = np.random.default_rng([self.seed, 3, block])
+            words = rng.permuted(np.hstack([topic, general]), axis=1)
+            first = block * self.BLOCK
+            for row in range(max(start, first) - first, min(stop, first + self.BLOCK) - first):
+                text = " ".join(self.vocab[words[row]])
+                texts.append(f"{self._code(first + row)} {text}" if codes[row] else text)
+        return texts
+
+    def documents(self, size: int, doc_chunks: int) -> Iterator[Tuple[str, int, int]]:
+        return _fixed_documents(size, doc_chunks)
+
+    def queries(self, size: int, n: int) -> List[Dict[str, Any]]:
+        """Consultas etiquetadas: palabras del tema + las más raras del chunk de origen"""
+        rng = np.random.default_rng([self.seed, 4, size])
+        chunk_ids = np.sort(rng.choice(size, size=min(n, size), replace=False))
+        queries = []
+        for chunk_id in chunk_ids.tolist():
+            topic, general, codes = self._block(chunk_id // self.BLOCK)
+            row = chunk_id % self.BLOCK
+            topic_words = np.unique(topic[row])
+            words = list(rng.choice(topic_words, size=min(4, len(topic_words)), replace=False))
+            words += [int(w) for w in np.unique(general[row])[-4:]]
+            text = " ".join(self.vocab[rng.permutation(np.array(words))])
+            if codes[row]:
+                text = f"{self._code(chunk_id)} {text}"
+            queries.append({"query": text, "relevant": [chunk_id]})
+        return queries
+
+class FileCorpus:
+    """Corpus propio en JSONL: {"text": ..., "document": ...} por línea (el id es el nº de línea)"""
+
+    def __init__(self, path: str, queries_path: Optional[str] = None):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        self._texts = [row["text"] for row in rows]
+        self._documents = [row.get("document") for row in rows]
+        self._queries = []
+        if queries_path:
+            with open(queries_path, "r", encoding="utf-8") as f:
+                self._queries = [json.loads(line) for line in f if line.strip()]
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def texts(self, start: int, stop: int) -> List[str]:
+        return self._texts[start:stop]
+
+    def documents(self, size: int, doc_chunks: int) -> Iterator[Tuple[str, int, int]]:
+        if all(document is None for document in self._documents[:size]):
+            yield from _fixed_documents(size, doc_chunks)
+            return
+        # Documentos contiguos del archivo (los ids de un documento son consecutivos)
+        start = 0
+        for i in range(1, size + 1):
+            if i == size or self._documents[i] != self._documents[start]:
+                yield str(self._documents[start]), start, i
+                start = i
+
+    def queries(self, size: int, n: int) -> List[Dict[str, Any]]:
+        queries = []
+        for query in self._queries:
+            relevant = [chunk_id for chunk_id in query.get("relevant", []) if chunk_id < size]
+            if relevant:
+                queries.append({"query": query["query"], "relevant": relevant})
+        return queries[:n]
+
+def _fixed_documents(size: int, doc_chunks: int) -> Iterator[Tuple[str, int, int]]:
+    for number, start in enumerate(range(0, size, doc_chunks)):
+        yield f"doc-{number:05d}", start, min(size, start + doc_chunks)
+
+# ===== EMBEDDINGS SINTÉTICOS =====
+
+class SyntheticEmbedder(Embedder):
+    """Suma de vectores aleatorios por palabra (hashing): rápido, determinista y sin modelo
+
+    Chunks que comparten palabras quedan cerca, así que el índice ve una distribución
+    con estructura (temas) en lugar de ruido uniforme.
+    """
+
+    backend = "synthetic"
+
+    def __init__(self, dim: int = 384, buckets: int = 1 << 15, seed: int = 0):
+        super().__init__(f"synthetic-{dim}")
+        self.buckets = buckets
+        self.table = np.random.default_rng([seed, 5]).standard_normal((buckets, dim), dtype=np.float32)
+
+    @property
+    def tokenizer(self):
+        return None
+
+    @property
+    def tokenizer_name(self) -> Optional[str]:
+        return None
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        rows, offsets = [], []
+        for text in texts:
+            offsets.append(len(rows))
+            rows.extend(zlib.crc32(token.encode("utf-8")) % self.buckets for token in (text.lower().split() or [""]))
+        return np.add.reduceat(self.table[np.asarray(rows)], np.asarray(offsets), axis=0)
+
+def create_benchmark_embedder(name: str, model_name: str, dim: int, seed: int) -> Embedder:
+    if name == "synthetic":
+        return SyntheticEmbedder(dim, seed=seed)
+    return get_embedder(model_name, name)
+
+# ===== MEDIDAS =====
+
+def rss_bytes() -> int:
+    """Memoria residente actual del proceso (Linux); pico si no hay /proc"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def disk_bytes(path: str, exclude: Sequence[str] = ()) -> int:
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [name for name in dirs if name not in exclude]
+        for name in files:
+            with contextlib.suppress(OSError):
+                total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, Optional[float]]:
+    if not seconds:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3)
+    }
+
+def recall_at_k(found: Sequence[Sequence[int]], expected: Sequence[Sequence[int]], k: int) -> Optional[float]:
+    values = [len(set(f[:k]) & set(e[:k])) / len(e[:k]) for f, e in zip(found, expected) if len(e)]
+    return round(float(np.mean(values)), 4) if values else None
+
+def hit_at_k(found: Sequence[Sequence[int]], queries: Sequence[Dict[str, Any]], k: int) -> Optional[float]:
+    """Fracción de consultas etiquetadas con algún chunk relevante en el top-k"""
+    values = [bool(set(f[:k]) & set(q["relevant"])) for f, q in zip(found, queries)]
+    return round(float(np.mean(values)), 4) if values else None
+
+@contextlib.contextmanager
+def quiet(enabled: bool):
+    """Silenciar los logs del RAG (también los del hilo de compactación)"""
+    if not enabled:
+        yield
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def settle(rag: RAGSystem) -> float:
+    """Esperar la compactación en segundo plano (y completarla) hasta tener el snapshot final"""
+    start = time.perf_counter()
+    while True:
+        thread = rag._compaction_thread
+        if thread is not None:
+            thread.join()
+        if not rag._needs_compaction():
+            return time.perf_counter() - start
+        rag._compact()
+
+def _search(index, queries: np.ndarray, k: int, nprobe: int, ef_search: int) -> List[List[int]]:
+    _, I = index.search(queries, min(k, index.ntotal), params=search_params(index, nprobe, ef_search))
+    return [[int(i) for i in row if i >= 0] for row in I]
+
+def benchmark_index(rag: RAGSystem, kind: str, storage: str, queries: np.ndarray, labeled: List[Dict[str, Any]],
+                    exact: List[List[int]], k: int, nprobes: Sequence[int], ef_searches: Sequence[int],
+                    index=None) -> List[Dict[str, Any]]:
+    """Construir un índice (tipo, almacenamiento) y medirlo con cada nprobe / efSearch"""
+    n_live = len(rag.chunks)
+    build_s = 0.0
+    if index is None:
+        start = time.perf_counter()
+        index = rag._build_index(list(rag.segments), set(rag.deleted_ids), kind, storage)
+        build_s = time.perf_counter() - start
+    nbytes = index_nbytes(index)
+
+    if kind in ("ivf", "ivfpq"):
+        sweeps = [("nprobe", value) for value in nprobes]
+    elif kind == "hnsw":
+        sweeps = [("ef_search", value) for value in ef_searches]
+    else:
+        sweeps = [(None, None)]
+
+    rows = []
+    for param, value in sweeps:
+        nprobe = value if param == "nprobe" else rag.nprobe
+        ef_search = value if param == "ef_search" else rag.ef_search
+
+        single = []
+        found = []
+        for query in queries:
+            start = time.perf_counter()
+            found.extend(_search(index, query.reshape(1, -1), k, nprobe, ef_search))
+            single.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _search(index, queries, k, nprobe, ef_search)
+        batch_s = time.perf_counter() - start
+
+        row = {
+            "type": kind,
+            "storage": storage,
+            "nprobe": nprobe if param == "nprobe" else None,
+            "ef_search": ef_search if param == "ef_search" else None,
+            "build_s": round(build_s, 3),
+            "index_bytes": nbytes,
+            "bytes_per_chunk": round(nbytes / max(n_live, 1), 1),
+            "search": latency_summary(single),
+            "batch_qps": round(len(queries) / batch_s, 1) if batch_s > 0 else None,
+            f"recall@{k}": recall_at_k(found, exact, k),
+            f"hit@{k}": hit_at_k(found, labeled, k)
+        }
+        if storage != "float32":
+            # Como en producción: rerank_factor·k candidatos re-ordenados con los vectores exactos
+            candidates = _search(index, queries, k * rag.rerank_factor, nprobe, ef_search)
+            reranked = [rag._rerank(query, hits, k) for query, hits in zip(queries, candidates)]
+            row[f"recall@{k}_rerank"] = recall_at_k(reranked, exact, k)
+            row[f"hit@{k}_rerank"] = hit_at_k(reranked, labeled, k)
+        rows.append(row)
+    del index
+    return rows
+
+def benchmark_size(corpus, size: int, embedder: Embedder, args, workdir: str) -> Dict[str, Any]:
+    k = args.k
+    db_path = os.path.join(workdir, f"{embedder.backend}-{size}")
+    shutil.rmtree(db_path, ignore_errors=True)
+    labeled = corpus.queries(size, args.queries)
+    documents = corpus.documents(size, args.doc_chunks)
+    result: Dict[str, Any] = {"embedding": embedder.backend, "chunks": size, "queries": len(labeled)}
+
+    # Ingesta: documento a documento, como las subidas del dashboard
+    gc.collect()
+    rss_start = rss_bytes()
+    rag = RAGSystem(args.model, index_type=args.index_type, vector_storage=args.vector_storage,
+                    db_path=db_path, embedder=embedder)
+    per_document = []
+    with quiet(not args.verbose):
+        for name, start, stop in documents:
+            texts = corpus.texts(start, stop)
+            t0 = time.perf_counter()
+            rag._add_chunks(texts, name)
+            per_document.append(time.perf_counter() - t0)
+        ingest_s = sum(per_document)
+        compaction_s = settle(rag)
+        t0 = time.perf_counter()
+        rag.save_database()
+        save_s = time.perf_counter() - t0
+    result["ingest"] = {
+        "documents": len(per_document),
+        "chunks_indexed": len(rag.chunks),
+        "seconds": round(ingest_s, 3),
+        "chunks_per_s": round(size / ingest_s, 1) if ingest_s else None,
+        "add_chunks": latency_summary(per_document),
+        "compaction_s": round(compaction_s, 3),
+        "snapshot": {"type": rag.snapshot.get("type"), "storage": rag.snapshot.get("storage")}
+    }
+    if len(rag.chunks) != size:
+        print(f"⚠️ Se indexaron {len(rag.chunks)} de {size} chunks")
+    rss_ingested = rss_bytes() - rss_start
+    chunk_table_bytes = rag.chunks.nbytes
+    del rag
+    gc.collect()
+
+    # Carga en frío desde disco (mmap de segmentos y snapshot)
+    rss_before_load = rss_bytes()
+    t0 = time.perf_counter()
+    with quiet(not args.verbose):
+        rag = RAGSystem(args.model, index_type=args.index_type, vector_storage=args.vector_storage,
+                        db_path=db_path, embedder=embedder)
+        rag.load_database()
+    load_s = time.perf_counter() - t0
+    # La caché de embeddings se reserva entera al crearla: se cuenta aparte
+    result["persistence"] = {"save_s": round(save_s, 4), "load_s": round(load_s, 3),
+                             "disk_bytes": disk_bytes(db_path, exclude=("embedding_cache",)),
+                             "embedding_cache_bytes": disk_bytes(os.path.join(db_path, "embedding_cache"))}
+
+    # Búsqueda completa tal como la usa el bot (sin umbral: se mide el ranking)
+    texts = [query["query"] for query in labeled]
+    found, latencies = [], []
+    with quiet(not args.verbose):
+        if texts:
+            t0 = time.perf_counter()
+            rag.search_scored(texts[0], k, min_score=-1.0)
+            result["first_search_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        for text in texts:
+            t0 = time.perf_counter()
+            hits = rag.search_scored(text, k, min_score=-1.0)
+            latencies.append(time.perf_counter() - t0)
+            found.append([hit.chunk_id for hit in hits])
+    result["search_scored"] = {**latency_summary(latencies), f"hit@{k}": hit_at_k(found, labeled, k)}
+
+    result["memory"] = {
+        "rss_ingest_bytes_per_chunk": round(rss_ingested / size, 1),
+        "rss_loaded_bytes_per_chunk": round((rss_bytes() - rss_before_load) / size, 1),
+        "disk_bytes_per_chunk": round(result["persistence"]["disk_bytes"] / size, 1),
+        "chunk_table_bytes_per_chunk": round(chunk_table_bytes / size, 1)
+    }
+
+    # Configuraciones de índice frente a la búsqueda exacta (flat float32)
+    configs = []
+    if texts and not args.skip_configs:
+        queries = rag._encode_queries(texts)
+        with quiet(not args.verbose):
+            exact_index = rag._build_index(list(rag.segments), set(rag.deleted_ids), "flat", "float32")
+        exact = _search(exact_index, queries, k, rag.nprobe, rag.ef_search)
+        done = set()
+        for spec in args.configs:
+            kind, _, storage = spec.partition(":")
+            kind = choose_index_type(size, kind)
+            storage = choose_storage(size, kind, storage or "float32")
+            if (kind, storage) in done:
+                continue
+            done.add((kind, storage))
+            with quiet(not args.verbose):
+                configs += benchmark_index(rag, kind, storage, queries, labeled, exact, k, args.nprobe,
+                                           args.ef_search, exact_index if (kind, storage) == ("flat", "float32") else None)
+        del exact_index
+    result["indexes"] = configs
+
+    del rag
+    gc.collect()
+    if not args.keep:
+        shutil.rmtree(db_path, ignore_errors=True)
+    return result
+
+# ===== INFORME =====
+
+def print_result(result: Dict[str, Any], k: int):
+    ingest, persistence, memory = result["ingest"], result["persistence"], result["memory"]
+    search = result["search_scored"]
+    print(f"\n📊 {result['chunks']:,} chunks · embeddings {result['embedding']} · {result['queries']} consultas")
+    print(f"   Ingesta: {ingest['seconds']} s ({ingest['chunks_per_s']} chunks/s, {ingest['documents']} documentos, "
+          f"p95 por documento {ingest['add_chunks']['p95_ms']} ms), compactación {ingest['compaction_s']} s "
+          f"→ {ingest['snapshot']['type']}/{ingest['snapshot']['storage']}")
+    print(f"   Persistencia: save {persistence['save_s']} s, load {persistence['load_s']} s, "
+          f"disco {memory['disk_bytes_per_chunk']} B/chunk, RSS cargado {memory['rss_loaded_bytes_per_chunk']} B/chunk")
+    print(f"   search_scored: p50 {search['p50_ms']} ms, p95 {search['p95_ms']} ms, p99 {search['p99_ms']} ms, "
+          f"hit@{k} {search[f'hit@{k}']}")
+    if not result["indexes"]:
+        return
+    print(f"   {'índice':<18}{'param':>8}{'build s':>9}{'B/chunk':>9}{'p50 ms':>9}{'p99 ms':>9}{'qps':>10}"
+          f"{'recall':>8}{'+rerank':>8}{'hit':>7}")
+    for row in result["indexes"]:
+        param = row["nprobe"] if row["nprobe"] is not None else row["ef_search"]
+        param = "auto" if row["nprobe"] == 0 else param
+        rerank = row.get(f"recall@{k}_rerank")
+        print(f"   {row['type'] + '/' + row['storage']:<18}{param if param is not None else '-':>8}"
+              f"{row['build_s']:>9}{row['bytes_per_chunk']:>9}{row['search']['p50_ms']:>9}"
+              f"{row['search']['p99_ms']:>9}{row['batch_qps'] or 0:>10}{row[f'recall@{k}']:>8}"
+              f"{rerank if rerank is not None else '-':>8}{row[f'hit@{k}']:>7}")
+
+def _int_list(value: str) -> List[int]:
+    return [int(float(item)) for item in value.split(",") if item.strip()]
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de recuperación de TOmi por tamaño de corpus")
+    parser.add_argument("--sizes", type=_int_list, default=_int_list("1000,10000,100000"),
+                        help="chunks por corpus, separados por comas (hasta 1000000)")
+    parser.add_argument("--embeddings", default="synthetic",
+                        help="synthetic y/o backends del modelo (torch, onnx, onnx-int8), separados por comas")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--dim", type=int, default=384, help="dimensión de los embeddings sintéticos")
+    parser.add_argument("--corpus", default=None, help="corpus propio en JSONL en lugar del sintético")
+    parser.add_argument("--queries-file", default=None, help="consultas etiquetadas para --corpus (JSONL)")
+    parser.add_argument("--queries", type=int, default=200, help="consultas etiquetadas por tamaño")
+    parser.add_argument("--doc-chunks", type=int, default=2000, help="chunks por documento ingerido")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--index-type", default="auto", help="RAG_INDEX_TYPE del sistema (auto elige por tamaño)")
+    parser.add_argument("--vector-storage", default="float32", help="RAG_VECTOR_STORAGE del sistema")
+    parser.add_argument("--configs", type=lambda v: [c for c in v.split(",") if c], default=DEFAULT_CONFIGS.split(","),
+                        help=f"tipo:almacenamiento a comparar ({'|'.join(INDEX_TYPES)} : {'|'.join(STORAGE_MODES)})")
+    parser.add_argument("--nprobe", type=_int_list, default=_int_list("0,16,64"),
+                        help="valores de nprobe (IVF; 0 = auto, proporcional a las listas)")
+    parser.add_argument("--ef-search", type=_int_list, default=_int_list("32,64,128"), help="valores de efSearch (HNSW)")
+    parser.add_argument("--skip-configs", action="store_true", help="solo ingesta, persistencia y search_scored")
+    parser.add_argument("--threads", type=int, default=0, help="hilos de FAISS (0 = por defecto)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="directorio de las bases (por defecto, temporal)")
+    parser.add_argument("--keep", action="store_true", help="conservar las bases generadas")
+    parser.add_argument("--json", default=None, help="guardar resultados en JSON ('-' = stdout)")
+    parser.add_argument("--verbose", action="store_true", help="mostrar los logs del RAG")
+    args = parser.parse_args(argv)
+
+    for spec in args.configs:
+        kind, _, storage = spec.partition(":")
+        if kind not in INDEX_TYPES or (storage and storage not in STORAGE_MODES):
+            parser.error(f"configuración de índice inválida: {spec}")
+    if args.threads > 0:
+        faiss.omp_set_num_threads(args.threads)
+
+    corpus = FileCorpus(args.corpus, args.queries_file) if args.corpus else SyntheticCorpus(args.seed)
+    sizes = sorted(args.sizes)
+    if args.corpus:
+        skipped = [size for size in sizes if size > len(corpus)]
+        if skipped:
+            print(f"⚠️ El corpus tiene {len(corpus)} chunks: se omiten los tamaños {skipped}")
+        sizes = [size for size in sizes if size <= len(corpus)]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="tomi-retrieval-")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    try:
+        for name in [item.strip() for item in args.embeddings.split(",") if item.strip()]:
+            try:
+                embedder = create_benchmark_embedder(name, args.model, args.dim, args.seed)
+            except (ImportError, ValueError) as e:
+                print(f"⚠️ Embeddings {name} no disponibles: {e}")
+                continue
+            for size in sizes:
+                print(f"⏳ {name}: {size:,} chunks...", file=sys.stderr)
+                result = benchmark_size(corpus, size, embedder, args, workdir)
+                results.append(result)
+                if args.json != "-":
+                    print_result(result, args.k)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "faiss": getattr(faiss, "__version__", None),
+            "numpy": np.__version__,
+            "corpus": args.corpus or f"synthetic(seed={args.seed})",
+            "k": args.k
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("json", "verbose")},
+        "results": results
+    }
+    if args.json == "-":
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados guardados en {args.json}")
+    return 0 if results else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,23 @@
+"""Arrancar la app de main.py con el bot activo (para load_test, en su propio proceso)
+
+    python -m benchmarks.serve_app --port 8100
+
+La configuración (URLs de los stubs, tokens...) llega por variables de entorno.
+"""
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(description="App de TOmi para benchmarks")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+
+    import uvicorn
+    import main as app_main
+    from dashboard.routes import get_bot_config
+
+    # El bot arranca inactivo y solo se activa desde el dashboard (con login)
+    get_bot_config()["status"] = "active"
+    uvicorn.run(app_main.app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Servidores locales que imitan Groq (chat completions) y la Bot API de Telegram
+
+    python -m benchmarks.stubs --groq-port 9001 --telegram-port 9002 --groq-latency-ms 300
+
+Groq responde en JSON o en SSE (stream=true) con latencia, ritmo por token y tasas de
+error configurables. Telegram acepta cualquier método, registra las llamadas (chat,
+método, hora) y las expone en GET /_calls para medir la latencia de punta a punta.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY_WORDS = ("Para resolverlo, apaga el equipo durante diez segundos y vuelve a encenderlo. "
+               "Si la luz sigue parpadeando, revisa el cable de alimentación y la conexión de red. "
+               "Cuando el problema continúe, contacta a soporte con el número de serie.").split(" ")
+
+def _reply_tokens(n: int) -> List[str]:
+    return [REPLY_WORDS[i % len(REPLY_WORDS)] + " " for i in range(max(1, n))]
+
+def create_groq_app(latency_ms: float = 300, jitter_ms: float = 100, token_ms: float = 15,
+                    tokens: int = 60, error_rate: float = 0.0, rate_limit_rate: float = 0.0) -> FastAPI:
+    """Chat completions compatible con OpenAI: latencia hasta el primer token + token_ms por token"""
+    app = FastAPI()
+    stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0}
+
+    def first_token_delay() -> float:
+        return max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000
+
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        roll = random.random()
+        if roll < rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse({"error": {"message": "rate limit (stub)"}}, status_code=429,
+                                headers={"retry-after": "1"})
+        if roll < rate_limit_rate + error_rate:
+            stats["errors"] += 1
+            return JSONResponse({"error": {"message": "internal error (stub)"}}, status_code=500)
+
+        words = _reply_tokens(tokens)
+        usage = {"prompt_tokens": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4,
+                 "completion_tokens": len(words)}
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_delay() + len(words) * token_ms / 1000)
+            return {"model": model, "usage": usage,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)},
+                                 "finish_reason": "stop"}]}
+
+        stats["streams"] += 1
+
+        async def events():
+            await asyncio.sleep(first_token_delay())
+            for i, word in enumerate(words):
+                if i:
+                    await asyncio.sleep(token_ms / 1000)
+                chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": word}}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            last = {"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                    "x_groq": {"usage": usage}}
+            yield f"data: {json.dumps(last)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+def create_telegram_app(latency_ms: float = 30, error_rate: float = 0.0) -> FastAPI:
+    """Bot API: responde ok a cualquier método y guarda (chat, método, hora, largo del texto)"""
+    app = FastAPI()
+    calls: List[Dict[str, Any]] = []
+    stats = {"requests": 0, "errors": 0}
+    next_message_id = [0]
+
+    @app.post("/bot{token}/{method}")
+    async def bot_method(token: str, method: str, request: Request):
+        payload = await request.json()
+        stats["requests"] += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        failed = random.random() < error_rate
+        calls.append({"t": time.time(), "method": method, "chat_id": payload.get("chat_id"),
+                      "chars": len(payload.get("text") or ""), "ok": not failed})
+        if failed:
+            stats["errors"] += 1
+            return JSONResponse({"ok": False, "error_code": 500, "description": "Internal Server Error (stub)"},
+                                status_code=500)
+        next_message_id[0] += 1
+        return {"ok": True, "result": {"message_id": next_message_id[0], "chat": {"id": payload.get("chat_id")}}}
+
+    @app.get("/_calls")
+    async def get_calls(since: int = 0):
+        return calls[since:]
+
+    @app.get("/_stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+async def serve(groq_app: FastAPI, groq_port: int, telegram_app: FastAPI, telegram_port: int):
+    """Levantar ambos stubs en el mismo event loop"""
+    import uvicorn
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(groq_app, host="127.0.0.1", port=groq_port, log_level="warning",
+                                      access_log=False)),
+        uvicorn.Server(uvicorn.Config(telegram_app, host="127.0.0.1", port=telegram_port, log_level="warning",
+                                      access_log=False)),
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+def main():
+    parser = argparse.ArgumentParser(description="Stubs locales de Groq y Telegram")
+    parser.add_argument("--groq-port", type=int, default=9001)
+    parser.add_argument("--telegram-port", type=int, default=9002)
+    parser.add_argument("--groq-latency-ms", type=float, default=300, help="latencia hasta el primer token")
+    parser.add_argument("--groq-jitter-ms", type=float, default=100)
+    parser.add_argument("--groq-token-ms", type=float, default=15, help="tiempo entre tokens")
+    parser.add_argument("--groq-tokens", type=int, default=60, help="tokens por respuesta")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0, help="fracción de respuestas 500")
+    parser.add_argument("--groq-429-rate", type=float, default=0.0, help="fracción de respuestas 429")
+    parser.add_argument("--telegram-latency-ms", type=float, default=30)
+    parser.add_argument("--telegram-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    groq_app = create_groq_app(args.groq_latency_ms, args.groq_jitter_ms, args.groq_token_ms, args.groq_tokens,
+                               args.groq_error_rate, args.groq_429_rate)
+    telegram_app = create_telegram_app(args.telegram_latency_ms, args.telegram_error_rate)
+    print(f"🧪 Stubs: Groq en :{args.groq_port}, Telegram en :{args.telegram_port}")
+    asyncio.run(serve(groq_app, args.groq_port, telegram_app, args.telegram_port))
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,16 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Form, UploadFile, File, Cookie, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from auth.jwt_handler import verify_token, create_access_token
-from models.user import user_manager
-from utils.llm import rag
+from auth.jwt_handler import create_access_token
+from auth.dependencies import get_current_user, token_cache
+from models.user import UserInDB, user_manager
+from utils.llm import get_rag
 from datetime import timedelta
+import asyncio
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
-def get_current_user(access_token: str = Cookie(None)):
-    """Verificar usuario autenticado"""
-    if not access_token:
-        raise HTTPException(status_code=302, detail="Redirect to login")
-    
-    try:
-        email = verify_token(access_token)
-        user = user_manager.get_user(email)
-        if not user:
-            raise HTTPException(status_code=302, detail="Redirect to login")
-        return user
-    except:
-        raise HTTPException(status_code=302, detail="Redirect to login")
-
 # Configuración del bot
 bot_config = {
     "status": "inactive",
@@ -48,7 +36,8 @@ async def login_page(request: Request):
 @router.post("/login")
 async def login(request: Request, email: str = Form(...), password: str = Form(...)):
     """Procesar login - PÚBLICA"""
-    user = user_manager.authenticate_user(email, password)
+    # bcrypt corre en su pool acotado: un login no frena el webhook
+    user = await user_manager.authenticate_user_async(email, password)
     
     if not user:
         return templates.TemplateResponse(
@@ -72,8 +61,10 @@ async def login(request: Request, email: str = Form(...), password: str = Form(.
     return response
 
 @router.get("/logout")
-async def logout():
+async def logout(access_token: str = Cookie(None)):
     """Cerrar sesión - PÚBLICA"""
+    if access_token:
+        token_cache.invalidate(access_token)
     response = RedirectResponse(url="/login", status_code=302)
     response.delete_cookie("access_token")
     return response
@@ -81,22 +72,10 @@ async def logout():
 # ===== RUTAS PROTEGIDAS =====
 
 @router.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request):
+async def dashboard(request: Request, user: UserInDB = Depends(get_current_user)):
     """Dashboard principal - PROTEGIDA"""
-    # Verificación manual de autenticación
-    access_token = request.cookies.get("access_token")
-    if not access_token:
-        return RedirectResponse(url="/login", status_code=302)
-    
-    try:
-        email = verify_token(access_token)
-        user = user_manager.get_user(email)
-        if not user:
-            return RedirectResponse(url="/login", status_code=302)
-    except:
-        return RedirectResponse(url="/login", status_code=302)
-    
     try:
+        rag = await asyncio.to_thread(get_rag)
         stats = rag.get_stats()
         pdfs = rag.list_documents()
         
@@ -123,24 +102,18 @@ async def dashboard(request: Request):
         })
 
 @router.post("/upload-pdf")
-async def upload_pdf(request: Request, file: UploadFile = File(...)):
+async def upload_pdf(request: Request, file: UploadFile = File(...), tags: str = Form(""),
+                     user: UserInDB = Depends(get_current_user)):
     """Subir PDF - PROTEGIDA"""
-    # Verificación de autenticación
-    access_token = request.cookies.get("access_token")
-    if not access_token:
-        return RedirectResponse(url="/login", status_code=302)
-    
-    try:
-        verify_token(access_token)
-    except:
-        return RedirectResponse(url="/login", status_code=302)
-    
     try:
         if not file.filename.endswith('.pdf'):
             return RedirectResponse(url="/dashboard?error=Solo archivos PDF", status_code=302)
         
-        file_content = await file.read()
-        success = rag.add_pdf_from_upload(file_content, file.filename)
+        # Se procesa en streaming desde el archivo temporal, fuera del event loop
+        # Etiquetas opcionales separadas por comas (p.ej. producto) para filtrar búsquedas
+        tag_list = [tag for tag in tags.split(",") if tag.strip()] or None
+        rag = await asyncio.to_thread(get_rag)
+        success = await asyncio.to_thread(rag.add_pdf_from_upload, file.file, file.filename, tag_list)
         
         if success:
             return RedirectResponse(url="/dashboard?success=PDF subido correctamente", status_code=302)
@@ -152,20 +125,11 @@ async def upload_pdf(request: Request, file: UploadFile = File(...)):
         return RedirectResponse(url="/dashboard?error=Error interno", status_code=302)
 
 @router.post("/delete-pdf/{filename}")
-async def delete_pdf(request: Request, filename: str):
+async def delete_pdf(request: Request, filename: str, user: UserInDB = Depends(get_current_user)):
     """Eliminar PDF - PROTEGIDA"""
-    # Verificación de autenticación
-    access_token = request.cookies.get("access_token")
-    if not access_token:
-        return RedirectResponse(url="/login", status_code=302)
-    
-    try:
-        verify_token(access_token)
-    except:
-        return RedirectResponse(url="/login", status_code=302)
-    
     try:
-        success = rag.delete_document(filename)
+        rag = await asyncio.to_thread(get_rag)
+        success = await asyncio.to_thread(rag.delete_document, filename)
         if success:
             return RedirectResponse(url="/dashboard?success=PDF eliminado", status_code=302)
         else:
@@ -178,19 +142,10 @@ async def delete_pdf(request: Request, filename: str):
 async def update_bot_config(
     request: Request,
     welcome_message: str = Form(...),
-    handoff_message: str = Form(...)
+    handoff_message: str = Form(...),
+    user: UserInDB = Depends(get_current_user)
 ):
     """Actualizar configuración del bot - PROTEGIDA"""
-    # Verificación de autenticación
-    access_token = request.cookies.get("access_token")
-    if not access_token:
-        return RedirectResponse(url="/login", status_code=302)
-    
-    try:
-        verify_token(access_token)
-    except:
-        return RedirectResponse(url="/login", status_code=302)
-    
     global bot_config
     bot_config["welcome_message"] = welcome_message
     bot_config["handoff_message"] = handoff_message
@@ -198,18 +153,8 @@ async def update_bot_config(
     return RedirectResponse(url="/dashboard?success=Configuración actualizada", status_code=302)
 
 @router.post("/toggle-bot-status")
-async def toggle_bot_status(request: Request):
+async def toggle_bot_status(request: Request, user: UserInDB = Depends(get_current_user)):
     """Activar/desactivar bot - PROTEGIDA"""
-    # Verificación de autenticación
-    access_token = request.cookies.get("access_token")
-    if not access_token:
-        return RedirectResponse(url="/login", status_code=302)
-    
-    try:
-        verify_token(access_token)
-    except:
-        return RedirectResponse(url="/login", status_code=302)
-    
     global bot_config
     if bot_config["status"] == "active":
         bot_config["status"] = "inactive"
@@ -0,0 +1,15 @@
+# Producción: gunicorn -c gunicorn.conf.py main:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+# Un worker por defecto: la configuración del bot (estado, mensajes) vive en memoria
+# de cada proceso y con varios workers los cambios del dashboard llegarían solo a uno
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# La app se importa en el master antes del fork: con RAG_PRELOAD los pesos del
+# modelo se cargan una vez y los workers los comparten (copy-on-write).
+# Índice, hilos y warm-up se inicializan después, en cada worker.
+preload_app = True
+os.environ.setdefault("RAG_PRELOAD", "1")
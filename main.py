@@ -2,129 +2,213 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-import requests
+import asyncio
 import os
+import time
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from utils.llm import generate_reply, get_welcome_message
+from utils.llm import generate_reply, stream_reply, get_welcome_message, get_rag, rag_loaded, preload_model, response_cache, llm_client
+from utils.telegram import TELEGRAM_TOKEN, TELEGRAM_STREAM, send_message, stream_message, set_webhook
+from utils.http_clients import close_clients
+from utils.job_queue import JobQueue
+from utils.dedupe import create_dedupe_store, update_keys
+from utils.metrics import Trace, observe, use_trace, span, trace_id, finish_trace, registry, render_metrics
 from dashboard.routes import router as dashboard_router
-from typing import Set
+from auth.dependencies import token_cache
+from typing import Any, Dict, Optional
 
 # Variables de entorno
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://tu-app.railway.app")
-TELEGRAM_API = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}"
 PORT = int(os.getenv("PORT", 8000))
+# Arranque: cargar el modelo al crear la app (antes del fork con gunicorn --preload)
+# y precalentar RAG (modelo + índice + consulta de prueba) en cada worker al iniciar
+RAG_PRELOAD = os.getenv("RAG_PRELOAD", "0") == "1"
+RAG_WARMUP = os.getenv("RAG_WARMUP", "1") == "1"
 
-app = FastAPI(title="TOmi - RAG Bot Dashboard")
+# Updates ya recibidos (reintentos de Telegram): ventana deslizante, compartible entre workers
+dedupe = create_dedupe_store()
 
-# Cache para mensajes duplicados
-processed_messages: Set[int] = set()
+async def process_update(data: Dict[str, Any], trace: Optional[Trace] = None):
+    """Procesar un update de Telegram (ejecutado por los workers de la cola)"""
+    trace = trace or Trace(data.get("update_id"))
+    outcome = "error"
+    with use_trace(trace):
+        # Espera en la cola: desde el alta del trace, sin contar lo que tardó el webhook
+        observe("queue_wait", max(0.0, time.perf_counter() - trace.started - trace.stages.get("webhook", 0.0)))
+        try:
+            outcome = await _reply(data)
+        finally:
+            finish_trace(trace, outcome)
 
-def cleanup_old_messages():
-    global processed_messages
-    if len(processed_messages) > 1000:
-        processed_messages.clear()
+async def _reply(data: Dict[str, Any]) -> str:
+    message = data["message"]
+    message_id = message.get("message_id")
+    chat_id = message["chat"]["id"]
+    user_text = message.get("text", "")
+    
+    print(f"📩 [{message_id}] ({trace_id()}): {user_text}")
+    
+    # Verificar bot activo
+    from dashboard.routes import get_bot_config
+    bot_config = get_bot_config()
+    
+    if bot_config.get('status') != 'active':
+        print("🔴 Bot inactivo")
+        return "inactive"
+    
+    # Generar y enviar respuesta
+    with span("reply"):
+        if user_text.lower() in ["/start", "start", "hola", "hello", "hi"]:
+            print("👋 Enviando mensaje de bienvenida")
+            result = await send_message(chat_id, get_welcome_message())
+        elif TELEGRAM_STREAM:
+            # La respuesta aparece mientras se genera (primera oración + ediciones)
+            result = await stream_message(chat_id, stream_reply(user_text))
+        else:
+            bot_reply = await generate_reply(user_text)
+            result = await send_message(chat_id, bot_reply)
+    
+    ok = bool(result and result.get("ok"))
+    print(f"📤 [{message_id}] ({trace_id()}): {'ok' if ok else 'error'}")
+    return "ok" if ok else "error"
 
-# Incluir rutas del dashboard (YA INCLUYE LANDING + PROTECCIÓN)
-app.include_router(dashboard_router)
+async def _handle_job(job):
+    await process_update(*job)
 
-# Servir archivos estáticos
-try:
-    app.mount("/static", StaticFiles(directory="templates/static"), name="static")
-    print("✅ Archivos estáticos configurados")
-except Exception as e:
-    print(f"⚠️ Error configurando archivos estáticos: {e}")
+def _register_metrics(job_queue: JobQueue):
+    """Estadísticas que /metrics lee al exportar (las del RAG solo si ya está cargado)"""
+    registry.register_stats("queue", job_queue.stats, ("processed", "failed", "rejected"))
+    registry.register_stats("dedupe", dedupe.stats, ("checked", "duplicates", "forgotten"))
+    registry.register_stats("response_cache", response_cache.stats,
+                            ("hits_exact", "hits_semantic", "misses", "evictions", "invalidations"))
+    registry.register_stats("llm", llm_client.stats, ("requests", "retries", "hedges", "hedge_wins", "fallbacks", "errors"))
+    registry.register_stats("auth_cache", token_cache.stats, ("hits", "misses"))
+    registry.register_stats("rag", lambda: get_rag().get_stats() if rag_loaded() else {})
+    registry.register_stats("embedding_cache",
+                            lambda: get_rag().get_stats()["embedding_cache"] if rag_loaded() else {},
+                            ("hits", "misses", "evictions"))
+    registry.register_stats("query_batcher",
+                            lambda: get_rag().get_stats()["query_batching"] if rag_loaded() else {},
+                            ("batches", "requests"))
 
-@app.on_event("startup")
-async def startup_event():
-    """Configurar webhook automáticamente"""
-    print("🚀 Iniciando TOmi...")
+def create_app() -> FastAPI:
+    """Construir la app: rutas, estáticos, cola de updates y eventos de arranque/parada
     
-    if TELEGRAM_TOKEN and WEBHOOK_URL and WEBHOOK_URL != "https://tu-app.railway.app":
-        try:
-            webhook_endpoint = f"{WEBHOOK_URL}/webhook"
-            webhook_response = requests.post(
-                f"{TELEGRAM_API}/setWebhook",
-                json={"url": webhook_endpoint},
-                timeout=10
-            )
-            result = webhook_response.json()
-            print(f"🔗 Webhook configurado: {result}")
-            
-        except Exception as e:
-            print(f"⚠️ Error configurando webhook: {e}")
-    else:
-        print("⚠️ Webhook no configurado (desarrollo local)")
-
-@app.post("/webhook")
-async def webhook(request: Request):
-    """Webhook de Telegram - PÚBLICO"""
+    Importar la app no carga el modelo ni el índice: se inicializan en el primer
+    uso, en el warm-up de arranque o (RAG_PRELOAD) aquí mismo, antes del fork.
+    """
+    app = FastAPI(title="TOmi - RAG Bot Dashboard")
+    
+    # Incluir rutas del dashboard (YA INCLUYE LANDING + PROTECCIÓN)
+    app.include_router(dashboard_router)
+    
+    # Servir archivos estáticos
     try:
-        data = await request.json()
+        app.mount("/static", StaticFiles(directory="templates/static"), name="static")
+        print("✅ Archivos estáticos configurados")
+    except Exception as e:
+        print(f"⚠️ Error configurando archivos estáticos: {e}")
+    
+    # Cola de updates: el webhook responde al instante y los workers procesan
+    job_queue = JobQueue(_handle_job)
+    app.state.job_queue = job_queue
+    _register_metrics(job_queue)
+    
+    if RAG_PRELOAD:
+        # Solo pesos: los workers comparten estas páginas copy-on-write tras el fork
+        preload_model()
+    
+    @app.on_event("startup")
+    async def startup_event():
+        """Iniciar workers, precalentar RAG y configurar webhook automáticamente"""
+        print("🚀 Iniciando TOmi...")
         
-        if "message" in data:
-            message = data["message"]
-            message_id = message.get("message_id")
-            chat_id = message["chat"]["id"]
-            user_text = message.get("text", "")
-            
-            # Deduplicación
-            if message_id in processed_messages:
-                return {"status": "duplicated"}
-            
-            processed_messages.add(message_id)
-            cleanup_old_messages()
-            
-            print(f"📩 [{message_id}]: {user_text}")
-            
-            # Verificar bot activo
-            from dashboard.routes import get_bot_config
-            bot_config = get_bot_config()
-            
-            if bot_config.get('status') != 'active':
-                print("🔴 Bot inactivo")
-                return {"status": "bot_inactive"}
+        await job_queue.start()
+        
+        if RAG_WARMUP:
+            try:
+                rag = await asyncio.to_thread(get_rag)
+                await asyncio.to_thread(rag.warm_up)
+            except Exception as e:
+                print(f"⚠️ Error precalentando RAG: {e}")
+        
+        if TELEGRAM_TOKEN and WEBHOOK_URL and WEBHOOK_URL != "https://tu-app.railway.app":
+            result = await set_webhook(f"{WEBHOOK_URL}/webhook")
+            print(f"🔗 Webhook configurado: {result}")
+        else:
+            print("⚠️ Webhook no configurado (desarrollo local)")
+    
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        """Vaciar la cola y cerrar conexiones HTTP"""
+        await job_queue.stop()
+        await close_clients()
+        dedupe.close()
+    
+    @app.post("/webhook")
+    async def webhook(request: Request):
+        """Webhook de Telegram - PÚBLICO"""
+        try:
+            data = await request.json()
             
-            # Generar respuesta
-            if user_text.lower() in ["/start", "start", "hola", "hello", "hi"]:
-                bot_reply = get_welcome_message()
-                print("👋 Enviando mensaje de bienvenida")
-            else:
-                bot_reply = generate_reply(user_text)
+            if "message" in data:
+                message_id = data["message"].get("message_id")
+                trace = Trace(data.get("update_id"))
+                
+                # Deduplicación por update_id y (chat_id, message_id)
+                keys = update_keys(data)
+                with use_trace(trace), span("dedupe"):
+                    is_new = await asyncio.to_thread(dedupe.add, keys)
+                if not is_new:
+                    return {"status": "duplicated"}
+                
+                # Cola llena: 503 para que Telegram reintente más tarde (y ese reintento no es duplicado)
+                with use_trace(trace):
+                    observe("webhook", time.perf_counter() - trace.started)
+                if not job_queue.submit((data, trace)):
+                    await asyncio.to_thread(dedupe.forget, keys)
+                    print(f"⚠️ Cola llena, update rechazado [{message_id}] ({trace.trace_id})")
+                    return JSONResponse({"status": "busy"}, status_code=503)
+                
+                return {"status": "queued"}
             
-            # Enviar respuesta
-            send_response = requests.post(
-                f"{TELEGRAM_API}/sendMessage",
-                json={
-                    "chat_id": chat_id,
-                    "text": bot_reply
-                },
-                timeout=15
-            )
+            return {"status": "ok"}
             
-            print(f"📤 [{message_id}]: {send_response.status_code}")
-        
-        return {"status": "ok"}
-        
-    except Exception as e:
-        print(f"❌ Webhook error: {e}")
-        return {"status": "error"}
+        except Exception as e:
+            print(f"❌ Webhook error: {e}")
+            return {"status": "error"}
+    
+    @app.get("/health")
+    async def health():
+        """Health check - PÚBLICO (no fuerza la carga del RAG)"""
+        try:
+            status = {
+                "status": "healthy",
+                "webhook_url": WEBHOOK_URL,
+                "rag_loaded": rag_loaded(),
+                "telegram_configured": bool(TELEGRAM_TOKEN),
+                "queue": job_queue.stats(),
+                "dedupe": dedupe.stats(),
+                "response_cache": response_cache.stats(),
+                "llm": llm_client.stats()
+            }
+            if rag_loaded():
+                rag = get_rag()
+                status["documents"] = len(rag.list_documents())
+                status["chunks"] = len(rag.chunks)
+            return status
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+    
+    @app.get("/metrics")
+    async def metrics():
+        """Métricas en formato texto de Prometheus - PÚBLICO (por proceso)"""
+        return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+    
+    return app
 
-@app.get("/health")
-async def health():
-    """Health check - PÚBLICO"""
-    try:
-        from utils.llm import rag
-        return {
-            "status": "healthy",
-            "webhook_url": WEBHOOK_URL,
-            "documents": len(rag.list_documents()),
-            "chunks": len([c for c in rag.chunks if c.strip()]),
-            "telegram_configured": bool(TELEGRAM_TOKEN)
-        }
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
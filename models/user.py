@@ -1,11 +1,19 @@
-from typing import Optional
+from typing import Dict, Optional
 from pydantic import BaseModel
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import json
 import os
+import tempfile
+import threading
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt tarda ~250 ms por verificación: se ejecuta en un pool acotado fuera del event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+_hash_executor = ThreadPoolExecutor(max_workers=max(1, PASSWORD_HASH_WORKERS), thread_name_prefix="bcrypt")
+
 class User(BaseModel):
     email: str
     name: str
@@ -19,8 +27,14 @@ class UserInDB(User):
         return pwd_context.verify(plain_password, self.hashed_password)
 
 class UserManager:
+    """Usuarios en memoria; users.json se relee solo si cambia y se escribe de forma atómica"""
+    
     def __init__(self):
         self.users_file = "data/users.json"
+        self._lock = threading.Lock()
+        self._users: Dict[str, UserInDB] = {}
+        self._file_state = None  # (mtime_ns, tamaño) del archivo cargado
+        self.version = 0  # Cambia con cada recarga o escritura (invalida cachés de sesión)
         self._ensure_users_file()
     
     def hash_password(self, password: str) -> str:
@@ -41,19 +55,51 @@ class UserManager:
                     "hashed_password": self.hash_password("12345678")  # ← CAMBIO AQUÍ
                 }
             }
-            with open(self.users_file, "w") as f:
-                json.dump(default_user, f, indent=2)
+            self._write(default_user)
     
-    def get_user(self, email: str) -> Optional[UserInDB]:
+    def _refresh(self):
+        """Recargar users.json si cambió en disco (otro worker o edición manual)"""
         try:
-            with open(self.users_file, "r") as f:
-                users = json.load(f)
-            
-            if email in users:
-                return UserInDB(**users[email])
-        except:
-            pass
-        return None
+            stat = os.stat(self.users_file)
+        except OSError:
+            return
+        state = (stat.st_mtime_ns, stat.st_size)
+        if state == self._file_state:
+            return
+        with self._lock:
+            if state == self._file_state:
+                return
+            try:
+                with open(self.users_file, "r") as f:
+                    users = json.load(f)
+                self._users = {email: UserInDB(**data) for email, data in users.items()}
+                self._file_state = state
+                self.version += 1
+            except Exception as e:
+                print(f"⚠️ Error leyendo {self.users_file}: {e}")
+    
+    def _write(self, users: Dict[str, dict]):
+        """Escribir a un temporal y renombrar: nunca queda un users.json a medias"""
+        directory = os.path.dirname(self.users_file) or "."
+        fd, tmp_path = tempfile.mkstemp(prefix=".users-", suffix=".json", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(users, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.users_file)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    def current_version(self) -> int:
+        """Versión de los usuarios tras comprobar si el archivo cambió"""
+        self._refresh()
+        return self.version
+    
+    def get_user(self, email: str) -> Optional[UserInDB]:
+        self._refresh()
+        return self._users.get(email)
     
     def authenticate_user(self, email: str, password: str) -> Optional[UserInDB]:
         user = self.get_user(email)
@@ -61,29 +107,39 @@ class UserManager:
             return user
         return None
     
+    async def authenticate_user_async(self, email: str, password: str) -> Optional[UserInDB]:
+        """authenticate_user en el pool de bcrypt (no bloquea el event loop)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, self.authenticate_user, email, password)
+    
     def create_user(self, email: str, name: str, password: str) -> bool:
         """Crear nuevo usuario"""
         try:
-            users = {}
-            if os.path.exists(self.users_file):
-                with open(self.users_file, "r") as f:
-                    users = json.load(f)
-            
-            if email in users:
-                return False  # Usuario ya existe
-            
-            users[email] = {
-                "email": email,
-                "name": name,
-                "hashed_password": self.hash_password(password)  # ← USAR MÉTODO SEGURO
-            }
-            
-            with open(self.users_file, "w") as f:
-                json.dump(users, f, indent=2)
+            hashed_password = self.hash_password(password)  # ← USAR MÉTODO SEGURO (fuera del lock)
+            self._refresh()
+            with self._lock:
+                if email in self._users:
+                    return False  # Usuario ya existe
+                
+                users = {known: dict(user) for known, user in self._users.items()}
+                users[email] = {
+                    "email": email,
+                    "name": name,
+                    "hashed_password": hashed_password
+                }
+                self._write(users)
+                self._users[email] = UserInDB(**users[email])
+                stat = os.stat(self.users_file)
+                self._file_state = (stat.st_mtime_ns, stat.st_size)
+                self.version += 1
             
             return True
         except Exception as e:
             print(f"Error creando usuario: {e}")
             return False
+    
+    async def create_user_async(self, email: str, name: str, password: str) -> bool:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, self.create_user, email, name, password)
 
-user_manager = UserManager()
\ No newline at end of file
+user_manager = UserManager()
@@ -0,0 +1,52 @@
+import json
+import os
+import sys
+
+# Los tests importan los módulos del repo (utils, auth, models...) desde la raíz
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+def synthetic_rag(db_path: str):
+    """RAGSystem con el embedder sintético (sin modelo ni red)"""
+    from helpers import SyntheticEmbedder
+    from utils.rag_system import RAGSystem
+
+    return RAGSystem("synthetic", db_path=db_path, embedder=SyntheticEmbedder(dim=64))
+
+@pytest.fixture
+def rag_factory(tmp_path):
+    """Crear RAGSystem (con el embedder sintético de helpers) sobre una base temporal
+
+    Varias llamadas con el mismo db_path simulan workers que comparten la base.
+    """
+    systems = []
+
+    def create(db_path: str = str(tmp_path / "faiss_db")):
+        system = synthetic_rag(db_path)
+        systems.append(system)
+        return system
+
+    yield create
+    for system in systems:
+        if system._compaction_thread is not None:
+            system._compaction_thread.join()
+
+@pytest.fixture
+def rag(rag_factory):
+    """RAGSystem en un directorio temporal"""
+    return rag_factory()
+
+@pytest.fixture
+def app_dir(tmp_path, monkeypatch):
+    """Directorio de trabajo temporal para la app (data/ y templates/ son rutas relativas)
+
+    Se crea data/users.json de antemano: importar models.user no calcula ningún hash.
+    """
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "users.json").write_text(json.dumps({
+        "admin@tomi.com.pe": {"email": "admin@tomi.com.pe", "name": "Admin", "hashed_password": "-"}
+    }))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,55 @@
+"""Utilidades compartidas por los tests (sin modelos, red ni scripts de benchmarks)"""
+import zlib
+from typing import Optional, Sequence
+import numpy as np
+from utils.embedders import Embedder
+
+class SyntheticEmbedder(Embedder):
+    """Suma de vectores aleatorios por palabra (hashing): rápido, determinista y sin modelo
+
+    Chunks que comparten palabras quedan cerca, así que la búsqueda tiene estructura.
+    """
+
+    backend = "synthetic"
+
+    def __init__(self, dim: int = 64, buckets: int = 1 << 15, seed: int = 0):
+        super().__init__(f"synthetic-{dim}")
+        self.buckets = buckets
+        self.table = np.random.default_rng([seed, 5]).standard_normal((buckets, dim), dtype=np.float32)
+
+    @property
+    def tokenizer(self):
+        return None
+
+    @property
+    def tokenizer_name(self) -> Optional[str]:
+        return None
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        rows, offsets = [], []
+        for text in texts:
+            offsets.append(len(rows))
+            rows.extend(zlib.crc32(token.encode("utf-8")) % self.buckets for token in (text.lower().split() or [""]))
+        return np.add.reduceat(self.table[np.asarray(rows)], np.asarray(offsets), axis=0)
+
+def pdf_bytes(pages):
+    """PDF mínimo con una línea de texto por elemento de cada página (solo ASCII)"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        stream = "BT /F1 11 Tf 72 760 Td 14 TL " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objects)} 0 R "
+                       "/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
@@ -0,0 +1,60 @@
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+
+@pytest.fixture
+def auth(app_dir, monkeypatch):
+    """Dependencia de sesión con una caché vacía y conteo de JWT decodificados"""
+    from auth import dependencies
+
+    monkeypatch.setattr(dependencies, "token_cache", dependencies.TokenCache())
+    decoded = []
+    decode = dependencies.decode_token
+    monkeypatch.setattr(dependencies, "decode_token", lambda token: decoded.append(token) or decode(token))
+    return dependencies, decoded
+
+def login(email="admin@tomi.com.pe"):
+    from auth.jwt_handler import create_access_token
+    return create_access_token({"sub": email})
+
+def current_user(dependencies, token):
+    return asyncio.run(dependencies.get_current_user(token))
+
+def write_users(users):
+    with open("data/users.json", "w") as f:
+        json.dump({email: {"email": email, "name": name, "hashed_password": "-"} for email, name in users.items()}, f)
+
+def test_verified_token_is_cached(auth):
+    dependencies, decoded = auth
+    token = login()
+    assert current_user(dependencies, token).name == "Admin"
+    assert current_user(dependencies, token).name == "Admin"
+    assert len(decoded) == 1
+    assert dependencies.token_cache.stats()["hits"] == 1
+
+    dependencies.token_cache.invalidate(token)  # Logout
+    current_user(dependencies, token)
+    assert len(decoded) == 2
+
+def test_users_change_invalidates_cache(auth):
+    dependencies, decoded = auth
+    token = login()
+    assert current_user(dependencies, token).name == "Admin"
+
+    # Otro worker (o una edición manual) cambia users.json: UserManager.version avanza
+    write_users({"admin@tomi.com.pe": "Administradora"})
+    assert current_user(dependencies, token).name == "Administradora"
+    assert len(decoded) == 2
+
+    write_users({"otra@tomi.com.pe": "Otra"})
+    with pytest.raises(HTTPException) as error:
+        current_user(dependencies, token)
+    assert error.value.status_code == 302 and error.value.headers["Location"] == "/login"
+
+def test_invalid_token_redirects_to_login(auth):
+    dependencies, _ = auth
+    for token in (None, "no-es-un-jwt"):
+        with pytest.raises(HTTPException) as error:
+            current_user(dependencies, token)
+        assert error.value.status_code == 302
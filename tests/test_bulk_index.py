@@ -0,0 +1,34 @@
+from helpers import pdf_bytes
+from utils import rag_system
+
+def write_manuals(folder, names):
+    folder.mkdir(exist_ok=True)
+    for name in names:
+        lines = [f"Manual {name} paso {i}: revisa el conector {i} y la tapa del filtro" for i in range(30)]
+        (folder / f"{name}.pdf").write_bytes(pdf_bytes([lines[:15], lines[15:]]))
+
+def test_bulk_index_uses_spawn_and_skips_unchanged(rag, tmp_path, monkeypatch):
+    contexts = []
+    executor = rag_system.ProcessPoolExecutor
+
+    def recording_executor(*args, **kwargs):
+        contexts.append(kwargs.get("mp_context"))
+        return executor(*args, **kwargs)
+
+    monkeypatch.setattr(rag_system, "ProcessPoolExecutor", recording_executor)
+    folder = tmp_path / "pdfs"
+    write_manuals(folder, ["bomba", "filtro", "sensor"])
+
+    rag.create_vector_database(str(folder), workers=2)
+    assert sorted(rag.list_documents()) == ["bomba.pdf", "filtro.pdf", "sensor.pdf"]
+    assert len(rag.segments) == 1  # Todo el lote en un único segmento
+    assert [context.get_start_method() for context in contexts] == ["spawn"]
+
+    results = rag.search_scored("Manual sensor paso 3", k=1, min_score=-1.0)
+    assert results[0].document == "sensor.pdf" and results[0].page >= 1
+
+    # Segunda pasada: los PDFs sin cambios no se vuelven a extraer
+    write_manuals(folder, ["valvula"])
+    rag.create_vector_database(str(folder), workers=2)
+    assert len(rag.list_documents()) == 4
+    assert len(rag.segments) == 2
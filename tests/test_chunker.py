@@ -0,0 +1,61 @@
+from utils.pdf_processor import iter_token_chunks, split_text_into_chunks
+
+def words(text: str) -> int:
+    return len(text.split())
+
+def normalized(text: str) -> str:
+    return " ".join(text.split())
+
+def sentences(topic: str, n: int) -> str:
+    return " ".join(f"La {topic} {i} requiere revisar el conector número {i}." for i in range(n))
+
+PAGES = [
+    "1. Instalación\n" + sentences("instalación", 12) + "\n",
+    sentences("conexión", 10) + "\n\n2. Mantenimiento\n" + sentences("limpieza", 12) + "\n",
+]
+
+def chunk(pages=PAGES, max_tokens=40, overlap=12):
+    return list(iter_token_chunks(pages, max_tokens, overlap, count_tokens=words))
+
+def test_offsets_point_to_the_chunk_text():
+    document = "".join(PAGES)
+    chunks = chunk()
+    assert len(chunks) > 4
+    for piece in chunks:
+        assert normalized(document[piece.start:piece.end]) == piece.text
+        assert words(piece.text) <= 40
+    # La página es la de la primera oración del chunk
+    page_two = len(PAGES[0])
+    for piece in chunks:
+        assert piece.page == (1 if piece.start < page_two else 2)
+    assert {piece.page for piece in chunks} == {1, 2}
+
+def test_consecutive_chunks_overlap_by_whole_sentences():
+    chunks = chunk()
+    overlapping = [(a, b) for a, b in zip(chunks, chunks[1:]) if b.start < a.end]
+    assert overlapping
+    document = "".join(PAGES)
+    for previous, following in overlapping:
+        shared = normalized(document[following.start:previous.end])
+        assert previous.text.endswith(shared) and following.text.startswith(shared)
+        assert shared.endswith(".") and words(shared) <= 12
+
+def test_heading_opens_a_chunk_without_overlap():
+    chunks = chunk()
+    heading = next(piece for piece in chunks if "2. Mantenimiento" in piece.text)
+    assert heading.text.startswith("2. Mantenimiento")
+    before = chunks[chunks.index(heading) - 1]
+    assert before.end <= heading.start  # La sección nueva no arrastra oraciones de la anterior
+
+def test_long_sentence_is_split_by_words():
+    text = " ".join(f"palabra{i}" for i in range(100)) + "."
+    chunks = list(iter_token_chunks([text], 30, 10, count_tokens=words))
+    assert len(chunks) > 1
+    assert all(words(piece.text) <= 30 for piece in chunks)
+    assert " ".join(piece.text for piece in chunks).split()[0] == "palabra0"
+    assert chunks[-1].text.endswith("palabra99.")
+
+def test_split_text_into_chunks_keeps_all_text():
+    text = sentences("prueba", 30)
+    pieces = split_text_into_chunks(text, max_tokens=60, overlap_tokens=0)
+    assert " ".join(pieces).split() == text.split()
@@ -0,0 +1,64 @@
+import pytest
+from utils.dedupe import (DedupeStore, MemoryDedupeStore, SQLiteDedupeStore, create_dedupe_store,
+                          update_keys)
+
+def update(update_id: int, chat_id: int = 7, message_id: int = 1):
+    return {"update_id": update_id, "message": {"message_id": message_id, "chat": {"id": chat_id}}}
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryDedupeStore(window=60, max_entries=100)
+    else:
+        store = SQLiteDedupeStore(str(tmp_path / "dedupe.sqlite3"), window=60, max_entries=100)
+    yield store
+    store.close()
+
+def test_base_store_is_abstract():
+    with pytest.raises(TypeError):
+        DedupeStore()
+
+def test_default_backend_is_shared_between_workers():
+    assert isinstance(create_dedupe_store(), SQLiteDedupeStore)
+
+def test_update_keys():
+    assert update_keys(update(5, chat_id=9, message_id=3)) == ["u:5", "m:9:3"]
+    assert update_keys({"update_id": 1}) == ["u:1"]
+
+def test_duplicates_and_forget(store):
+    assert store.add(update_keys(update(1)))
+    assert not store.add(update_keys(update(1)))
+    # Mismo mensaje reenviado con otro update_id
+    assert not store.add(update_keys(update(2)))
+    store.forget(update_keys(update(1)))
+    assert store.add(update_keys(update(1)))
+    stats = store.stats()
+    assert stats["checked"] == 4 and stats["duplicates"] == 2 and stats["forgotten"] == 1
+
+def test_window_expires(store):
+    store._add(["u:1"], now=1000.0)
+    assert not store._add(["u:1"], now=1030.0)
+    assert store._add(["u:1"], now=1061.0)
+
+def test_sqlite_shared_between_workers(tmp_path):
+    path = str(tmp_path / "dedupe.sqlite3")
+    worker_a, worker_b = SQLiteDedupeStore(path), SQLiteDedupeStore(path)
+    try:
+        assert worker_a.add(["u:1"])
+        assert not worker_b.add(["u:1"])
+    finally:
+        worker_a.close()
+        worker_b.close()
+
+def test_sqlite_stats_do_not_query(tmp_path, monkeypatch):
+    store = SQLiteDedupeStore(str(tmp_path / "dedupe.sqlite3"), max_entries=10)
+    store.PRUNE_EVERY = 4
+    for i in range(12):
+        store.add([f"u:{i}"])
+    assert len(store) == 10
+
+    def no_queries():
+        raise AssertionError("stats() no debe consultar SQLite")
+    monkeypatch.setattr(store, "_connection", no_queries)
+    assert store.stats()["entries"] == 10
+    store.close()
@@ -0,0 +1,69 @@
+from utils import rag_system
+from utils.segment_store import ranges_to_ids
+
+def texts(prefix: str, n: int):
+    return [f"{prefix} paso {i}: revisa el conector {i} y la tapa del filtro" for i in range(n)]
+
+def merged_corpus(rag, monkeypatch):
+    """Dos documentos en un único segmento fusionado (40 + 5 chunks)"""
+    rag._add_chunks(texts("manual", 40), "manual.pdf")
+    rag._add_chunks(texts("guía", 5), "guia.pdf")
+    monkeypatch.setattr(rag_system, "RAG_MAX_SEGMENTS", 1)
+    rag._compact()
+    monkeypatch.setattr(rag_system, "RAG_MAX_SEGMENTS", 8)
+    assert len(rag.segments) == 1
+
+def test_delete_below_ratio_keeps_tombstones(rag, monkeypatch):
+    monkeypatch.setattr(rag_system, "RAG_MAX_DELETED_RATIO", 0.5)
+    merged_corpus(rag, monkeypatch)
+    scheduled = []
+    monkeypatch.setattr(rag, "_schedule_compaction", lambda: scheduled.append(True))
+
+    assert rag.delete_document("guia.pdf")
+    assert not scheduled
+    assert len(rag.deleted_ids) == 5
+    assert "guia.pdf" not in rag.list_documents()
+    for hit in rag.search_scored("guía paso 3 conector", k=5, min_score=-1.0):
+        assert hit.document == "manual.pdf"
+
+def test_delete_past_ratio_purges_segment(rag, monkeypatch):
+    monkeypatch.setattr(rag_system, "RAG_MAX_DELETED_RATIO", 0.5)
+    merged_corpus(rag, monkeypatch)
+
+    assert rag.delete_document("guia.pdf")
+    assert rag.delete_document("manual.pdf")
+    rag._compaction_thread.join()
+    assert not rag.deleted_ids
+    assert not rag.segments
+    assert rag.search_scored("conector", k=3, min_score=-1.0) == []
+
+def test_search_overfetch_is_capped_and_retried(rag, monkeypatch):
+    monkeypatch.setattr(rag_system, "RAG_MAX_DELETED_RATIO", 0.99)
+    rag._add_chunks(texts("manual", 200), "manual.pdf")
+    rag._add_chunks([f"calibración del sensor de presión, nivel {i}" for i in range(5)], "guia.pdf")
+    # Ambos documentos en el snapshot: los borrados compiten con los vivos en el mismo índice
+    monkeypatch.setattr(rag_system, "RAG_MAX_SEGMENTS", 1)
+    rag._compact()
+    monkeypatch.setattr(rag_system, "RAG_MAX_SEGMENTS", 8)
+    assert rag.delta_index is None or rag.delta_index.ntotal == 0
+    assert rag.delete_document("manual.pdf")
+    assert len(rag.deleted_ids) == 200
+    guide = set(ranges_to_ids(rag.documents["guia.pdf"]))
+
+    fetched = []
+    collect = rag._collect_hits
+    monkeypatch.setattr(rag, "_collect_hits", lambda indexes, vectors, k, fetch_k, selector=None:
+                        fetched.append(fetch_k) or collect(indexes, vectors, k, fetch_k, selector))
+
+    # Las consultas no piden k + todos los borrados de entrada
+    vectors = rag._encode_queries(["calibración del sensor de presión"])
+    hits = rag._search_ids(vectors, 3)[0]
+    assert len(hits) == 3 and set(hits) <= guide
+    assert fetched[0] < 3 + 200
+
+    # Si los primeros candidatos son casi todos borrados, se amplía hasta completar k
+    fetched.clear()
+    vectors = rag._encode_queries(["manual paso 7: revisa el conector 7 y la tapa del filtro"])
+    hits = rag._search_ids(vectors, 3)[0]
+    assert len(hits) == 3 and set(hits) <= guide
+    assert len(fetched) > 1 and fetched[-1] > fetched[0]
@@ -0,0 +1,26 @@
+import importlib.util
+import pytest
+from utils import embedders
+from utils.embedders import Embedder, create_embedder
+
+def test_embedder_is_abstract():
+    with pytest.raises(TypeError):
+        Embedder("modelo")
+
+    class NoEncode(Embedder):
+        tokenizer = None
+
+    with pytest.raises(TypeError):
+        NoEncode("modelo")
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        create_embedder("modelo", "tensorflow")
+
+def test_onnx_backend_reports_missing_dependencies(monkeypatch):
+    monkeypatch.setattr(embedders, "ort", None)
+    real_find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, "find_spec",
+                        lambda name, *args: None if name == "transformers" else real_find_spec(name, *args))
+    with pytest.raises(ImportError, match="onnxruntime, transformers"):
+        create_embedder("modelo", "onnx-int8")
@@ -0,0 +1,100 @@
+import multiprocessing
+import numpy as np
+from utils import embedding_cache
+from utils.embedding_cache import EmbeddingCache, text_key
+
+def vectors_for(texts, dim=8):
+    # Vector determinista por texto: permite comprobar que cada acierto es el correcto
+    return np.stack([np.random.default_rng(int(text_key(t)[:8], 16)).standard_normal(dim) for t in texts]).astype("float32")
+
+def test_hits_after_put_and_normalized_keys(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=16)
+    texts = ["uno dos", "tres"]
+    keys, vectors, found = cache.get_many(texts)
+    assert vectors is None and not found.any()
+    cache.put_many(keys, vectors_for(texts))
+
+    _, vectors, found = cache.get_many(["uno   dos", "tres", "cuatro"])
+    assert found.tolist() == [True, True, False]
+    np.testing.assert_array_equal(vectors[:2], vectors_for(texts))
+    assert cache.stats()["hits"] == 2
+
+def test_reads_take_shared_lock(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=16)
+    keys, _, _ = cache.get_many(["a"])
+    cache.put_many(keys, vectors_for(["a"]))
+
+    calls = []
+    real_flock = embedding_cache.fcntl.flock
+    monkeypatch.setattr(embedding_cache.fcntl, "flock", lambda f, op: (calls.append(op), real_flock(f, op)))
+    cache.get_many(["a"])
+    assert calls == [embedding_cache.fcntl.LOCK_SH, embedding_cache.fcntl.LOCK_UN]
+
+def test_slots_reloaded_only_after_other_writers(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=16)
+    other = EmbeddingCache(str(tmp_path), "model", max_entries=16)
+    cache.put_many([text_key("a")], vectors_for(["a"]))
+    assert other.get_many(["a"])[2].all()
+
+    reloads = []
+    real_reload = cache._reload_slots
+    monkeypatch.setattr(cache, "_reload_slots", lambda: (reloads.append(True), real_reload()))
+    for text in "bcd":
+        cache.put_many([text_key(text)], vectors_for([text]))
+        cache.get_many([text])
+    assert not reloads
+
+    # Otro proceso escribe: el siguiente acceso sí relee el índice y ve su vector
+    other.put_many([text_key("e")], vectors_for(["e"]))
+    assert cache.get_many(["e"])[2].all()
+    assert len(reloads) == 1
+
+def test_reads_do_not_write_the_index(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", max_entries=16)
+    cache.put_many([text_key("a")], vectors_for(["a"]))
+    cache.put_many([text_key("b")], vectors_for(["b"]))
+    with open(tmp_path / "model" / "index.bin", "rb") as f:
+        before = f.read()
+    assert cache.get_many(["a"])[2].all()
+    with open(tmp_path / "model" / "index.bin", "rb") as f:
+        assert f.read() == before
+
+    # El uso se registra en el índice con la siguiente escritura de este proceso
+    cache.put_many([text_key("c")], vectors_for(["c"]))
+    slot = cache._slots[text_key("a")]
+    assert cache._index["tick"][slot] == 2 and not cache._touched
+
+def test_slot_reused_by_other_process_is_a_miss(tmp_path):
+    reader = EmbeddingCache(str(tmp_path), "model", max_entries=10)
+    writer = EmbeddingCache(str(tmp_path), "model", max_entries=10)
+    old = [f"viejo {i}" for i in range(10)]
+    keys, _, _ = writer.get_many(old)
+    writer.put_many(keys, vectors_for(old))
+    assert reader.get_many(old)[2].all()
+
+    # El otro proceso llena la caché: expulsa slots que el lector aún tiene mapeados
+    new = [f"nuevo {i}" for i in range(5)]
+    writer.put_many([text_key(t) for t in new], vectors_for(new))
+    _, vectors, found = reader.get_many(old)
+    assert not found.all()
+    np.testing.assert_array_equal(vectors[found], vectors_for(old)[found])
+
+def _hammer(path, rounds):
+    cache = EmbeddingCache(path, "model", max_entries=32)
+    for r in range(rounds):
+        texts = [f"texto {r}-{i}" for i in range(8)]
+        cache.put_many([text_key(t) for t in texts], vectors_for(texts))
+
+def test_concurrent_writer_never_returns_wrong_vector(tmp_path):
+    path = str(tmp_path)
+    texts = [f"texto 0-{i}" for i in range(8)]
+    reader = EmbeddingCache(path, "model", max_entries=32)
+    reader.put_many([text_key(t) for t in texts], vectors_for(texts))
+
+    writer = multiprocessing.get_context("fork").Process(target=_hammer, args=(path, 300))
+    writer.start()
+    while writer.is_alive():
+        _, vectors, found = reader.get_many(texts)
+        np.testing.assert_array_equal(vectors[found], vectors_for(texts)[found])
+    writer.join()
+    assert writer.exitcode == 0
@@ -0,0 +1,51 @@
+from utils import rag_system
+
+def texts(product: str, n: int = 6):
+    return [f"{product} paso {i}: revisa el conector {i} y la tapa del filtro" for i in range(n)]
+
+def documents_of(results):
+    return {result.document for result in results}
+
+def corpus(rag, monkeypatch):
+    """Tres manuales casi iguales: dos en el snapshot (fusionados) y uno en el delta"""
+    rag._add_chunks(texts("bomba A"), "bomba-a.pdf")
+    rag._add_chunks(texts("bomba B"), "bomba-b.pdf")
+    monkeypatch.setattr(rag_system, "RAG_MAX_SEGMENTS", 1)
+    rag._compact()
+    monkeypatch.setattr(rag_system, "RAG_MAX_SEGMENTS", 8)
+    rag._add_chunks(texts("sensor"), "sensor.pdf")
+    rag.set_document_tags("bomba-a.pdf", ["Bomba"])
+    rag.set_document_tags("bomba-b.pdf", ["bomba", "industrial"])
+
+def test_filter_by_document_and_tag(rag, monkeypatch):
+    corpus(rag, monkeypatch)
+    query = "revisa el conector 3 y la tapa del filtro"
+    assert len(documents_of(rag.search_scored(query, k=6, min_score=-1.0))) > 1
+
+    only_sensor = rag.search_scored(query, k=6, documents=["sensor.pdf"], min_score=-1.0)
+    assert only_sensor and documents_of(only_sensor) == {"sensor.pdf"}
+
+    pumps = rag.search_scored(query, k=10, tags=["BOMBA"], min_score=-1.0)
+    assert documents_of(pumps) == {"bomba-a.pdf", "bomba-b.pdf"}
+
+    # Documentos y etiquetas se suman
+    mixed = rag.search_scored(query, k=12, documents=["sensor.pdf"], tags=["industrial"], min_score=-1.0)
+    assert documents_of(mixed) == {"sensor.pdf", "bomba-b.pdf"}
+
+    assert rag.search_scored(query, documents=["no-existe.pdf"]) == []
+    assert rag.search_scored(query, tags=["sin-documentos"]) == []
+
+def test_filter_follows_tag_changes_and_deletions(rag, monkeypatch):
+    corpus(rag, monkeypatch)
+    query = "bomba paso 2 conector"
+    assert documents_of(rag.search_scored(query, k=10, tags=["industrial"], min_score=-1.0)) == {"bomba-b.pdf"}
+
+    rag.set_document_tags("bomba-a.pdf", ["industrial"])
+    assert documents_of(rag.search_scored(query, k=10, tags=["industrial"], min_score=-1.0)) == \
+        {"bomba-a.pdf", "bomba-b.pdf"}
+
+    # Los chunks borrados quedan fuera aunque el segmento fusionado aún los contenga
+    monkeypatch.setattr(rag_system, "RAG_MAX_DELETED_RATIO", 0.9)
+    assert rag.delete_document("bomba-b.pdf")
+    assert rag.deleted_ids
+    assert documents_of(rag.search_scored(query, k=10, tags=["industrial"], min_score=-1.0)) == {"bomba-a.pdf"}
@@ -0,0 +1,45 @@
+from utils.lexical_index import reciprocal_rank_fusion
+from utils.rag_system import RAGSystem
+
+FILLER = ["el equipo enciende la luz verde y conecta a la red wifi del hogar",
+          "para limpiar el filtro retira la tapa trasera y enjuaga con agua",
+          "la garantía cubre defectos de fabricación durante dos años",
+          "si la pantalla parpadea revisa el cable de video y reinicia"]
+
+def add(rag: RAGSystem, texts, name):
+    rag._add_chunks(list(texts), name)
+
+def test_rrf_returns_fused_scores():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=2, rrf_k=60)
+    assert [chunk_id for chunk_id, _ in fused] == [1, 3]
+    assert fused[0][1] == 1 / 61 + 1 / 62
+
+def test_exact_code_shortcut_uses_requested_k(rag, monkeypatch):
+    add(rag, [f"error E-417 en la unidad {i}: reinicia el compresor" for i in range(4)], "codigos.pdf")
+    add(rag, FILLER * 5, "manual.pdf")
+
+    def no_vectors(*args, **kwargs):
+        raise AssertionError("con k coincidencias exactas no se consulta el índice vectorial")
+    monkeypatch.setattr(rag, "_vector_search", no_vectors)
+
+    hits = rag._hybrid_search("E-417", 3, rag.embed_query("E-417"), fetch=20)
+    assert len(hits) == 4
+    assert all(exact for _, _, exact in hits)
+    assert {rag.document_of(chunk_id) for chunk_id, _, _ in hits} == {"codigos.pdf"}
+
+def test_exact_code_match_survives_min_score(rag):
+    add(rag, FILLER * 5, "manual.pdf")
+    add(rag, ["tabla de códigos: X-200 indica sobrecalentamiento del motor principal, apaga el equipo "
+              "y espera treinta minutos antes de volver a usarlo"], "codigos.pdf")
+
+    # Umbral coseno imposible: solo pasa la coincidencia exacta del código
+    results = rag.search_scored("qué significa X-200", k=3, min_score=0.99)
+    assert [result.document for result in results] == ["codigos.pdf"]
+    assert results[0].relevance > 0
+
+def test_relevance_follows_fusion(rag):
+    add(rag, FILLER, "manual.pdf")
+    results = rag.search_scored("limpiar el filtro", k=2, min_score=-1.0, mmr_lambda=1.0)
+    assert results[0].text == FILLER[1]
+    assert results[0].relevance == 1.0
+    assert [r.relevance for r in results] == sorted((r.relevance for r in results), reverse=True)
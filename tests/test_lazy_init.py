@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+import httpx
+from utils import llm
+
+def test_app_starts_without_loading_rag(app_dir, monkeypatch):
+    import main
+
+    monkeypatch.setattr(llm, "_rag", None)
+    app = main.create_app()
+
+    async def health():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/health")).json()
+
+    status = asyncio.run(health())
+    assert status["status"] == "healthy" and status["rag_loaded"] is False
+    assert not llm.rag_loaded()
+
+def test_get_rag_initializes_once_under_concurrency(monkeypatch):
+    created = []
+
+    class SlowRAG:
+        def __init__(self):
+            created.append(self)
+            time.sleep(0.05)  # Carga lenta: las demás peticiones llegan mientras tanto
+
+        def load_database(self):
+            pass
+
+    monkeypatch.setattr(llm, "RAGSystem", SlowRAG)
+    monkeypatch.setattr(llm, "_rag", None)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(llm.get_rag())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(rag is created[0] for rag in results)
+    assert llm.rag_loaded()
+
+def test_gunicorn_defaults_to_one_worker(monkeypatch):
+    import runpy
+    from pathlib import Path
+
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setenv("RAG_PRELOAD", "0")  # El config hace setdefault: no se filtra a otros tests
+    config = runpy.run_path(str(Path(__file__).resolve().parent.parent / "gunicorn.conf.py"))
+    # La configuración del bot vive en memoria de cada proceso: un solo worker por defecto
+    assert config["workers"] == 1
+    assert config["preload_app"] is True
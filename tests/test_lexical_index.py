@@ -0,0 +1,41 @@
+import numpy as np
+from utils.lexical_index import LexicalIndex, PostingsBuilder, is_code, tokenize
+
+def segment(texts):
+    builder = PostingsBuilder()
+    builder.add(texts)
+    return builder.arrays()
+
+def scores(index, query, k=10):
+    return {chunk_id: round(score, 6) for chunk_id, score, _ in index.search(query, k, lambda chunk_id: True)}
+
+def test_tokenize_keeps_codes_and_parts():
+    assert tokenize("Error X-200 en la versión v1.2") == ["error", "x-200", "x", "200", "version", "v1.2", "v1", "2"]
+    assert is_code("x-200") and not is_code("error")
+
+def test_coverage_of_query_terms():
+    index = LexicalIndex()
+    index.attach("s1", np.array([0, 1]), segment(["filtro de agua", "bomba de agua"]))
+    hits = {chunk_id: coverage for chunk_id, _, coverage in index.search("filtro agua", 5, lambda chunk_id: True)}
+    assert hits == {0: 1.0, 1: 0.5}
+
+def test_deleted_chunks_do_not_count_in_statistics():
+    live = ["filtro de agua", "bomba de agua", "manguera"]
+    deleted = ["filtro filtro filtro de repuesto"] * 20
+
+    index = LexicalIndex()
+    index.attach("s1", np.arange(3), segment(live))
+    index.attach("s2", np.arange(3, 23), segment(deleted))
+    index.discard(range(3, 23))
+
+    clean = LexicalIndex()
+    clean.attach("s1", np.arange(3), segment(live))
+    # Mismos scores que si los borrados nunca hubieran existido (N, df y longitud media)
+    assert scores(index, "filtro agua") == scores(clean, "filtro agua")
+
+def test_attach_with_tombstones():
+    index = LexicalIndex()
+    index.attach("s1", np.arange(4), segment(["filtro", "filtro", "bomba", "agua"]), deleted=np.array([1]))
+    clean = LexicalIndex()
+    clean.attach("s1", np.array([0, 2, 3]), segment(["filtro", "bomba", "agua"]))
+    assert scores(index, "filtro") == scores(clean, "filtro")
@@ -0,0 +1,134 @@
+import asyncio
+import httpx
+import pytest
+from utils import http_clients, llm_client
+from utils.llm_client import LLMClient, LLMEndpoint, LLMError
+
+REPLY = {"choices": [{"message": {"content": "hola"}}]}
+
+@pytest.fixture(autouse=True)
+def clean_clients():
+    yield
+    for client in http_clients._clients.values():
+        asyncio.run(client.aclose())
+    http_clients._clients.clear()
+
+def mock_endpoint(name: str, handler) -> LLMEndpoint:
+    http_clients._clients[name] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return LLMEndpoint(name, f"http://{name}.test/v1/chat/completions", "model", api_key="key")
+
+def test_hung_primary_leaves_budget_for_fallback(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_FALLBACK_RESERVE", 0.4)
+    calls = {"primary": 0, "fallback": 0}
+
+    async def primary(request):
+        calls["primary"] += 1
+        await asyncio.sleep(5)
+        return httpx.Response(200, json=REPLY)
+
+    def fallback(request):
+        calls["fallback"] += 1
+        return httpx.Response(200, json=REPLY)
+
+    client = LLMClient([mock_endpoint("primary", primary), mock_endpoint("fallback", fallback)],
+                       timeout=0.5, max_retries=0, hedge_after="0")
+    assert asyncio.run(client.complete({"messages": []})) == "hola"
+    assert calls == {"primary": 1, "fallback": 1}
+    # El principal consumió todo su plazo sin responder: cuenta como fallo
+    assert client.endpoints[0].breaker.failures == 1
+    assert client.endpoints[1].breaker.failures == 0
+    assert client.fallbacks == 1
+
+def test_stalled_endpoints_open_breakers(monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_FALLBACK_RESERVE", 0.3)
+
+    async def slow(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json=REPLY)
+
+    client = LLMClient([mock_endpoint("primary", slow), mock_endpoint("fallback", slow)],
+                       timeout=0.3, max_retries=0, hedge_after="0")
+    for _ in range(llm_client.LLM_BREAKER_FAILURES):
+        with pytest.raises(LLMError) as error:
+            asyncio.run(client.complete({"messages": []}))
+        assert error.value.connection
+    assert [endpoint.breaker.state for endpoint in client.endpoints] == ["open", "open"]
+    # Con ambos circuitos abiertos se falla de inmediato, sin esperar al plazo
+    with pytest.raises(LLMError) as error:
+        asyncio.run(client.complete({"messages": []}))
+    assert str(error.value) == "circuito abierto"
+
+@pytest.mark.parametrize("body", [
+    b"<html>502 Bad Gateway</html>",
+    b'{"choices": [{"finish_reason": "length"}]}',
+    b'{"choices": null}',
+    b'[]',
+])
+def test_malformed_body_raises_llm_error(body):
+    client = LLMClient([mock_endpoint("primary", lambda request: httpx.Response(200, content=body))],
+                       timeout=1, max_retries=0)
+    with pytest.raises(LLMError) as error:
+        asyncio.run(client.complete({"messages": []}))
+    assert not error.value.connection
+
+def test_null_content_is_empty_reply():
+    body = {"choices": [{"message": {"content": None}}]}
+    client = LLMClient([mock_endpoint("primary", lambda request: httpx.Response(200, json=body))],
+                       timeout=1, max_retries=0)
+    assert asyncio.run(client.complete({"messages": []})) == ""
+
+def test_half_open_trial_resolved_on_client_error():
+    def unauthorized(request):
+        return httpx.Response(401, json={"error": "bad key"})
+
+    endpoint = mock_endpoint("primary", unauthorized)
+    breaker = endpoint.breaker
+    breaker.failures = breaker.max_failures
+    breaker.opened_at = -breaker.cooldown - 1  # Enfriamiento cumplido: half-open
+    assert breaker.state == "half-open"
+
+    client = LLMClient([endpoint], timeout=1, max_retries=0)
+    with pytest.raises(LLMError):
+        asyncio.run(client.complete({"messages": []}))
+    # El 4xx no da veredicto, pero la prueba queda libre para la siguiente petición
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+
+def test_half_open_trial_resolved_on_cancellation():
+    async def slow(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200, json=REPLY)
+
+    endpoint = mock_endpoint("primary", slow)
+    breaker = endpoint.breaker
+    breaker.failures = breaker.max_failures
+    breaker.opened_at = -breaker.cooldown - 1
+    client = LLMClient([endpoint], timeout=10, max_retries=0)
+
+    async def cancelled():
+        task = asyncio.create_task(client.complete({"messages": []}))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancelled())
+    assert breaker.allow()
+
+def test_retries_then_falls_back_after_server_errors():
+    calls = {"primary": 0, "fallback": 0}
+
+    def failing(request):
+        calls["primary"] += 1
+        return httpx.Response(503, headers={"retry-after": "0"})
+
+    def fallback(request):
+        calls["fallback"] += 1
+        return httpx.Response(200, json=REPLY)
+
+    client = LLMClient([mock_endpoint("primary", failing), mock_endpoint("fallback", fallback)],
+                       timeout=5, max_retries=2)
+    assert asyncio.run(client.complete({"messages": []})) == "hola"
+    assert calls == {"primary": 3, "fallback": 1}
+    assert client.retries == 2
+    assert client.endpoints[0].breaker.failures == 3
@@ -0,0 +1,76 @@
+import asyncio
+import json
+from utils import metrics
+from utils.metrics import Registry, Trace, finish_trace, span, timed, trace_id, use_trace
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("tomi_test_seconds", "Prueba", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage="embed")
+    lines = registry.render().splitlines()
+    assert 'tomi_test_seconds_bucket{stage="embed",le="0.1"} 1' in lines
+    assert 'tomi_test_seconds_bucket{stage="embed",le="1.0"} 3' in lines
+    assert 'tomi_test_seconds_bucket{stage="embed",le="+Inf"} 4' in lines
+    assert 'tomi_test_seconds_count{stage="embed"} 4' in lines
+    assert 'tomi_test_seconds_sum{stage="embed"} 4.25' in lines
+
+def test_stats_exported_as_gauges_and_counters():
+    registry = Registry()
+    registry.register_stats("queue", lambda: {"queued": 3, "processed": 10, "name": "x", "ok": True},
+                            ("processed",))
+    registry.register_stats("broken", lambda: 1 / 0)
+    lines = registry.render().splitlines()
+    assert "tomi_queue_queued 3" in lines
+    assert "tomi_queue_processed_total 10" in lines
+    assert not [line for line in lines if "name" in line or "_ok" in line or "broken" in line]
+
+def test_spans_reach_the_trace_across_threads():
+    @timed("faiss_search")
+    def search():
+        return trace_id()
+
+    async def handle(trace):
+        with use_trace(trace):
+            with span("embed"):
+                await asyncio.sleep(0.01)
+            # asyncio.to_thread copia el contexto: el hilo ve el mismo trace
+            return await asyncio.to_thread(search)
+
+    trace = Trace(update_id=5)
+    assert asyncio.run(handle(trace)) == trace.trace_id
+    assert set(trace.stages) == {"embed", "faiss_search"}
+    assert trace.stages["embed"] >= 0.01
+    assert trace_id() == "-"  # Fuera del update no hay trace activo
+
+def test_finish_trace_logs_one_line_per_update(capsys, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_LOG_TRACES", True)
+    trace = Trace(update_id=9)
+    trace.add("llm", 0.25)
+    finish_trace(trace, "ok")
+
+    record = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert record["event"] == "update" and record["trace_id"] == trace.trace_id
+    assert record["update_id"] == 9 and record["outcome"] == "ok"
+    assert record["stages_ms"] == {"llm": 250.0}
+    assert 'tomi_update_seconds_count{outcome="ok"}' in metrics.render_metrics()
+
+def test_processed_update_shows_in_metrics_endpoint(app_dir):
+    import httpx
+    import main
+
+    app = main.create_app()
+    update = {"update_id": 77, "message": {"message_id": 1, "chat": {"id": 7}, "text": "hola"}}
+    trace = Trace(update["update_id"])
+
+    async def scenario():
+        await main.process_update(update, trace)  # Bot inactivo por defecto: no llama a Telegram
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert "queue_wait" in trace.stages
+    assert 'tomi_stage_seconds_count{stage="queue_wait"}' in response.text
+    assert 'tomi_update_seconds_count{outcome="inactive"}' in response.text
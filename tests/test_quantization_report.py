@@ -0,0 +1,11 @@
+def test_modes_that_fall_back_are_not_measured(rag):
+    rag._add_chunks([f"chunk {i} sobre el filtro {i % 7} y la bomba {i % 11}" for i in range(300)], "manual.pdf")
+    report = rag.quantization_report(k=5, n_queries=20)
+
+    by_mode = {row["storage"]: row for row in report}
+    assert list(by_mode) == ["float32", "fp16", "int8", "pq"]
+    # 300 vectores no alcanzan para entrenar PQ: sin fila duplicada de int8 etiquetada como pq
+    assert by_mode["pq"] == {"storage": "pq", "type": "flat", "fallback": "int8"}
+    for mode in ("float32", "fp16", "int8"):
+        assert "fallback" not in by_mode[mode]
+        assert by_mode[mode]["recall@5"] > 0.8
@@ -0,0 +1,85 @@
+import threading
+import numpy as np
+from utils.metrics import Trace, timed, use_trace
+from utils.query_batcher import QueryBatcher
+
+@timed("encode_queries")
+def encode(queries):
+    return np.stack([np.full(4, len(query), dtype="float32") for query in queries])
+
+@timed("faiss_search")
+def search(vectors, k):
+    return [[int(vector[0])] * k for vector in vectors]
+
+def test_batch_stages_reach_each_callers_trace():
+    batcher = QueryBatcher(encode, search, max_wait_ms=50)
+    traces, results = [Trace(), Trace()], {}
+
+    def ask(trace, query):
+        with use_trace(trace):
+            results[query] = batcher.search(query, 2)
+
+    threads = [threading.Thread(target=ask, args=(trace, query)) for trace, query in zip(traces, ["ab", "abc"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"ab": [2, 2], "abc": [3, 3]}
+    for trace in traces:
+        assert set(trace.stages) == {"encode_queries", "faiss_search"}
+
+def ask_concurrently(calls):
+    """Ejecutar las llamadas en hilos a la vez; resultados (o excepciones) en orden"""
+    results = [None] * len(calls)
+
+    def run(i, call):
+        try:
+            results[i] = call()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i, call)) for i, call in enumerate(calls)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_concurrent_queries_share_one_encode_and_search():
+    encoded, searched = [], []
+
+    def counting_encode(queries):
+        encoded.append(list(queries))
+        return encode(queries)
+
+    def counting_search(vectors, k):
+        searched.append((len(vectors), k))
+        return search(vectors, k)
+
+    batcher = QueryBatcher(counting_encode, counting_search, max_wait_ms=250)
+    given = np.full((1, 4), 9, dtype="float32")
+    results = ask_concurrently([
+        lambda: batcher.search("a", 1),
+        lambda: batcher.search("abcd", 3),
+        lambda: batcher.search("ya embebida", 2, given),
+        lambda: batcher.embed("ab"),
+    ])
+
+    assert results[:3] == [[1], [4, 4, 4], [9, 9]]  # Cada uno recorta el mayor k del lote a su k
+    np.testing.assert_array_equal(results[3], np.full((1, 4), 2, dtype="float32"))
+    assert len(encoded) == 1 and sorted(encoded[0]) == ["a", "ab", "abcd"]  # Sin re-embeber la dada
+    assert searched == [(3, 3)]
+    assert batcher.stats() == {"batches": 1, "requests": 4, "avg_batch_size": 4.0}
+
+def test_batch_error_reaches_every_caller():
+    def failing_search(vectors, k):
+        raise RuntimeError("índice no disponible")
+
+    batcher = QueryBatcher(encode, failing_search, max_wait_ms=250)
+    results = ask_concurrently([lambda: batcher.search("a", 1), lambda: batcher.search("b", 1)])
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+    # El hilo del lote sigue vivo para las siguientes consultas
+    batcher.search_fn = search
+    assert batcher.search("abc", 2) == [3, 3]
@@ -0,0 +1,27 @@
+import asyncio
+from utils import llm
+from utils.response_cache import ResponseCache
+
+def test_cache_invalidated_by_other_workers_upload(rag_factory, monkeypatch):
+    worker_a, worker_b = rag_factory(), rag_factory()
+    worker_a.load_database()
+    worker_b.load_database()
+    monkeypatch.setattr(llm, "_rag", worker_a)
+    monkeypatch.setattr(llm, "response_cache", ResponseCache())
+
+    llm.response_cache.put("¿cómo limpio el filtro?", None, worker_a.version, "respuesta vieja")
+    assert asyncio.run(llm._prepare("¿cómo limpio el filtro?")) == "respuesta vieja"
+
+    # Otro worker sube un documento: la respuesta cacheada ya no vale en este proceso
+    worker_b._add_chunks(["limpieza del filtro: retirar la tapa y enjuagar"], "manual.pdf")
+    assert asyncio.run(llm._prepare("¿cómo limpio el filtro?")) != "respuesta vieja"
+    assert worker_a.list_documents() == ["manual.pdf"]
+
+def test_similar_question_hits_cache():
+    cache = ResponseCache()
+    embedding = [1.0, 0.0, 0.0]
+    cache.put("¿Cómo limpio el filtro?", embedding, 1, "enjuagar")
+    assert cache.get_exact("  ¿cómo LIMPIO el filtro?", 1) == "enjuagar"
+    assert cache.get_similar([1.0, 0.0, 0.0], 1) == "enjuagar"
+    # Una versión nueva del corpus vacía la caché
+    assert cache.get_exact("¿Cómo limpio el filtro?", 2) is None
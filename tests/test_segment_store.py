@@ -0,0 +1,83 @@
+import os
+import numpy as np
+from utils.rag_system import RAGSystem
+from utils.segment_store import SegmentStore, ids_to_ranges, ranges_to_ids
+
+def write(store, ids, texts, dim=4):
+    ids = np.asarray(ids, dtype='int64')
+    vectors = np.arange(len(ids) * dim, dtype='float32').reshape(len(ids), dim)
+    return store.write_segment(ids, vectors, texts)
+
+def test_ranges_roundtrip():
+    ids = [0, 1, 2, 5, 7, 8]
+    assert ids_to_ranges(ids) == [[0, 2], [5, 5], [7, 8]]
+    assert ranges_to_ids(ids_to_ranges(ids)) == ids
+
+def test_segment_roundtrip(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    segment = write(store, [3, 4], ["uno", "dos ñandú"])
+    assert segment["count"] == 2 and segment["min_id"] == 3 and segment["max_id"] == 4
+    ids, vectors, texts = store.read_segment(segment["name"])
+    assert ids.tolist() == [3, 4]
+    assert vectors.shape == (2, 4)
+    assert texts == ["uno", "dos ñandú"]
+    assert store.read_postings(segment["name"]) is not None
+
+def test_crash_before_manifest_swap_keeps_previous_state(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    first = write(store, [0, 1], ["a", "b"])
+    store.commit({"segments": [first]})
+
+    # Segmento escrito pero el proceso muere antes del commit (y deja un manifest.tmp a medias)
+    orphan = write(store, [2], ["c"])
+    with open(store.manifest_path + ".tmp", "w") as f:
+        f.write('{"segments": [')
+
+    manifest = store.load_manifest()
+    assert [segment["name"] for segment in manifest["segments"]] == [first["name"]]
+    assert manifest["generation"] == 1
+
+    # Los huérfanos recientes se respetan (podría ser la escritura de otro worker)
+    store.cleanup_orphans(manifest)
+    assert os.path.isdir(store.segment_dir(orphan["name"]))
+    store.cleanup_orphans(manifest, min_age=-1)
+    assert not os.path.exists(store.segment_dir(orphan["name"]))
+    assert os.path.isdir(store.segment_dir(first["name"]))
+
+def test_aborted_writer_leaves_nothing(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    writer = store.open_segment()
+    writer.append(np.array([0]), np.ones((1, 4), dtype='float32'), ["x"])
+    writer.abort()
+    assert os.listdir(store.segments_path) == []
+
+def test_merge_purges_deleted_rows(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    a = write(store, [0, 1, 2], ["a0", "a1", "a2"])
+    b = write(store, [3, 4], ["b3", "b4"])
+    merged, purged = store.merge_segments([a["name"], b["name"]], {1, 4})
+    assert purged == {1, 4}
+    ids, _, texts = store.read_segment(merged["name"])
+    assert ids.tolist() == [0, 2, 3]
+    assert texts == ["a0", "a2", "b3"]
+
+def test_rag_reloads_committed_state(rag):
+    rag._add_chunks(["la bomba de agua hace ruido", "cambiar el filtro cada mes"], "manual.pdf")
+    rag._add_chunks(["garantía de dos años"], "garantia.pdf")
+    rag._add_chunks(["documento que se borrará"], "borrar.pdf")
+    assert rag.delete_document("borrar.pdf")
+    if rag._compaction_thread is not None:
+        rag._compaction_thread.join()
+
+    # Segmento huérfano de una subida que no llegó a publicarse
+    write(rag.store, [100], ["huérfano"], dim=rag.chunks.vectors([0])[1].shape[1])
+
+    reloaded = RAGSystem("synthetic", db_path=rag.db_path, embedder=rag.embedder)
+    reloaded.load_database()
+    assert sorted(reloaded.list_documents()) == ["garantia.pdf", "manual.pdf"]
+    assert len(reloaded.chunks) == 3
+    results = reloaded.search_scored("filtro", k=3, min_score=-1.0)
+    assert results and results[0].document == "manual.pdf"
+    assert all(result.text != "huérfano" for result in results)
+    if reloaded._compaction_thread is not None:
+        reloaded._compaction_thread.join()
@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+from utils.segment_store import SegmentStore, StaleManifestError, ranges_to_ids
+import pytest
+
+def texts(name, n=3):
+    return [f"{name} sección {i}: limpieza del filtro y revisión de la bomba {i}" for i in range(n)]
+
+def test_two_workers_keep_each_others_uploads(rag_factory):
+    worker_a, worker_b = rag_factory(), rag_factory()
+    worker_a.load_database()
+    worker_b.load_database()
+
+    worker_a._add_chunks(texts("a"), "a.pdf")
+    worker_b._add_chunks(texts("b"), "b.pdf")
+
+    assert sorted(worker_b.list_documents()) == ["a.pdf", "b.pdf"]
+    ids_a = set(ranges_to_ids(worker_b.documents["a.pdf"]))
+    ids_b = set(ranges_to_ids(worker_b.documents["b.pdf"]))
+    assert len(ids_a) == len(ids_b) == 3 and not ids_a & ids_b
+
+    reloaded = rag_factory()
+    reloaded.load_database()
+    assert sorted(reloaded.list_documents()) == ["a.pdf", "b.pdf"]
+    assert len(reloaded.chunks) == 6
+
+def test_search_sees_other_workers_changes(rag_factory):
+    worker_a, worker_b = rag_factory(), rag_factory()
+    worker_a.load_database()
+    worker_b.load_database()
+    worker_a._add_chunks(texts("manual"), "manual.pdf")
+
+    results = worker_b.search_scored("limpieza del filtro", k=2, min_score=-1.0)
+    assert results and results[0].document == "manual.pdf"
+
+    version = worker_a.version
+    assert worker_b.delete_document("manual.pdf")
+    assert worker_a.search_scored("limpieza del filtro", k=2, min_score=-1.0) == []
+    assert worker_a.version > version  # Invalida cachés que dependan del corpus
+
+def test_stale_commit_is_rejected(tmp_path):
+    store_a, store_b = SegmentStore(str(tmp_path)), SegmentStore(str(tmp_path))
+    store_a.commit({"segments": []})
+    seen = store_b.load_manifest()
+    store_a.commit(store_a.load_manifest())
+    with pytest.raises(StaleManifestError):
+        store_b.commit(seen)
+    assert store_b.load_manifest()["generation"] == 2
+    assert not [name for name in os.listdir(tmp_path) if ".tmp-" in name]
+
+def test_reserved_ids_are_unique_across_stores(tmp_path):
+    store_a, store_b = SegmentStore(str(tmp_path)), SegmentStore(str(tmp_path))
+    assert store_a.reserve_ids(10) == 0
+    assert store_b.reserve_ids(5) == 10
+    assert store_a.reserve_ids(1, floor=100) == 100
+
+def _upload(db_path, name, queue):
+    from conftest import synthetic_rag
+    rag = synthetic_rag(db_path)
+    rag.load_database()
+    for i in range(3):
+        rag._add_chunks(texts(f"{name}{i}", 20), f"{name}{i}.pdf")
+    queue.put(name)
+
+def test_concurrent_processes(tmp_path):
+    db_path = str(tmp_path / "faiss_db")
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    workers = [context.Process(target=_upload, args=(db_path, name, queue)) for name in ("a", "b")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+        assert worker.exitcode == 0
+
+    from conftest import synthetic_rag
+    rag = synthetic_rag(db_path)
+    rag.load_database()
+    assert sorted(rag.list_documents()) == [f"{name}{i}.pdf" for name in "ab" for i in range(3)]
+    assert len(rag.chunks) == 120
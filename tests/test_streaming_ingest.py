@@ -0,0 +1,69 @@
+import os
+import threading
+from helpers import pdf_bytes
+from utils import rag_system
+from utils.pdf_processor import Chunk
+from utils.segment_store import ranges_to_ids
+
+def manual(pages=3, lines=20):
+    return pdf_bytes([[f"Pagina {page} paso {i}: revisa el conector {i} y la tapa del filtro"
+                       for i in range(lines)] for page in range(pages)])
+
+def db_files(rag):
+    """Archivos de la base una vez terminado el trabajo en segundo plano (snapshot, fusión)"""
+    if rag._compaction_thread is not None:
+        rag._compaction_thread.join()
+    return sorted(os.listdir(rag.db_path)), sorted(os.listdir(os.path.join(rag.db_path, "segments")))
+
+def test_upload_streams_pages_into_one_segment(rag, monkeypatch):
+    monkeypatch.setattr(rag_system, "RAG_ENCODE_BATCH", 4)  # Varios lotes por documento
+    assert rag.add_pdf_from_upload(manual(), "manual.pdf", tags=["Bomba"])
+    assert rag.list_documents() == ["manual.pdf"]
+    assert len(rag.segments) == 1
+    assert rag.document_tags["manual.pdf"] == ["bomba"]
+
+    ids = ranges_to_ids(rag.documents["manual.pdf"])
+    pages = {rag.chunks.position(chunk_id)[0] for chunk_id in ids}
+    assert pages == {1, 2, 3}
+
+    # Mismo contenido: no se vuelve a indexar
+    segments = list(rag.segments)
+    assert rag.add_pdf_from_upload(manual(), "manual.pdf")
+    assert rag.segments == segments
+
+    # Contenido nuevo: reemplaza la versión anterior en el mismo commit
+    assert rag.add_pdf_from_upload(manual(pages=1), "manual.pdf")
+    new_ids = set(ranges_to_ids(rag.documents["manual.pdf"]))
+    assert not new_ids & set(ids)
+    assert {rag.chunks.position(chunk_id)[0] for chunk_id in new_ids} == {1}
+
+def test_extraction_error_publishes_nothing(rag, monkeypatch):
+    assert rag.add_pdf_from_upload(manual(pages=1), "base.pdf")
+    before = db_files(rag)
+
+    def broken_pages(source):
+        yield "Pagina uno: revisa el conector y la tapa del filtro.\n" * 40
+        raise ValueError("PDF truncado")
+
+    monkeypatch.setattr(rag_system, "iter_pdf_pages", broken_pages)
+    monkeypatch.setattr(rag_system, "RAG_ENCODE_BATCH", 2)
+    assert not rag.add_pdf_from_upload(b"%PDF-roto", "roto.pdf")
+    assert rag.list_documents() == ["base.pdf"]
+    assert db_files(rag) == before  # Ni segmento a medias ni manifest nuevo
+
+def test_prefetch_stops_producer_when_consumer_aborts(rag):
+    produced = []
+
+    def endless_chunks():
+        i = 0
+        while True:
+            produced.append(i)
+            yield Chunk(f"chunk {i}", 1, 0, 7)
+            i += 1
+
+    batches = rag._prefetch_batches(endless_chunks(), batch_size=2)
+    assert len(next(batches)) == 2
+    batches.close()
+    assert not [thread for thread in threading.enumerate() if thread.name == "rag-pdf-extract"]
+    # La cola acotada frena al productor: no llega a leer todo el documento
+    assert len(produced) < 2 * (rag_system.RAG_INGEST_QUEUE + 3)
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import time
+import httpx
+import pytest
+from utils import http_clients
+from utils.telegram import stream_message
+
+@pytest.fixture
+def telegram():
+    """Bot API simulada: registra las llamadas y responde según `replies[method]`"""
+    calls, replies = [], {}
+
+    def handler(request):
+        method = request.url.path.rsplit("/", 1)[-1]
+        payload = json.loads(request.content)
+        calls.append((method, payload.get("text"), time.monotonic()))
+        queued = replies.get(method)
+        if queued:
+            return httpx.Response(200, json=queued.pop(0))
+        return httpx.Response(200, json={"ok": True, "result": {"message_id": 42}})
+
+    http_clients._clients["telegram"] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    yield calls, replies
+    asyncio.run(http_clients._clients.pop("telegram").aclose())
+
+async def fragments(parts, pause=0.0):
+    for part in parts:
+        await asyncio.sleep(pause)
+        yield part
+
+def texts(calls, method):
+    return [text for name, text, _ in calls if name == method]
+
+PARTS = ["Para limpiar el filtro, ", "apaga la bomba primero. ", "Luego retira la tapa ",
+         "y enjuágalo con agua. ", "Vuelve a montarlo."]
+FULL = "".join(PARTS).strip()
+
+def test_first_sentence_then_rate_limited_edits(telegram):
+    calls, _ = telegram
+    result = asyncio.run(stream_message(7, fragments(PARTS, pause=0.03), edit_interval=0.05))
+
+    assert result["ok"]
+    assert texts(calls, "sendChatAction")  # "escribiendo..." antes del primer texto
+    sent = texts(calls, "sendMessage")
+    assert sent == ["Para limpiar el filtro, apaga la bomba primero."]  # Solo oraciones completas
+    edits = texts(calls, "editMessageText")
+    assert edits and edits[-1] == FULL
+    times = [at for name, _, at in calls if name in ("sendMessage", "editMessageText")]
+    assert all(b - a >= 0.045 for a, b in zip(times, times[1:]))
+
+def test_whole_reply_at_once_is_a_single_message(telegram):
+    calls, _ = telegram
+    asyncio.run(stream_message(7, fragments([FULL]), edit_interval=0.05))
+    assert texts(calls, "sendMessage") == [FULL]
+    assert texts(calls, "editMessageText") == []
+
+def test_final_edit_retried_after_429(telegram):
+    calls, replies = telegram
+    replies["editMessageText"] = [
+        {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.2}},
+    ]
+    parts = ["Primera oración completa aquí. ", "Y el resto."]
+    start = time.monotonic()
+    result = asyncio.run(stream_message(7, fragments(parts, pause=0.02), edit_interval=0.01))
+
+    assert result["ok"]
+    edits = [(text, at) for name, text, at in calls if name == "editMessageText"]
+    assert [text for text, _ in edits] == ["".join(parts)] * 2
+    # El reintento respeta el retry_after de Telegram
+    assert edits[1][1] - edits[0][1] >= 0.19
+    assert time.monotonic() - start < 2
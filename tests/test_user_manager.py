@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+import pytest
+from passlib.context import CryptContext
+
+@pytest.fixture
+def users(app_dir, monkeypatch):
+    """UserManager sobre data/users.json temporal (pbkdf2 en lugar de bcrypt: más rápido)"""
+    from models import user
+
+    monkeypatch.setattr(user, "pwd_context", CryptContext(schemes=["pbkdf2_sha256"]))
+    return user.UserManager()
+
+def users_file():
+    with open("data/users.json") as f:
+        return json.load(f)
+
+def test_create_and_authenticate(users):
+    assert users.create_user("ana@tomi.com.pe", "Ana", "secreto-123")
+    assert not users.create_user("ana@tomi.com.pe", "Ana", "otro")
+    assert sorted(users_file()) == ["admin@tomi.com.pe", "ana@tomi.com.pe"]
+
+    assert asyncio.run(users.authenticate_user_async("ana@tomi.com.pe", "secreto-123")).name == "Ana"
+    assert users.authenticate_user("ana@tomi.com.pe", "incorrecta") is None
+    assert os.listdir("data") == ["users.json"]  # Sin temporales
+
+def test_failed_write_leaves_previous_file(users, monkeypatch):
+    from models import user
+
+    before = users_file()
+
+    def broken_dump(data, f, **kwargs):
+        f.write('{"a medias": ')
+        raise OSError("disco lleno")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(user.json, "dump", broken_dump)
+        assert not users.create_user("ana@tomi.com.pe", "Ana", "secreto-123")
+
+    assert users_file() == before
+    assert os.listdir("data") == ["users.json"]
+    assert users.get_user("ana@tomi.com.pe") is None
+
+def test_changes_from_other_workers_are_reloaded(users):
+    from models.user import UserManager
+
+    version = users.current_version()
+    other = UserManager()  # Otro worker con su propia copia en memoria
+    assert other.create_user("luis@tomi.com.pe", "Luis", "clave-456")
+
+    # users.json cambió en disco (mtime o tamaño): se relee y la versión avanza
+    assert users.get_user("luis@tomi.com.pe").name == "Luis"
+    assert users.current_version() > version
+    assert users.current_version() == users.current_version()  # Sin cambios, sin recarga
@@ -0,0 +1,30 @@
+import faiss
+import numpy as np
+from utils.vector_index import (auto_nprobe, choose_index_type, choose_storage, create_index, normalize,
+                                search_params)
+
+def test_choose_index_type_by_size():
+    assert choose_index_type(20000, "auto") == "flat"
+    assert choose_index_type(50000, "auto") == "ivf"
+    assert choose_index_type(2_000_000, "auto") == "ivfpq"
+    # Sin datos para entrenar se degrada
+    assert choose_index_type(100, "ivf") == "flat"
+
+def test_choose_storage_falls_back_without_training_data():
+    assert choose_storage(1000, "flat", "pq") == "int8"
+    assert choose_storage(20000, "flat", "pq") == "pq"
+    assert choose_storage(1000, "ivfpq", "float32") == "pq"
+
+def test_auto_nprobe_scales_with_nlist():
+    assert auto_nprobe(64) == 16
+    assert auto_nprobe(894) == 90
+    assert auto_nprobe(8) == 8
+
+def test_search_params_auto_and_fixed_nprobe():
+    vectors = normalize(np.random.default_rng(0).standard_normal((2000, 16)))
+    index = create_index("ivf", 16, len(vectors))
+    index.train(vectors)
+    index.add(vectors)
+    nlist = faiss.extract_index_ivf(index).nlist
+    assert search_params(index, 0).nprobe == auto_nprobe(nlist)
+    assert search_params(index, 3).nprobe == 3
@@ -0,0 +1,49 @@
+import asyncio
+import httpx
+from utils.dedupe import MemoryDedupeStore, update_keys
+
+def update(update_id: int):
+    return {"update_id": update_id, "message": {"message_id": update_id, "chat": {"id": 7}, "text": "hola"}}
+
+def test_full_queue_returns_503_and_forgets_update(app_dir, monkeypatch):
+    import main
+
+    store = MemoryDedupeStore(window=60)
+    monkeypatch.setattr(main, "dedupe", store)
+    app = main.create_app()
+    job_queue = app.state.job_queue
+    job_queue.workers, job_queue.maxsize = 1, 1
+
+    async def scenario():
+        release = asyncio.Event()
+        handled = []
+
+        async def handler(job):
+            handled.append(job[0]["update_id"])
+            await release.wait()
+
+        job_queue.handler = handler
+        await job_queue.start()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def post(update_id):
+                response = await client.post("/webhook", json=update(update_id))
+                return response.status_code, response.json()["status"]
+
+            assert await post(1) == (200, "queued")
+            await asyncio.sleep(0.05)  # El único worker toma el update 1 y se queda ocupado
+            assert await post(2) == (200, "queued")  # Ocupa la cola (tamaño 1)
+            assert await post(3) == (503, "busy")
+            assert await post(1) == (200, "duplicated")
+
+            # El rechazado no quedó registrado: el reintento de Telegram se procesa
+            release.set()
+            await asyncio.sleep(0.05)
+            assert await post(3) == (200, "queued")
+        await job_queue.stop()
+        return handled
+
+    assert asyncio.run(scenario()) == [1, 2, 3]
+    assert job_queue.rejected == 1
+    assert store.stats()["forgotten"] == 1
+    assert not store.add(update_keys(update(3)))
@@ -0,0 +1,191 @@
+import mmap
+import numpy as np
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+import os
+
+# Bits de la columna flags
+FLAG_LIVE = 1       # chunk visible (no borrado)
+FLAG_POSITION = 2   # página y offsets conocidos
+
+class SegmentTexts:
+    """Textos de un segmento mapeados en memoria: blob UTF-8 + offsets (y vectores originales)"""
+
+    def __init__(self, segment_dir: str):
+        self.segment_dir = segment_dir
+        self._vectors = None
+        self.offsets = np.load(os.path.join(segment_dir, "offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(segment_dir, "texts.bin")
+        self._blob = None
+        if os.path.getsize(blob_path) > 0:
+            with open(blob_path, "rb") as f:
+                # El mapeo sigue válido tras cerrar el archivo (y tras borrarlo)
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, row: int) -> str:
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        if self._blob is None or start == end:
+            return ""
+        return self._blob[start:end].decode("utf-8")
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Vectores float32 del segmento (mmap, se abre al primer uso)"""
+        if self._vectors is None:
+            self._vectors = np.load(os.path.join(self.segment_dir, "vectors.npy"), mmap_mode="r")
+        return self._vectors
+
+class _Columns(NamedTuple):
+    segment: np.ndarray  # índice del segmento (-1 = nunca adjuntado)
+    row: np.ndarray      # fila dentro del segmento
+    doc: np.ndarray      # número de documento (-1 = sin documento)
+    page: np.ndarray     # página de origen (0 = desconocida)
+    offset: np.ndarray   # offset de caracteres en el documento
+    length: np.ndarray   # longitud en caracteres
+    flags: np.ndarray    # FLAG_*
+
+_DTYPES = ('int32', 'int32', 'int32', 'int32', 'int64', 'int32', 'uint8')
+_FILL = (-1, 0, -1, 0, 0, 0, 0)
+
+def _empty_columns(size: int) -> _Columns:
+    return _Columns(*(np.full(size, fill, dtype=dtype) for fill, dtype in zip(_FILL, _DTYPES)))
+
+class ChunkStore:
+    """Tabla columnar de chunks indexada por chunk id (arrays NumPy, sin objetos por chunk)
+
+    Cada id apunta a su segmento y fila (textos en blobs mapeados en memoria, leídos
+    del page cache solo al pedirlos) y guarda documento, página, offset, longitud y flags.
+    """
+
+    def __init__(self):
+        self._segments: List[Optional[SegmentTexts]] = []
+        self._names: List[str] = []
+        self._columns = _empty_columns(0)
+        self._live = 0
+
+    def _ensure(self, size: int) -> _Columns:
+        columns = self._columns
+        if size > len(columns.flags):
+            # Crecer con copia: los lectores siguen usando las columnas anteriores
+            grown = _empty_columns(max(size, 2 * len(columns.flags)))
+            for old, new in zip(columns, grown):
+                new[:len(old)] = old
+            self._columns = columns = grown
+        return columns
+
+    def attach(self, name: str, segment_dir: str, ids: np.ndarray, deleted: Optional[np.ndarray] = None,
+               positions: Optional[np.ndarray] = None):
+        """Registrar un segmento; sus ids (no borrados) pasan a apuntar a él
+
+        positions = (página, inicio, fin) por fila; el documento de cada id se conserva.
+        """
+        texts = SegmentTexts(segment_dir)
+        seg_idx = len(self._segments)
+        self._segments.append(texts)
+        self._names.append(name)
+
+        rows = np.arange(len(ids), dtype='int32')
+        if deleted is not None and len(deleted):
+            keep = ~np.isin(ids, deleted)
+            ids, rows = ids[keep], rows[keep]
+        if not len(ids):
+            return
+
+        columns = self._ensure(int(ids.max()) + 1)
+        self._live += int(np.count_nonzero((columns.flags[ids] & FLAG_LIVE) == 0))
+        columns.segment[ids] = seg_idx
+        columns.row[ids] = rows
+        flags = np.full(len(ids), FLAG_LIVE, dtype='uint8')
+        if positions is not None and len(positions):
+            positions = np.asarray(positions)[rows]
+            columns.page[ids] = positions[:, 0]
+            columns.offset[ids] = positions[:, 1]
+            columns.length[ids] = positions[:, 2] - positions[:, 1]
+            flags[positions[:, 0] > 0] |= FLAG_POSITION
+        columns.flags[ids] = flags
+
+    def detach(self, names: Iterable[str]):
+        """Soltar segmentos ya reemplazados (sus ids deben estar re-apuntados)"""
+        names = set(names)
+        for i, name in enumerate(self._names):
+            if name in names:
+                self._segments[i] = None
+
+    def set_document(self, ranges: Sequence[Sequence[int]], doc: int):
+        """Asignar los rangos de ids [inicio, fin] a un número de documento"""
+        if not ranges:
+            return
+        columns = self._ensure(max(end for _, end in ranges) + 1)
+        for start, end in ranges:
+            columns.doc[start:end + 1] = doc
+
+    def discard(self, ids: Iterable[int]):
+        """Marcar chunks como borrados"""
+        flags = self._columns.flags
+        ids = np.fromiter(ids, dtype='int64')
+        ids = ids[(ids >= 0) & (ids < len(flags))]
+        live = ids[(flags[ids] & FLAG_LIVE) != 0]
+        flags[live] &= ~np.uint8(FLAG_LIVE)
+        self._live -= len(live)
+
+    def _locate(self, chunk_id: int) -> Optional[Tuple[SegmentTexts, int]]:
+        columns = self._columns
+        if not 0 <= chunk_id < len(columns.flags) or not columns.flags[chunk_id] & FLAG_LIVE:
+            return None
+        texts = self._segments[columns.segment[chunk_id]]
+        if texts is None:
+            return None
+        return texts, int(columns.row[chunk_id])
+
+    def get(self, chunk_id: int, default: Optional[str] = None) -> Optional[str]:
+        located = self._locate(chunk_id)
+        if located is None:
+            return default
+        texts, row = located
+        return texts.get(row)
+
+    def vectors(self, ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectores originales de los chunks vivos: (ids encontrados, vectores)"""
+        found, rows = [], []
+        for chunk_id in ids:
+            located = self._locate(int(chunk_id))
+            if located is not None:
+                texts, row = located
+                found.append(int(chunk_id))
+                rows.append(texts.vectors[row])
+        if not rows:
+            return np.zeros(0, dtype='int64'), np.zeros((0, 0), dtype='float32')
+        return np.array(found, dtype='int64'), np.vstack(rows).astype('float32')
+
+    def document(self, chunk_id: int) -> int:
+        """Número de documento del chunk (-1 si no existe o está borrado)"""
+        columns = self._columns
+        if chunk_id in self:
+            return int(columns.doc[chunk_id])
+        return -1
+
+    def position(self, chunk_id: int) -> Optional[Tuple[int, int, int]]:
+        """(página, inicio, fin) del chunk en su documento; página 0 = desconocida"""
+        columns = self._columns
+        if chunk_id not in self:
+            return None
+        start = int(columns.offset[chunk_id])
+        return int(columns.page[chunk_id]), start, start + int(columns.length[chunk_id])
+
+    def live_mask(self, docs: Optional[Sequence[int]] = None) -> np.ndarray:
+        """Máscara booleana por chunk id: vivos (y de esos documentos, si se indican)"""
+        columns = self._columns
+        mask = (columns.flags & FLAG_LIVE) != 0
+        if docs is not None:
+            mask &= np.isin(columns.doc, np.asarray(list(docs), dtype='int32'))
+        return mask
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self._columns)
+
+    def __contains__(self, chunk_id: int) -> bool:
+        flags = self._columns.flags
+        return 0 <= chunk_id < len(flags) and bool(flags[chunk_id] & FLAG_LIVE)
+
+    def __len__(self) -> int:
+        return self._live
@@ -0,0 +1,212 @@
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence
+
+# Deduplicación de updates: backend (sqlite = compartido entre workers, memory = por proceso,
+# solo para un único worker), ventana deslizante en segundos y máximo de claves recordadas
+DEDUPE_BACKEND = os.getenv("DEDUPE_BACKEND", "sqlite")
+DEDUPE_WINDOW = float(os.getenv("DEDUPE_WINDOW", "3600"))
+DEDUPE_MAX_ENTRIES = int(os.getenv("DEDUPE_MAX_ENTRIES", "20000"))
+DEDUPE_SQLITE_PATH = os.getenv("DEDUPE_SQLITE_PATH", "data/dedupe.sqlite3")
+
+def update_keys(update: Dict[str, Any]) -> List[str]:
+    """Claves de un update: update_id (global del bot) y (chat_id, message_id)
+
+    message_id solo es único dentro de un chat; update_id identifica los reintentos de Telegram.
+    """
+    keys = []
+    if update.get("update_id") is not None:
+        keys.append(f"u:{update['update_id']}")
+    message = update.get("message") or {}
+    chat_id = (message.get("chat") or {}).get("id")
+    if chat_id is not None and message.get("message_id") is not None:
+        keys.append(f"m:{chat_id}:{message['message_id']}")
+    return keys
+
+class DedupeStore(ABC):
+    """Claves vistas en los últimos `window` segundos (como mucho max_entries)"""
+
+    backend: str
+
+    def __init__(self, window: float = DEDUPE_WINDOW, max_entries: int = DEDUPE_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max(1, max_entries)
+        self.checked = 0
+        self.duplicates = 0
+        self.forgotten = 0
+
+    def add(self, keys: Sequence[str]) -> bool:
+        """Registrar las claves; False si alguna ya se vio dentro de la ventana (duplicado)"""
+        self.checked += 1
+        is_new = self._add(list(keys), time.time())
+        if not is_new:
+            self.duplicates += 1
+        return is_new
+
+    def forget(self, keys: Sequence[str]):
+        """Olvidar claves (p.ej. update rechazado: el reintento de Telegram debe procesarse)"""
+        self.forgotten += 1
+        self._forget(list(keys))
+
+    @abstractmethod
+    def _add(self, keys: List[str], now: float) -> bool:
+        """Comprobar e insertar de forma atómica; False si alguna clave sigue en la ventana"""
+
+    @abstractmethod
+    def _forget(self, keys: List[str]):
+        """Borrar las claves (las que no estén se ignoran)"""
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Claves recordadas ahora mismo"""
+
+    @property
+    def entries(self) -> int:
+        """Claves recordadas para stats() (barato: se llama desde el event loop)"""
+        return len(self)
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "entries": self.entries,
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "forgotten": self.forgotten
+        }
+
+class MemoryDedupeStore(DedupeStore):
+    """Anillo en proceso: claves en orden de llegada, se expulsan por antigüedad o por tamaño"""
+
+    backend = "memory"
+
+    def __init__(self, window: float = DEDUPE_WINDOW, max_entries: int = DEDUPE_MAX_ENTRIES):
+        super().__init__(window, max_entries)
+        self._lock = threading.Lock()
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+
+    def _expire(self, now: float):
+        # El orden de inserción es el orden temporal: basta mirar la cabeza
+        while self._seen and (len(self._seen) > self.max_entries or
+                              next(iter(self._seen.values())) < now - self.window):
+            self._seen.popitem(last=False)
+
+    def _add(self, keys: List[str], now: float) -> bool:
+        with self._lock:
+            self._expire(now)
+            if any(key in self._seen for key in keys):
+                return False
+            for key in keys:
+                self._seen[key] = now
+            self._expire(now)
+            return True
+
+    def _forget(self, keys: List[str]):
+        with self._lock:
+            for key in keys:
+                self._seen.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+class SQLiteDedupeStore(DedupeStore):
+    """Tabla SQLite compartida por todos los workers de la máquina (WAL, transacción por update)"""
+
+    backend = "sqlite"
+    PRUNE_EVERY = 256  # Inserciones entre limpiezas de claves caducadas/sobrantes
+
+    def __init__(self, path: str = DEDUPE_SQLITE_PATH, window: float = DEDUPE_WINDOW,
+                 max_entries: int = DEDUPE_MAX_ENTRIES):
+        super().__init__(window, max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._entries = 0  # Claves en la tabla según el último recuento (+ inserciones de este proceso)
+        self._conn = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Una conexión por proceso: una conexión SQLite no puede cruzar un fork
+        if self._conn is None or self._pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, ts REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS seen_ts ON seen (ts)")
+            self._entries = conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _add(self, keys: List[str], now: float) -> bool:
+        if not keys:
+            return True
+        with self._lock:
+            conn = self._connection()
+            # IMMEDIATE: comprobar e insertar sin que otro worker se cuele entre medias
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ",".join("?" * len(keys))
+                row = conn.execute(f"SELECT 1 FROM seen WHERE key IN ({placeholders}) AND ts >= ? LIMIT 1",
+                                   (*keys, now - self.window)).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return False
+                conn.executemany("INSERT OR REPLACE INTO seen (key, ts) VALUES (?, ?)", [(key, now) for key in keys])
+                self._inserts += 1
+                self._entries += len(keys)
+                if self._inserts % self.PRUNE_EVERY == 0:
+                    self._prune(now)
+                conn.execute("COMMIT")
+                return True
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _prune(self, now: float):
+        conn = self._connection()
+        conn.execute("DELETE FROM seen WHERE ts < ?", (now - self.window,))
+        self._entries = conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            conn.execute("DELETE FROM seen WHERE key IN (SELECT key FROM seen ORDER BY ts LIMIT ?)", (excess,))
+            self._entries = self.max_entries
+
+    def _forget(self, keys: List[str]):
+        with self._lock:
+            cursor = self._connection().executemany("DELETE FROM seen WHERE key = ?", [(key,) for key in keys])
+            self._entries = max(0, self._entries - cursor.rowcount)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._entries = self._connection().execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+            return self._entries
+
+    @property
+    def entries(self) -> int:
+        """Recuento aproximado sin tocar la base (se corrige en cada limpieza)
+
+        stats() se sirve desde /health en el event loop: un COUNT(*) ahí bloquearía
+        mientras otro worker tiene la transacción abierta.
+        """
+        return self._entries
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+def create_dedupe_store(backend: str = DEDUPE_BACKEND) -> DedupeStore:
+    if backend == "sqlite":
+        return SQLiteDedupeStore()
+    if backend != "memory":
+        print(f"⚠️ DEDUPE_BACKEND desconocido: {backend}, se usa memory")
+    return MemoryDedupeStore()
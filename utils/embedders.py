@@ -0,0 +1,300 @@
+import numpy as np
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import importlib.util
+import json
+import os
+import threading
+import time
+
+try:
+    import onnxruntime as ort
+except ImportError:  # Backend ONNX opcional: pip install onnxruntime onnx transformers
+    ort = None
+
+# Backend de embeddings: torch (SentenceTransformer) | onnx | onnx-int8 (cuantizado dinámico)
+RAG_EMBED_BACKEND = os.getenv("RAG_EMBED_BACKEND", "torch")
+# Hilos de inferencia por proceso (0 = los del runtime, normalmente un hilo por núcleo)
+RAG_EMBED_THREADS = int(os.getenv("RAG_EMBED_THREADS", "0"))
+# Modelos exportados a ONNX (se generan la primera vez a partir del SentenceTransformer)
+RAG_ONNX_DIR = os.getenv("RAG_ONNX_DIR", "models/onnx")
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+PARITY_SAMPLE = [
+    "¿Cómo reinicio el equipo a la configuración de fábrica?",
+    "El dispositivo muestra el error E-204 al encender",
+    "Instrucciones de mantenimiento preventivo del filtro",
+    "What is the warranty period for the X-200 model?",
+    "La batería no carga cuando el cable está conectado",
+    "Pasos para actualizar el firmware a la versión 1.2",
+]
+
+class Embedder(ABC):
+    """Modelo de embeddings: encode(textos) -> (n, dim) float32
+
+    Los pesos se cargan en el primer uso; preload() deja listo solo lo que es
+    seguro compartir con procesos hijos (sin hilos ni sesiones de inferencia).
+    """
+
+    backend = ""
+
+    def __init__(self, model_name: str, threads: int = RAG_EMBED_THREADS):
+        self.model_name = model_name
+        self.threads = threads
+        self._lock = threading.Lock()
+
+    @property
+    def cache_name(self) -> str:
+        """Nombre para la caché de embeddings (backends con vectores distintos no la comparten)"""
+        return self.model_name
+
+    @property
+    @abstractmethod
+    def tokenizer(self):
+        """Tokenizer del modelo (None si no tiene)"""
+
+    @property
+    def tokenizer_name(self) -> Optional[str]:
+        """Nombre/ruta del tokenizer (los workers de extracción lo cargan por nombre)"""
+        return getattr(self.tokenizer, "name_or_path", None)
+
+    def preload(self):
+        pass
+
+    @abstractmethod
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        """Embeddings (n, dim) float32 sin normalizar"""
+
+class SentenceTransformerEmbedder(Embedder):
+    """Referencia: SentenceTransformer sobre PyTorch (CPU)"""
+
+    backend = "torch"
+
+    def __init__(self, model_name: str, threads: int = RAG_EMBED_THREADS):
+        super().__init__(model_name, threads)
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    start = time.perf_counter()
+                    model = SentenceTransformer(self.model_name)
+                    self._model = model
+                    print(f"🧠 Modelo {self.model_name} cargado en {time.perf_counter() - start:.1f}s")
+        return self._model
+
+    @property
+    def tokenizer(self):
+        return getattr(self.model, "tokenizer", None)
+
+    def preload(self):
+        # Solo pesos: torch crea su pool de hilos en la primera inferencia (ya en el worker)
+        self.model
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        if self.threads > 0:
+            import torch
+            if torch.get_num_threads() != self.threads:
+                torch.set_num_threads(self.threads)
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size), dtype='float32')
+
+def _onnx_paths(model_name: str, onnx_dir: str) -> Tuple[str, str, str]:
+    path = os.path.join(onnx_dir, model_name.replace("/", "__"))
+    return path, os.path.join(path, "model.onnx"), os.path.join(path, "model-int8.onnx")
+
+def export_onnx(model_name: str, onnx_dir: str = RAG_ONNX_DIR) -> str:
+    """Exportar el transformer del SentenceTransformer a ONNX (+ tokenizer y pooling)"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    path, model_path, _ = _onnx_paths(model_name, onnx_dir)
+    if os.path.exists(model_path):
+        return path
+
+    print(f"📦 Exportando {model_name} a ONNX...")
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    pooling = st_model[1].get_pooling_mode_str() if len(st_model) > 1 else "mean"
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(*inputs, return_dict=False)[0]
+
+    dummy = transformer.tokenizer(["hola mundo"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    os.makedirs(path, exist_ok=True)
+    tmp_path = model_path + ".tmp"
+    with torch.no_grad():
+        torch.onnx.export(_Encoder(transformer.auto_model.eval()), tuple(dummy[name] for name in input_names),
+                          tmp_path, input_names=input_names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=14)
+    transformer.tokenizer.save_pretrained(path)
+    with open(os.path.join(path, "embedder.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model": model_name,
+            "pooling": pooling,
+            "max_seq_length": st_model.max_seq_length,
+            "dim": st_model.get_sentence_embedding_dimension(),
+            "inputs": input_names
+        }, f)
+    os.replace(tmp_path, model_path)  # El modelo aparece completo o no aparece
+    print(f"✅ ONNX exportado en {path}")
+    return path
+
+def quantize_onnx(model_name: str, onnx_dir: str = RAG_ONNX_DIR) -> str:
+    """Variante int8 con cuantización dinámica de pesos (activaciones en float, sin calibración)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    path, model_path, int8_path = _onnx_paths(model_name, onnx_dir)
+    if not os.path.exists(int8_path):
+        export_onnx(model_name, onnx_dir)
+        print(f"📦 Cuantizando {model_name} a int8...")
+        tmp_path = int8_path + ".tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return path
+
+class OnnxEmbedder(Embedder):
+    """Mismo modelo exportado a ONNX Runtime (opcionalmente int8): vectores compatibles con torch"""
+
+    def __init__(self, model_name: str, threads: int = RAG_EMBED_THREADS, quantized: bool = False,
+                 onnx_dir: str = RAG_ONNX_DIR):
+        # Se comprueba al elegir el backend, no en el primer encode
+        missing = [name for name, found in (("onnxruntime", ort is not None),
+                                            ("transformers", importlib.util.find_spec("transformers") is not None))
+                   if not found]
+        if missing:
+            raise ImportError(f"Backend ONNX sin dependencias: falta {', '.join(missing)} "
+                              f"(pip install onnxruntime onnx transformers)")
+        super().__init__(model_name, threads)
+        self.quantized = quantized
+        self.onnx_dir = onnx_dir
+        self.backend = "onnx-int8" if quantized else "onnx"
+        self._session = None
+        self._tokenizer = None
+        self._meta: Dict[str, Any] = {}
+
+    @property
+    def cache_name(self) -> str:
+        # fp32 reproduce a torch (mismos vectores); int8 se desvía un poco y va aparte
+        return f"{self.model_name}-int8" if self.quantized else self.model_name
+
+    def _prepare(self) -> str:
+        """Exportar/cuantizar si falta (archivos en disco, sin sesión: seguro antes del fork)"""
+        if self.quantized:
+            return quantize_onnx(self.model_name, self.onnx_dir)
+        return export_onnx(self.model_name, self.onnx_dir)
+
+    def _load(self):
+        if self._session is not None:
+            return
+        with self._lock:
+            if self._session is not None:
+                return
+            from transformers import AutoTokenizer
+
+            start = time.perf_counter()
+            path = self._prepare()
+            _, model_path, int8_path = _onnx_paths(self.model_name, self.onnx_dir)
+            with open(os.path.join(path, "embedder.json"), "r", encoding="utf-8") as f:
+                self._meta = json.load(f)
+            self._tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.inter_op_num_threads = 1
+            if self.threads > 0:
+                options.intra_op_num_threads = self.threads
+            self._session = ort.InferenceSession(int8_path if self.quantized else model_path, options,
+                                                 providers=["CPUExecutionProvider"])
+            print(f"🧠 Modelo {self.model_name} ({self.backend}) cargado en {time.perf_counter() - start:.1f}s")
+
+    @property
+    def tokenizer(self):
+        self._load()
+        return self._tokenizer
+
+    def preload(self):
+        self._prepare()
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32) -> np.ndarray:
+        self._load()
+        texts = list(texts)
+        output = np.zeros((len(texts), self._meta["dim"]), dtype='float32')
+        # Lotes de longitudes parecidas: menos padding por lote
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        for i in range(0, len(texts), max(1, batch_size)):
+            rows = order[i:i + batch_size]
+            encoded = self._tokenizer([texts[row] for row in rows], padding=True, truncation=True,
+                                      max_length=self._meta["max_seq_length"], return_tensors="np")
+            mask = encoded["attention_mask"].astype('int64')
+            feeds = {name: encoded[name].astype('int64') if name in encoded else np.zeros_like(mask)
+                     for name in self._meta["inputs"]}
+            hidden = self._session.run(None, feeds)[0]
+            output[rows] = self._pool(hidden, mask)
+        return output
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self._meta.get("pooling") == "cls":
+            return hidden[:, 0]
+        weights = mask[:, :, None].astype('float32')
+        return (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+
+def create_embedder(model_name: str, backend: str = RAG_EMBED_BACKEND, threads: int = RAG_EMBED_THREADS) -> Embedder:
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de embeddings desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+    if backend == "torch":
+        return SentenceTransformerEmbedder(model_name, threads)
+    return OnnxEmbedder(model_name, threads, quantized=backend == "onnx-int8")
+
+# Embedders de este proceso (o heredados del master si se precargaron antes del fork)
+_embedders: Dict[Tuple[str, str], Embedder] = {}
+_embedders_lock = threading.Lock()
+
+def get_embedder(model_name: str, backend: str = RAG_EMBED_BACKEND) -> Embedder:
+    """Embedder compartido por (modelo, backend): los pesos se cargan una sola vez por proceso"""
+    key = (model_name, backend)
+    embedder = _embedders.get(key)
+    if embedder is None:
+        with _embedders_lock:
+            embedder = _embedders.get(key)
+            if embedder is None:
+                embedder = create_embedder(model_name, backend)
+                _embedders[key] = embedder
+    return embedder
+
+def parity_check(reference: Embedder, candidate: Embedder, texts: Sequence[str],
+                 batch_size: int = 32) -> Dict[str, Any]:
+    """Deriva coseno y velocidad de un backend frente al de referencia sobre los mismos textos"""
+    def timed(embedder: Embedder) -> Tuple[np.ndarray, float]:
+        embedder.encode(list(texts[:batch_size]), batch_size)  # Carga y primer lote fuera de la medida
+        start = time.perf_counter()
+        vectors = embedder.encode(list(texts), batch_size)
+        return vectors, time.perf_counter() - start
+
+    expected, reference_time = timed(reference)
+    vectors, candidate_time = timed(candidate)
+    expected /= np.maximum(np.linalg.norm(expected, axis=1, keepdims=True), 1e-12)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    cosine = (expected * vectors).sum(axis=1)
+
+    return {
+        "backend": candidate.backend,
+        "texts": len(texts),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "cosine_min": round(float(cosine.min()), 5),
+        "cosine_p1": round(float(np.percentile(cosine, 1)), 5),
+        "ms_per_text": round(1000 * candidate_time / max(len(texts), 1), 3),
+        "speedup": round(reference_time / candidate_time, 2) if candidate_time > 0 else 0.0
+    }
@@ -0,0 +1,203 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Caché de embeddings en disco (por modelo): activada y número máximo de vectores
+RAG_EMBED_CACHE = os.getenv("RAG_EMBED_CACHE", "1") == "1"
+RAG_EMBED_CACHE_SIZE = int(os.getenv("RAG_EMBED_CACHE_SIZE", "200000"))
+
+# Hash en hexadecimal: los campos "S" de NumPy recortan los bytes nulos finales
+_INDEX_DTYPE = np.dtype([("key", "S32"), ("tick", "<u8")])
+
+def text_key(text: str) -> bytes:
+    """Hash del chunk normalizado (Unicode NFC y espacios colapsados)"""
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest().encode("ascii")
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", model_name).strip("_") or "model"
+
+class EmbeddingCache:
+    """Embeddings ya calculados, por (modelo, hash del texto normalizado)
+
+    Vectores en un array float32 mapeado en memoria y un índice paralelo
+    (hash + último uso) por slot. Al llenarse se expulsan los menos usados.
+    Las escrituras toman el flock exclusivo del índice y las lecturas el
+    compartido: un slot no se reescribe mientras otro proceso copia su vector.
+    Cada lectura comprueba además el hash del slot (un slot reutilizado por
+    otro proceso cuenta como fallo, nunca devuelve un vector equivocado).
+
+    Un contador de generación en disco cambia con cada escritura: el mapa de
+    slots solo se relee cuando otro proceso escribió. Las lecturas no tocan
+    los archivos; los usos se anotan en memoria y pasan al índice en el
+    siguiente put_many de este proceso (con el flock exclusivo).
+    """
+
+    def __init__(self, path: str, model_name: str, max_entries: int = RAG_EMBED_CACHE_SIZE):
+        self.path = os.path.join(path, _slug(model_name))
+        self.model_name = model_name
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.memmap] = None
+        self._index: Optional[np.memmap] = None
+        self._slots: Dict[bytes, int] = {}
+        self._free: List[int] = []
+        self._header: Optional[np.memmap] = None  # Generación del índice (compartida)
+        self._generation: Optional[int] = None  # Generación reflejada en _slots
+        self._touched: Dict[bytes, int] = {}  # Hash -> generación de su último uso aquí (LRU)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+
+    def _open(self, dim: Optional[int]) -> bool:
+        """Abrir (o crear si se conoce la dimensión) los archivos de la caché"""
+        if self._vectors is not None:
+            return True
+
+        meta = None
+        if os.path.exists(self._meta_path()):
+            with open(self._meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        valid = meta is not None and meta.get("model") == self.model_name and \
+            meta.get("capacity") == self.max_entries and (dim is None or meta.get("dim") == dim)
+
+        vectors_path = os.path.join(self.path, "vectors.f32")
+        index_path = os.path.join(self.path, "index.bin")
+        if valid:
+            dim = meta["dim"]
+            mode = "r+"
+        elif dim is not None:
+            # Caché nueva (o de otra capacidad/dimensión): se empieza de cero
+            os.makedirs(self.path, exist_ok=True)
+            mode = "w+"
+        else:
+            return False
+
+        self._vectors = np.memmap(vectors_path, dtype="float32", mode=mode, shape=(self.max_entries, dim))
+        self._index = np.memmap(index_path, dtype=_INDEX_DTYPE, mode=mode, shape=(self.max_entries,))
+        header_path = os.path.join(self.path, "header.bin")
+        header_mode = "r+" if mode == "r+" and os.path.exists(header_path) else "w+"
+        self._header = np.memmap(header_path, dtype="<u8", mode=header_mode, shape=(1,))
+        if mode == "w+":
+            with open(self._meta_path(), "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": dim, "capacity": self.max_entries}, f)
+        self._reload_slots()
+        return True
+
+    def _reload_slots(self):
+        keys = self._index["key"]
+        used = np.flatnonzero(keys != b"")
+        self._slots = dict(zip(keys[used].tolist(), used.tolist()))
+        self._free = np.flatnonzero(keys == b"")[::-1].tolist()
+        self._generation = int(self._header[0])
+
+    def _sync(self):
+        """Releer el mapa de slots solo si otro proceso escribió (con el flock tomado)"""
+        if int(self._header[0]) != self._generation:
+            self._reload_slots()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        """flock entre procesos sobre el índice (compartido para leer, exclusivo para escribir)"""
+        with open(os.path.join(self.path, "index.bin"), "rb") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[List[bytes], Optional[np.ndarray], np.ndarray]:
+        """(hashes, vectores, máscara de aciertos); las filas sin acierto quedan en cero"""
+        keys = [text_key(text) for text in texts]
+        found = np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            if not self._open(None):
+                self.misses += len(keys)
+                return keys, None, found
+
+            vectors = np.zeros((len(keys), self._vectors.shape[1]), dtype="float32")
+            with self._file_lock(exclusive=False):
+                self._sync()
+                for i, key in enumerate(keys):
+                    slot = self._slots.get(key)
+                    if slot is not None and self._index["key"][slot] == key:
+                        vectors[i] = self._vectors[slot]
+                        self._touched[key] = self._generation
+                        found[i] = True
+            hits = int(found.sum())
+            self.hits += hits
+            self.misses += len(keys) - hits
+            return keys, vectors, found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        """Guardar vectores (expulsa el 10% menos usado si no hay sitio)"""
+        if not len(keys):
+            return
+        vectors = np.asarray(vectors, dtype="float32")
+        with self._lock:
+            self._open(vectors.shape[1])
+            with self._file_lock(exclusive=True):
+                self._sync()  # Ver lo que hayan escrito otros procesos
+                generation = self._generation + 1
+                self._flush_touched()
+                written = False
+                for key, vector in zip(keys, vectors):
+                    if key in self._slots:
+                        continue
+                    if not self._free:
+                        self._evict(max(1, self.max_entries // 10))
+                    slot = self._free.pop()
+                    self._vectors[slot] = vector
+                    self._index[slot] = (key, generation)
+                    self._slots[key] = slot
+                    written = True
+                if written:
+                    self._vectors.flush()
+                    self._header[0] = generation
+                    self._generation = generation
+                    self._header.flush()
+                self._index.flush()
+
+    def _flush_touched(self):
+        """Pasar al índice los usos anotados por las lecturas de este proceso"""
+        for key, generation in self._touched.items():
+            slot = self._slots.get(key)
+            if slot is not None and self._index["tick"][slot] < generation:
+                self._index["tick"][slot] = generation
+        self._touched.clear()
+
+    def _evict(self, count: int):
+        ticks = self._index["tick"].copy()
+        ticks[self._index["key"] == b""] = np.iinfo(np.uint64).max
+        oldest = np.argpartition(ticks, min(count, len(ticks) - 1))[:count]
+        for slot in oldest.tolist():
+            self._slots.pop(self._index["key"][slot], None)
+            self._index[slot] = (b"", 0)
+            self._free.append(slot)
+        self.evictions += len(oldest)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._slots),
+            "capacity": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,35 @@
+import os
+import httpx
+from typing import Dict
+
+# Límites del pool de conexiones compartido (keep-alive)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# Un cliente por servicio (groq, telegram...) para no mezclar pools
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+def get_client(name: str, timeout: float = 15.0) -> httpx.AsyncClient:
+    """Obtener (o crear) el cliente HTTP async compartido de un servicio"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+        _clients[name] = client
+    return client
+
+async def close_clients():
+    """Cerrar todos los clientes HTTP (al apagar la app)"""
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"⚠️ Error cerrando cliente {name}: {e}")
+    _clients.clear()
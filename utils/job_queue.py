@@ -0,0 +1,77 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, List, Optional
+
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "16"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+class JobQueue:
+    """Cola de trabajos en proceso atendida por un pool de workers async"""
+
+    def __init__(self, handler: Callable[[Any], Awaitable[None]],
+                 workers: int = WEBHOOK_WORKERS, maxsize: int = WEBHOOK_QUEUE_SIZE):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    async def start(self):
+        """Crear la cola y lanzar los workers (dentro del event loop)"""
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"webhook-worker-{n}")
+            for n in range(self.workers)
+        ]
+        print(f"✅ Cola de webhook iniciada: {self.workers} workers")
+
+    def submit(self, job: Any) -> bool:
+        """Encolar trabajo sin bloquear; False si la cola está llena o detenida"""
+        if self.queue is None:
+            return False
+        try:
+            self.queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+
+    async def stop(self, drain_timeout: float = 10.0):
+        """Esperar a que se vacíe la cola (con límite) y detener los workers"""
+        if self.queue is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Cola detenida con {self.queue.qsize()} trabajos pendientes")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.queue = None
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self.handler(job)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Worker {n} error: {e}")
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> dict:
+        """Estado de la cola para /health"""
+        return {
+            "workers": len(self._tasks),
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,192 @@
+import numpy as np
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+import re
+import unicodedata
+
+# Parámetros BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "al", "como", "con", "de", "del", "el", "en", "es", "esta", "este", "hay", "la", "las",
+    "lo", "los", "me", "mi", "no", "o", "para", "por", "que", "se", "si", "su", "un", "una", "y",
+    "the", "an", "and", "is", "of", "on", "to", "in", "for", "how", "what"
+}
+
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_SPLIT_RE = re.compile(r"[-./]")
+
+def tokenize(text: str) -> List[str]:
+    """Tokens en minúsculas y sin tildes; conserva códigos como "x-200" o "v1.2" (y sus partes)"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if _SPLIT_RE.search(token):
+            tokens.extend(part for part in _SPLIT_RE.split(token) if part and part not in STOPWORDS)
+    return tokens
+
+def is_code(token: str) -> bool:
+    """Códigos de error, modelos y números de parte: contienen dígitos"""
+    return any(c.isdigit() for c in token)
+
+class PostingsBuilder:
+    """Construye las postings (formato CSR) de un segmento a medida que llegan textos"""
+
+    def __init__(self):
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._lengths: List[int] = []
+
+    def add(self, texts: Sequence[str]):
+        for text in texts:
+            row = len(self._lengths)
+            counts: Dict[str, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self._postings.setdefault(token, []).append((row, tf))
+            self._lengths.append(len(tokens))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        terms = sorted(self._postings)
+        offsets = np.zeros(len(terms) + 1, dtype='int64')
+        offsets[1:] = np.cumsum([len(self._postings[t]) for t in terms])
+        rows = np.empty(offsets[-1], dtype='int32')
+        tfs = np.empty(offsets[-1], dtype='int32')
+        for i, term in enumerate(terms):
+            entries = np.array(self._postings[term], dtype='int32').reshape(-1, 2)
+            rows[offsets[i]:offsets[i + 1]] = entries[:, 0]
+            tfs[offsets[i]:offsets[i + 1]] = entries[:, 1]
+        return {
+            "terms": np.array(terms, dtype=str),
+            "offsets": offsets,
+            "rows": rows,
+            "tfs": tfs,
+            "lengths": np.array(self._lengths, dtype='int32')
+        }
+
+def save_postings(path: str, arrays: Dict[str, np.ndarray]):
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+def load_postings(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+class _LexicalSegment:
+    __slots__ = ("ids", "terms", "offsets", "rows", "tfs", "lengths", "live", "live_docs", "live_tokens")
+
+    def __init__(self, ids: np.ndarray, arrays: Dict[str, np.ndarray]):
+        self.ids = ids
+        self.terms = {term: i for i, term in enumerate(arrays["terms"].tolist())}
+        self.offsets = arrays["offsets"]
+        self.rows = arrays["rows"]
+        self.tfs = arrays["tfs"]
+        self.lengths = arrays["lengths"]
+        # Filas no borradas: las estadísticas BM25 (N, df, longitud media) solo cuentan estas
+        self.live = np.ones(len(self.lengths), dtype=bool)
+        self.live_docs = len(self.lengths)
+        self.live_tokens = float(self.lengths.sum())
+
+    def discard(self, chunk_ids: np.ndarray):
+        rows = np.flatnonzero(np.isin(self.ids, chunk_ids) & self.live)
+        if len(rows):
+            self.live[rows] = False
+            self.live_docs -= len(rows)
+            self.live_tokens -= float(self.lengths[rows].sum())
+
+class LexicalIndex:
+    """Índice invertido BM25 por segmentos
+
+    Los borrados se marcan con discard(): dejan de contar en las estadísticas
+    (documentos, frecuencia documental, longitud media) antes de compactar.
+    """
+
+    def __init__(self):
+        self._segments: Dict[str, _LexicalSegment] = {}
+
+    def attach(self, name: str, ids: np.ndarray, arrays: Dict[str, np.ndarray],
+               deleted: Optional[np.ndarray] = None):
+        segment = _LexicalSegment(ids, arrays)
+        if deleted is not None and len(deleted):
+            segment.discard(deleted)
+        segments = dict(self._segments)
+        segments[name] = segment
+        self._segments = segments
+
+    def discard(self, chunk_ids: Iterable[int]):
+        """Marcar chunks como borrados en los segmentos que los contienen"""
+        chunk_ids = np.fromiter(chunk_ids, dtype='int64')
+        if not len(chunk_ids):
+            return
+        for segment in self._segments.values():
+            segment.discard(chunk_ids)
+
+    def detach(self, names: Sequence[str]):
+        segments = dict(self._segments)
+        for name in names:
+            segments.pop(name, None)
+        self._segments = segments
+
+    def search(self, query: str, k: int, is_live: Callable[[int], bool]) -> List[Tuple[int, float, float]]:
+        """Top-k (chunk id, score BM25, fracción de términos de la consulta presentes)"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        segments = list(self._segments.values())
+        if not terms or not segments:
+            return []
+
+        total_docs = sum(segment.live_docs for segment in segments)
+        avg_len = max(1.0, sum(segment.live_tokens for segment in segments) / max(total_docs, 1))
+
+        # Frecuencia documental global de cada término (sin chunks borrados)
+        df = {term: 0 for term in terms}
+        for segment in segments:
+            for term in terms:
+                i = segment.terms.get(term)
+                if i is not None:
+                    df[term] += int(segment.live[segment.rows[segment.offsets[i]:segment.offsets[i + 1]]].sum())
+
+        hit_ids, hit_scores = [], []
+        for segment in segments:
+            for term in terms:
+                i = segment.terms.get(term)
+                if i is None:
+                    continue
+                idf = math.log(1 + (total_docs - df[term] + 0.5) / (df[term] + 0.5))
+                start, end = segment.offsets[i], segment.offsets[i + 1]
+                live = segment.live[segment.rows[start:end]]
+                rows = segment.rows[start:end][live]
+                tfs = segment.tfs[start:end][live].astype('float32')
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * segment.lengths[rows] / avg_len)
+                hit_ids.append(segment.ids[rows])
+                hit_scores.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+
+        if not hit_ids:
+            return []
+
+        ids, inverse = np.unique(np.concatenate(hit_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(hit_scores))
+        matched = np.bincount(inverse)
+
+        results = []
+        for pos in np.argsort(-scores, kind="stable"):
+            chunk_id = int(ids[pos])
+            if is_live(chunk_id):
+                results.append((chunk_id, float(scores[pos]), float(matched[pos] / len(terms))))
+                if len(results) == k:
+                    break
+        return results
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int, rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """Fusionar rankings por Reciprocal Rank Fusion: top-k (chunk id, score fusionado)"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
@@ -1,10 +1,58 @@
+import asyncio
 import os
-import requests
+import threading
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Union
 from .rag_system import RAGSystem
+from .embedders import get_embedder
+from .llm_client import LLMClient, LLMError
+from .response_cache import ResponseCache
+from .metrics import span
 
-# Inicializar RAG globalmente
-rag = RAGSystem()
-rag.load_database()  # Cargar si ya existe
+# Contexto: máximo de chunks candidatos y presupuesto en tokens para el prompt
+RAG_CONTEXT_CHUNKS = int(os.getenv("RAG_CONTEXT_CHUNKS", "5"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "600"))
+
+# RAG del proceso: se crea (y carga su base) en el primer uso, no al importar
+_rag: Optional[RAGSystem] = None
+_rag_lock = threading.Lock()
+
+def get_rag() -> RAGSystem:
+    """RAG compartido, inicializado de forma perezosa (bloquea: usar fuera del event loop)"""
+    global _rag
+    if _rag is None:
+        with _rag_lock:
+            if _rag is None:
+                rag = RAGSystem()
+                rag.load_database()  # Cargar si ya existe
+                _rag = rag
+    return _rag
+
+def rag_loaded() -> bool:
+    return _rag is not None
+
+def preload_model(model_name: str = "all-MiniLM-L6-v2"):
+    """Cargar solo los pesos del modelo (sin inferencia ni hilos): seguro antes del fork"""
+    try:
+        get_embedder(model_name).preload()
+    except ImportError as e:
+        print(f"⚠️ Precarga omitida: {e}")
+
+def __getattr__(name: str):
+    # Compatibilidad: `from utils.llm import rag` sigue funcionando (inicializa al acceder)
+    if name == "rag":
+        return get_rag()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Respuestas de error (también se entregan por stream)
+ERROR_REPLY = "Disculpa, tengo problemas técnicos en este momento 😅. Inténtalo de nuevo en unos momentos."
+CONNECTION_ERROR_REPLY = "Parece que hay un problema de conectividad 🔌. Inténtalo nuevamente por favor."
+EMPTY_REPLY = "🤖 No pude procesar tu consulta. ¿Podrías reformularla de otra manera?"
+
+# Cliente LLM: pool persistente, reintentos, hedging, circuit breaker y modelo de respaldo
+llm_client = LLMClient.from_env()
+
+# Caché de respuestas (se invalida sola cuando cambia el corpus)
+response_cache = ResponseCache()
 
 def get_welcome_message() -> str:
     """Mensaje de bienvenida fijo y amigable"""
@@ -13,33 +61,63 @@ Estoy aquí para ayudarte con cualquier duda o problema que tengas.
 
 Cuéntame qué necesitas y te ayudaré al instante."""
 
-def generate_reply(user_text: str) -> str:
-    """Genera respuesta usando Groq + RAG"""
+class _Prompt(NamedTuple):
+    """Petición lista para Groq y lo necesario para cachear su respuesta"""
+    payload: Dict[str, Any]
+    query_embedding: Any
+    corpus_version: int
+
+async def _prepare(user_text: str) -> Union[str, _Prompt]:
+    """Respuesta inmediata (caché, error de configuración) o la petición para el LLM"""
     
     print(f"🤖 Procesando: '{user_text[:50]}...'")
     
+    # La primera consulta del proceso inicializa el RAG fuera del event loop
+    rag = _rag or await asyncio.to_thread(get_rag)
+    
+    # Otro worker pudo cambiar el corpus: se recarga su manifest antes de consultar la caché
+    if rag.disk_changed():
+        await asyncio.to_thread(rag.sync_with_disk)
+    
+    # Versión del corpus al empezar: una respuesta no se cachea si el corpus cambia entretanto
+    corpus_version = rag.version
+    
+    # Caché exacta: sin embedding ni LLM
+    with span("response_cache"):
+        cached_reply = response_cache.get_exact(user_text, corpus_version)
+    if cached_reply is not None:
+        print("⚡ Respuesta desde caché")
+        return cached_reply
+    
+    # Embedding + FAISS son CPU: se ejecutan fuera del event loop.
+    # El mismo embedding sirve para la caché semántica y para la búsqueda.
+    with span("embed"):
+        query_embedding = await asyncio.to_thread(rag.embed_query, user_text)
+    with span("response_cache"):
+        cached_reply = response_cache.get_similar(query_embedding, corpus_version)
+    if cached_reply is not None:
+        print("⚡ Respuesta desde caché (pregunta similar)")
+        return cached_reply
+    
     # Buscar en documentos técnicos
     context = ""
     context_info = ""
     
-    if rag.index is not None:
-        similar_chunks = rag.search_similar(user_text, k=3)
-        if similar_chunks:
-            context = "\n\nContexto técnico:\n" + "\n".join(similar_chunks[:2])
-            context_info = f"📚 Contexto: {len(similar_chunks)} chunks de {len(rag.list_documents())} documentos"
-            print(context_info)
-    
-    api_key = os.getenv("GROQ_API_KEY")
+    if len(rag.chunks) > 0:
+        # Solo chunks por encima del umbral de similitud: un saludo o mensaje
+        # fuera de tema no arrastra contexto y el prompt queda mínimo
+        with span("search"):
+            results = await asyncio.to_thread(rag.search_scored, user_text, RAG_CONTEXT_CHUNKS, query_embedding)
+        if results:
+            context = "\n\nContexto técnico:\n" + rag.build_context(results, RAG_CONTEXT_TOKENS)
+            context_info = f"📚 Contexto: {len(results)} chunks (similitud máx. {results[0].score:.2f})"
+        else:
+            context_info = "💬 Sin contexto relevante en los documentos"
+        print(context_info)
     
-    if not api_key:
+    if not llm_client.configured:
         return "❌ Error de configuración. Contacta al administrador."
     
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
     # Prompt mejorado
     documents = rag.list_documents()
     doc_info = f"\n\nTienes acceso a estos documentos: {', '.join(documents)}" if documents else ""
@@ -61,7 +139,6 @@ def generate_reply(user_text: str) -> str:
     user_message = user_text + context
     
     payload = {
-        "model": "llama-3.1-8b-instant",
         "messages": [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
@@ -70,31 +147,64 @@ def generate_reply(user_text: str) -> str:
         "max_tokens": 400
     }
     
+    return _Prompt(payload, query_embedding, corpus_version)
+
+async def generate_reply(user_text: str) -> str:
+    """Genera respuesta usando Groq + RAG (sin bloquear el event loop)"""
+    prepared = await _prepare(user_text)
+    if isinstance(prepared, str):
+        return prepared
+    
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if "choices" in data and len(data["choices"]) > 0:
-                reply = data["choices"][0]["message"]["content"].strip()
-                print(f"✅ Respuesta generada: {len(reply)} caracteres")
-                return reply
-        else:
-            print(f"❌ Groq error: {response.status_code}")
-            return "Disculpa, tengo problemas técnicos en este momento 😅. Inténtalo de nuevo en unos momentos."
-            
+        reply = (await llm_client.complete(prepared.payload)).strip()
+    except LLMError as e:
+        print(f"❌ LLM error: {e}")
+        return CONNECTION_ERROR_REPLY if e.connection else ERROR_REPLY
+    
+    if not reply:
+        return EMPTY_REPLY
+    
+    print(f"✅ Respuesta generada: {len(reply)} caracteres")
+    response_cache.put(user_text, prepared.query_embedding, prepared.corpus_version, reply)
+    return reply
+
+async def stream_reply(user_text: str) -> AsyncIterator[str]:
+    """Como generate_reply, pero entrega el texto por fragmentos a medida que el LLM lo genera (SSE)"""
+    prepared = await _prepare(user_text)
+    if isinstance(prepared, str):
+        yield prepared
+        return
+    
+    parts: List[str] = []
+    try:
+        async for delta in llm_client.stream(prepared.payload):
+            parts.append(delta)
+            yield delta
+    except LLMError as e:
+        print(f"❌ LLM error: {e}")
+        if not parts:
+            yield CONNECTION_ERROR_REPLY if e.connection else ERROR_REPLY
+        return
     except Exception as e:
         print(f"❌ Exception: {e}")
-        return "Parece que hay un problema de conectividad 🔌. Inténtalo nuevamente por favor."
+        if not parts:
+            yield CONNECTION_ERROR_REPLY
+        return
+    
+    reply = "".join(parts).strip()
+    if not reply:
+        yield EMPTY_REPLY
+        return
     
-    return "🤖 No pude procesar tu consulta. ¿Podrías reformularla de otra manera?"
+    # Solo se cachean respuestas completas (un stream cortado lanza LLMError)
+    print(f"✅ Respuesta generada (stream): {len(reply)} caracteres")
+    response_cache.put(user_text, prepared.query_embedding, prepared.corpus_version, reply)
 
 
 def setup_rag(pdf_folder: str = "data/pdfs"):
     """Función para configurar RAG - ejecutar una vez"""
-    global rag
     if os.path.exists(pdf_folder) and os.listdir(pdf_folder):
-        rag.create_vector_database(pdf_folder)
+        get_rag().create_vector_database(pdf_folder)
         print("✅ RAG configurado correctamente")
     else:
         print(f"⚠️ No se encontraron PDFs en {pdf_folder}")
@@ -0,0 +1,407 @@
+import asyncio
+import httpx
+import json
+import os
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from .http_clients import get_client
+from .metrics import LLM_ATTEMPT_SECONDS, LLM_TOKENS, observe, span
+
+GROQ_API_URL = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+# Tiempo total por respuesta (todos los intentos incluidos)
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "15"))
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
+
+# Reintentos con backoff exponencial y jitter en 429/5xx (Retry-After manda si viene)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE = float(os.getenv("LLM_RETRY_BASE", "0.5"))
+LLM_RETRY_MAX = float(os.getenv("LLM_RETRY_MAX", "8"))
+# Petición duplicada si la primera tarda más de X ms ("auto" = p95 reciente, 0 = desactivado)
+LLM_HEDGE_AFTER_MS = os.getenv("LLM_HEDGE_AFTER_MS", "0")
+# Circuit breaker: fallos seguidos para abrir y segundos abierto antes de probar de nuevo
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+# Respaldo: otro modelo (y opcionalmente otro proveedor compatible con OpenAI)
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+LLM_FALLBACK_API_URL = os.getenv("LLM_FALLBACK_API_URL", "")
+LLM_FALLBACK_API_KEY = os.getenv("LLM_FALLBACK_API_KEY", "")
+# Fracción del plazo total reservada a los respaldos (el principal no puede agotarla)
+LLM_FALLBACK_RESERVE = float(os.getenv("LLM_FALLBACK_RESERVE", "0.3"))
+
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+LATENCY_WINDOW = 200  # Intentos recientes por endpoint para percentiles
+HEDGE_MIN_SAMPLES = 20
+
+class LLMError(Exception):
+    """Ningún endpoint respondió (o todos tienen el circuito abierto)"""
+
+    def __init__(self, message: str, connection: bool = False):
+        super().__init__(message)
+        self.connection = connection  # Fallo de red/timeout (no una respuesta de error)
+
+class _BudgetExhausted(Exception):
+    """Se agotó el plazo del endpoint; sent indica si llegó a tener una petición en vuelo"""
+
+    def __init__(self, sent: bool = True):
+        super().__init__()
+        self.sent = sent
+
+class CircuitBreaker:
+    """Abierto tras N fallos seguidos; tras el enfriamiento deja pasar un intento de prueba"""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.max_failures = max(1, failures)
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self.opens = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def release(self):
+        """Cerrar el intento de prueba sin veredicto (4xx, plazo propio agotado, cancelación)"""
+        self._trial = False
+
+    def failure(self):
+        self.failures += 1
+        state = self.state
+        if state == "closed" and self.failures < self.max_failures:
+            return
+        if state != "open":
+            self.opens += 1
+            print(f"🔌 Circuito LLM abierto durante {self.cooldown:.0f}s ({self.failures} fallos seguidos)")
+        self.opened_at = time.monotonic()
+        self._trial = False
+
+class LLMEndpoint:
+    """Proveedor + modelo con su pool, su breaker y las latencias de sus intentos"""
+
+    def __init__(self, name: str, url: str, model: str, api_key_env: str = "", api_key: str = ""):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key_env = api_key_env
+        self._api_key = api_key
+        self.breaker = CircuitBreaker()
+        self.latencies: Dict[bool, Deque[float]] = {False: deque(maxlen=LATENCY_WINDOW),
+                                                     True: deque(maxlen=LATENCY_WINDOW)}
+        self.attempts = 0
+        self.failures = 0
+
+    @property
+    def api_key(self) -> str:
+        # Se lee al usar: el .env se carga antes de las peticiones, no necesariamente antes del import
+        return self._api_key or os.getenv(self.api_key_env, "")
+
+    def record(self, stream: bool, latency: float, ok: bool):
+        self.attempts += 1
+        if ok:
+            self.latencies[stream].append(latency)
+        else:
+            self.failures += 1
+
+    def percentile(self, stream: bool, q: float) -> Optional[float]:
+        samples = self.latencies[stream]
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Segundos indicados en Retry-After (número o fecha HTTP)"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def _count_tokens(usage: Optional[Dict[str, Any]]):
+    if usage:
+        LLM_TOKENS.inc(usage.get("prompt_tokens", 0), kind="prompt")
+        LLM_TOKENS.inc(usage.get("completion_tokens", 0), kind="completion")
+
+def _close_later(task: "asyncio.Task"):
+    """Cerrar la respuesta de un intento descartado si llegó a completarse"""
+    if not task.cancelled() and task.exception() is None:
+        asyncio.ensure_future(task.result().aclose())
+
+class LLMClient:
+    """Cliente de chat completions con pool persistente, reintentos, hedging y respaldo"""
+
+    def __init__(self, endpoints: List[LLMEndpoint], timeout: float = GROQ_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, hedge_after: str = LLM_HEDGE_AFTER_MS):
+        self.endpoints = endpoints
+        self.timeout = timeout
+        self.max_retries = max(0, max_retries)
+        self.hedge_after = hedge_after
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls) -> "LLMClient":
+        endpoints = [LLMEndpoint("groq", GROQ_API_URL, LLM_MODEL, api_key_env="GROQ_API_KEY")]
+        if LLM_FALLBACK_MODEL:
+            if LLM_FALLBACK_API_URL:
+                endpoints.append(LLMEndpoint("fallback", LLM_FALLBACK_API_URL, LLM_FALLBACK_MODEL,
+                                             api_key=LLM_FALLBACK_API_KEY))
+            else:
+                # Mismo proveedor, otro modelo (límites de tasa independientes)
+                endpoints.append(LLMEndpoint("groq-fallback", GROQ_API_URL, LLM_FALLBACK_MODEL,
+                                             api_key_env="GROQ_API_KEY"))
+        return cls(endpoints)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.endpoints[0].api_key)
+
+    def _hedge_delay(self, endpoint: LLMEndpoint, stream: bool) -> Optional[float]:
+        if self.hedge_after == "auto":
+            return endpoint.percentile(stream, 0.95)
+        delay = float(self.hedge_after or 0) / 1000
+        return delay if delay > 0 else None
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Full jitter: evita que todos los workers reintenten a la vez
+        return random.uniform(0, min(LLM_RETRY_MAX, LLM_RETRY_BASE * 2 ** attempt))
+
+    async def _send(self, endpoint: LLMEndpoint, payload: Dict[str, Any], stream: bool) -> httpx.Response:
+        """Un intento; con stream=True vuelve al recibir las cabeceras (cuerpo sin leer)"""
+        client = get_client(endpoint.name, timeout=self.timeout)
+        headers = {"Authorization": f"Bearer {endpoint.api_key}", "Content-Type": "application/json"}
+        body = dict(payload, model=endpoint.model)
+        if stream:
+            body["stream"] = True
+        request = client.build_request("POST", endpoint.url, headers=headers, json=body)
+
+        start = time.perf_counter()
+        try:
+            response = await client.send(request, stream=True)
+            if not stream or response.status_code != 200:
+                await response.aread()
+        except Exception as e:
+            latency = time.perf_counter() - start
+            endpoint.record(stream, latency, False)
+            LLM_ATTEMPT_SECONDS.observe(latency, endpoint=endpoint.name, outcome=type(e).__name__)
+            raise
+        latency = time.perf_counter() - start
+        endpoint.record(stream, latency, response.status_code == 200)
+        LLM_ATTEMPT_SECONDS.observe(latency, endpoint=endpoint.name, outcome=response.status_code)
+        if response.status_code != 200:
+            print(f"⚠️ LLM {endpoint.name}: HTTP {response.status_code} en {latency * 1000:.0f} ms")
+        return response
+
+    async def _hedged(self, endpoint: LLMEndpoint, payload: Dict[str, Any], stream: bool,
+                      deadline: float) -> httpx.Response:
+        """Intento con copia de respaldo si tarda más de lo habitual: gana el primer 200"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _BudgetExhausted(sent=False)
+        first = asyncio.create_task(self._send(endpoint, payload, stream))
+        delay = self._hedge_delay(endpoint, stream)
+        if delay is None or delay >= remaining:
+            try:
+                return await asyncio.wait_for(first, remaining)
+            except asyncio.TimeoutError:
+                raise _BudgetExhausted() from None
+
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.hedges += 1
+        second = asyncio.create_task(self._send(endpoint, payload, stream))
+        pending = {first, second}
+        result: Optional[httpx.Response] = None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise _BudgetExhausted()
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    response = task.result()
+                    if result is None or (response.status_code == 200 and result.status_code != 200):
+                        if result is not None:
+                            await result.aclose()
+                        result = response
+                        if task is second and response.status_code == 200:
+                            self.hedge_wins += 1
+                    else:
+                        await response.aclose()
+                if result is not None and result.status_code == 200:
+                    return result
+            if result is not None:
+                return result
+            raise error
+        finally:
+            for task in pending:
+                task.add_done_callback(_close_later)
+                task.cancel()
+
+    async def _request(self, payload: Dict[str, Any], stream: bool) -> Tuple[LLMEndpoint, httpx.Response]:
+        """Respuesta 200 del primer endpoint disponible, con reintentos dentro del plazo total
+
+        Mientras quede un respaldo por probar, cada endpoint termina LLM_FALLBACK_RESERVE
+        del plazo antes: un principal colgado no deja al respaldo sin tiempo.
+        """
+        self.requests += 1
+        deadline = time.monotonic() + self.timeout
+        reserve = self.timeout * min(max(LLM_FALLBACK_RESERVE, 0.0), 0.9)
+        last_error = "circuito abierto"
+        connection = False
+
+        for position, endpoint in enumerate(self.endpoints):
+            trial = endpoint.breaker.state == "half-open"
+            if not endpoint.breaker.allow():
+                continue
+            if position > 0:
+                self.fallbacks += 1
+                print(f"🔁 LLM: usando respaldo {endpoint.name} ({endpoint.model})")
+            endpoint_deadline = deadline - reserve if position < len(self.endpoints) - 1 else deadline
+
+            try:
+                for attempt in range(self.max_retries + 1):
+                    delay = self._backoff(attempt)
+                    try:
+                        response = await self._hedged(endpoint, payload, stream, endpoint_deadline)
+                    except _BudgetExhausted as e:
+                        # Un endpoint que consume todo su plazo sin responder está colgado y cuenta
+                        # para el breaker; si el plazo total se acabó antes de enviarle nada, no
+                        if e.sent:
+                            endpoint.breaker.failure()
+                        last_error, connection = f"{endpoint.name}: plazo agotado", True
+                        break
+                    except (httpx.HTTPError, asyncio.TimeoutError) as e:
+                        endpoint.breaker.failure()
+                        last_error, connection = f"{endpoint.name}: {type(e).__name__}", True
+                    else:
+                        if response.status_code == 200:
+                            endpoint.breaker.success()
+                            return endpoint, response
+                        await response.aclose()
+                        last_error, connection = f"{endpoint.name}: HTTP {response.status_code}", False
+                        if response.status_code not in RETRY_STATUS:
+                            break  # 4xx: repetir no cambia nada, se prueba el respaldo
+                        endpoint.breaker.failure()
+                        delay = _retry_after(response) or delay
+
+                    if attempt == self.max_retries or time.monotonic() + delay >= endpoint_deadline or \
+                            endpoint.breaker.state != "closed":
+                        break
+                    self.retries += 1
+                    await asyncio.sleep(delay)
+            finally:
+                # El intento de prueba se resuelve siempre (también con 4xx, plazo o cancelación)
+                if trial:
+                    endpoint.breaker.release()
+
+        self.errors += 1
+        raise LLMError(last_error, connection)
+
+    async def complete(self, payload: Dict[str, Any]) -> str:
+        """Texto de la respuesta (lanza LLMError si no se pudo obtener)"""
+        with span("llm"):
+            endpoint, response = await self._request(payload, stream=False)
+        try:
+            data = response.json()
+            _count_tokens(data.get("usage"))
+            choices = data.get("choices")
+            if not choices:
+                raise LLMError(f"{endpoint.name}: respuesta sin choices")
+            # content puede venir null (p. ej. respuesta cortada): se trata como vacía
+            return choices[0]["message"]["content"] or ""
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+            raise LLMError(f"{endpoint.name}: respuesta inválida ({type(e).__name__})") from None
+
+    async def stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Fragmentos de texto del stream SSE (los reintentos solo ocurren antes del primero)"""
+        start = time.perf_counter()
+        with span("llm_connect"):
+            endpoint, response = await self._request(payload, stream=True)
+        first = True
+        try:
+            # Eventos "data: {json}" con deltas de texto; "data: [DONE]" cierra el stream
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                event = json.loads(data)
+                # Groq manda el uso de tokens en el último evento (x_groq.usage)
+                _count_tokens(event.get("usage") or (event.get("x_groq") or {}).get("usage"))
+                choices = event.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    if first:
+                        observe("llm_first_token", time.perf_counter() - start)
+                        first = False
+                    yield delta
+            raise LLMError(f"{endpoint.name}: stream interrumpido", connection=True)
+        finally:
+            observe("llm_stream", time.perf_counter() - start)
+            await response.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        def ms(value: Optional[float]) -> Optional[float]:
+            return round(value * 1000, 1) if value is not None else None
+
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+            "endpoints": {
+                endpoint.name: {
+                    "model": endpoint.model,
+                    "breaker": endpoint.breaker.state,
+                    "attempts": endpoint.attempts,
+                    "failures": endpoint.failures,
+                    "p50_ms": ms(endpoint.percentile(False, 0.5)),
+                    "p95_ms": ms(endpoint.percentile(False, 0.95)),
+                    "stream_p50_ms": ms(endpoint.percentile(True, 0.5)),
+                    "stream_p95_ms": ms(endpoint.percentile(True, 0.95))
+                }
+                for endpoint in self.endpoints
+            }
+        }
@@ -0,0 +1,215 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Log estructurado (una línea JSON por update con su trace id y la duración de cada etapa)
+METRICS_LOG_TRACES = os.getenv("METRICS_LOG_TRACES", "1") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # cuentas por bucket + [suma, total]
+
+    def observe(self, value: float, **labels: Any):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+class Registry:
+    """Métricas del proceso + estadísticas leídas al exportar (colas, cachés...)"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._stats: List[Tuple[str, Callable[[], Dict[str, Any]], Tuple[str, ...]]] = []
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_stats(self, prefix: str, stats_fn: Callable[[], Dict[str, Any]], counters: Sequence[str] = ()):
+        """Exportar los valores numéricos de un stats() (los de `counters` como contadores)"""
+        self._stats = [entry for entry in self._stats if entry[0] != prefix]
+        self._stats.append((prefix, stats_fn, tuple(counters)))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, stats_fn, counters in self._stats:
+            try:
+                stats = stats_fn() or {}
+            except Exception as e:
+                print(f"⚠️ Métricas {prefix}: {e}")
+                continue
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                if key in counters:
+                    name = f"tomi_{prefix}_{key}_total"
+                    lines += [f"# TYPE {name} counter", f"{name} {_number(value)}"]
+                else:
+                    name = f"tomi_{prefix}_{key}"
+                    lines += [f"# TYPE {name} gauge", f"{name} {_number(value)}"]
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("tomi_stage_seconds", "Duración de cada etapa del pipeline", ("stage",))
+UPDATE_SECONDS = registry.histogram("tomi_update_seconds", "Tiempo total por update de Telegram (webhook a envío)",
+                                    ("outcome",))
+LLM_ATTEMPT_SECONDS = registry.histogram("tomi_llm_attempt_seconds", "Latencia de cada intento al LLM",
+                                         ("endpoint", "outcome"))
+LLM_TOKENS = registry.counter("tomi_llm_tokens_total", "Tokens consumidos en el LLM", ("kind",))
+
+class Trace:
+    """Recorrido de un update: id para los logs y duración acumulada por etapa"""
+
+    __slots__ = ("trace_id", "update_id", "started", "stages")
+
+    def __init__(self, update_id: Any = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.update_id = update_id
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+# Trace del update en curso (asyncio.to_thread copia el contexto a los hilos)
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("tomi_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+def trace_id() -> str:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else "-"
+
+@contextmanager
+def use_trace(trace: Trace) -> Iterator[Trace]:
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def observe(stage: str, seconds: float):
+    """Registrar la duración de una etapa (histograma + trace activo)"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Medir un bloque: `with span("faiss_search"): ...` (también dentro de corrutinas)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+def timed(stage: str):
+    """Decorador: mide cada llamada a la función como la etapa `stage`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def log_event(event: str, **fields: Any):
+    """Log estructurado en una línea JSON con el trace id del update en curso"""
+    if not METRICS_LOG_TRACES:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, "trace_id": trace_id()}
+    record.update(fields)
+    print(json.dumps(record, ensure_ascii=False, default=str))
+
+def finish_trace(trace: Trace, outcome: str = "ok"):
+    """Cerrar un update: histograma total y línea de log con todas sus etapas"""
+    total = time.perf_counter() - trace.started
+    UPDATE_SECONDS.observe(total, outcome=outcome)
+    with use_trace(trace):
+        log_event("update", update_id=trace.update_id, outcome=outcome, total_ms=round(total * 1000, 1),
+                  stages_ms={stage: round(seconds * 1000, 1) for stage, seconds in trace.stages.items()})
+
+def render_metrics() -> str:
+    return registry.render()
@@ -1,27 +1,201 @@
 import PyPDF2
+import hashlib
+import io
+import math
 import os
-from typing import List
+import re
+from functools import lru_cache
+from typing import BinaryIO, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
+# Tamaño de chunk y solapamiento en tokens del modelo de embeddings
+# (all-MiniLM-L6-v2 trunca a 256 tokens: lo que pase de ahí no se vectoriza)
+RAG_CHUNK_TOKENS = int(os.getenv("RAG_CHUNK_TOKENS", "200"))
+RAG_CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "40"))
+
+class Chunk(NamedTuple):
+    """Fragmento de texto con su origen: página (desde 1) y offsets de caracteres en el documento"""
+    text: str
+    page: int
+    start: int
+    end: int
+
+class _Unit(NamedTuple):
+    text: str
+    page: int
+    start: int
+    end: int
+    tokens: int
+    heading: bool
+
+_APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_WORD_RE = re.compile(r"\S+")
+# Fin de oración: puntuación final seguida de espacio y mayúscula/dígito/viñeta
+_SENTENCE_END_RE = re.compile(r"[.!?…]+[\"'»)\]]*\s+(?=[¿¡\"'«(\[]?[A-ZÁÉÍÓÚÜÑ0-9•\-])")
+_HEADING_RE = re.compile(
+    r"^(?:#{1,6}\s+\S|(?:\d+(?:\.\d+)*\.?|[IVXLC]+\.)\s+\S|(?:cap[ií]tulo|secci[oó]n|anexo|chapter|section)\b)",
+    re.IGNORECASE
+)
+
+def approx_token_count(text: str) -> int:
+    """Aproximación de tokens WordPiece: palabras y signos, +30% por sub-palabras"""
+    return math.ceil(len(_APPROX_TOKEN_RE.findall(text)) * 1.3)
+
+@lru_cache(maxsize=4)
+def get_token_counter(tokenizer_name: Optional[str] = None) -> Callable[[str], int]:
+    """Contador de tokens con el tokenizer del modelo (o la aproximación si no está disponible)"""
+    if tokenizer_name:
+        try:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(tokenizer_name, local_files_only=True)
+            return lambda text: len(tokenizer.tokenize(text))
+        except Exception as e:
+            print(f"⚠️ Tokenizer {tokenizer_name} no disponible ({e}), se aproximan los tokens")
+    return approx_token_count
+
+def iter_pdf_pages(source: Union[str, bytes, BinaryIO]) -> Iterator[str]:
+    """Extrae el texto página a página (ruta, bytes o archivo abierto)"""
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    pdf_reader = PyPDF2.PdfReader(source)
+    for page in pdf_reader.pages:
+        yield (page.extract_text() or "") + "\n"
 
 def extract_text_from_pdf(pdf_path: str) -> str:
     """Extrae texto de un PDF"""
-    text = ""
     with open(pdf_path, 'rb') as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-    return text
+        return "".join(iter_pdf_pages(file))
+
+def _is_heading(line: str) -> bool:
+    """Título: línea corta sin puntuación final, numerada/marcada o toda en mayúsculas"""
+    line = line.strip()
+    if not line or len(line) > 80 or line[-1] in ".,;:":
+        return False
+    if _HEADING_RE.match(line):
+        return True
+    letters = [c for c in line if c.isalpha()]
+    return len(letters) >= 3 and all(c.isupper() for c in letters)
+
+def _iter_spans(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """(inicio, fin, es_título) de títulos y oraciones; los párrafos cortan en líneas vacías"""
+    block_start = None
+    block_end = 0
+    pos = 0
+
+    def sentences(start: int, end: int) -> Iterator[Tuple[int, int, bool]]:
+        for match in _SENTENCE_END_RE.finditer(text, start, end):
+            yield start, match.end(), False
+            start = match.end()
+        if text[start:end].strip():
+            yield start, end, False
+
+    for line in text.splitlines(keepends=True):
+        line_start, pos = pos, pos + len(line)
+        if not line.strip() or _is_heading(line):
+            if block_start is not None:
+                yield from sentences(block_start, block_end)
+                block_start = None
+            if line.strip():
+                yield line_start, pos, True
+        else:
+            if block_start is None:
+                block_start = line_start
+            block_end = pos
+    if block_start is not None:
+        yield from sentences(block_start, block_end)
+
+def _iter_units(pages: Iterable[str], max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[_Unit]:
+    """Oraciones y títulos con página y offsets globales; las que pasan de max_tokens se parten por palabras"""
+    offset = 0
+    for page_number, page in enumerate(pages, start=1):
+        for start, end, heading in _iter_spans(page):
+            text = " ".join(page[start:end].split())
+            tokens = count_tokens(text)
+            if tokens <= max_tokens:
+                yield _Unit(text, page_number, offset + start, offset + end, tokens, heading)
+                continue
+
+            # Ventanas de palabras proporcionales a los tokens por palabra
+            words = list(_WORD_RE.finditer(page, start, end))
+            step = max(1, int(len(words) * max_tokens / tokens))
+            for i in range(0, len(words), step):
+                window = words[i:i + step]
+                piece = " ".join(word.group() for word in window)
+                yield _Unit(piece, page_number, offset + window[0].start(), offset + window[-1].end(),
+                            count_tokens(piece), heading)
+        offset += len(page)
 
-def split_text_into_chunks(text: str, chunk_size: int = 500) -> List[str]:
+def iter_token_chunks(pages: Iterable[str], max_tokens: int = RAG_CHUNK_TOKENS,
+                      overlap_tokens: int = RAG_CHUNK_OVERLAP,
+                      count_tokens: Optional[Callable[[str], int]] = None) -> Iterator[Chunk]:
+    """Chunks de hasta max_tokens cortados en oraciones y títulos, a medida que llegan las páginas
+
+    Cada chunk nuevo repite las últimas oraciones del anterior (hasta overlap_tokens),
+    salvo al empezar una sección: un título abre chunk si el actual ya tiene contenido.
+    """
+    count_tokens = count_tokens or approx_token_count
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    min_tokens = max_tokens // 4
+    buffer: List[_Unit] = []
+    buffer_tokens = 0
+
+    def make_chunk(units: List[_Unit]) -> Chunk:
+        return Chunk(" ".join(unit.text for unit in units), units[0].page, units[0].start, units[-1].end)
+
+    # Las oraciones partidas dejan sitio para el solapamiento o un título delante
+    for unit in _iter_units(pages, max_tokens - overlap_tokens, count_tokens):
+        if unit.heading and buffer_tokens >= min_tokens:
+            yield make_chunk(buffer)
+            buffer, buffer_tokens = [], 0
+        elif buffer and buffer_tokens + unit.tokens > max_tokens and not all(u.heading for u in buffer):
+            # Un título al final pasa al chunk siguiente junto con su texto
+            carry = [buffer.pop()] if buffer[-1].heading and len(buffer) > 1 else []
+            yield make_chunk(buffer)
+
+            tail: List[_Unit] = []
+            tail_tokens = sum(u.tokens for u in carry)
+            if not carry:
+                for previous in reversed(buffer):
+                    if tail_tokens + previous.tokens > overlap_tokens or \
+                            tail_tokens + previous.tokens + unit.tokens > max_tokens:
+                        break
+                    tail.insert(0, previous)
+                    tail_tokens += previous.tokens
+            buffer = tail + carry
+            buffer_tokens = tail_tokens
+
+        buffer.append(unit)
+        buffer_tokens += unit.tokens
+
+    if buffer:
+        yield make_chunk(buffer)
+
+def split_text_into_chunks(text: str, max_tokens: int = RAG_CHUNK_TOKENS,
+                           overlap_tokens: int = RAG_CHUNK_OVERLAP) -> List[str]:
     """Divide el texto en chunks para vectorizar"""
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size):
-        chunk = " ".join(words[i:i + chunk_size])
-        chunks.append(chunk)
-    
-    return chunks
+    return [chunk.text for chunk in iter_token_chunks([text], max_tokens, overlap_tokens)]
+
+def extract_pdf_chunks(pdf_path: str, max_tokens: int = RAG_CHUNK_TOKENS, overlap_tokens: int = RAG_CHUNK_OVERLAP,
+                       tokenizer_name: Optional[str] = None) -> List[Chunk]:
+    """Extrae y trocea un PDF (pensado para ejecutarse en un pool de procesos)"""
+    count_tokens = get_token_counter(tokenizer_name)
+    with open(pdf_path, 'rb') as file:
+        return list(iter_token_chunks(iter_pdf_pages(file), max_tokens, overlap_tokens, count_tokens))
+
+def file_sha256(source: Union[str, bytes, BinaryIO]) -> str:
+    """Hash SHA-256 del contenido (ruta o archivo abierto; el archivo vuelve al inicio)"""
+    digest = hashlib.sha256()
+    if isinstance(source, str):
+        with open(source, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+    elif isinstance(source, (bytes, bytearray)):
+        digest.update(source)
+    else:
+        source.seek(0)
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
 
 def process_all_pdfs(pdf_folder: str) -> List[str]:
     """Procesa todos los PDFs de una carpeta"""
@@ -0,0 +1,132 @@
+import numpy as np
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+import os
+import queue
+import threading
+import time
+from .metrics import Trace, current_trace, use_trace
+
+RAG_BATCH_MAX_SIZE = int(os.getenv("RAG_BATCH_MAX_SIZE", "32"))
+RAG_BATCH_MAX_WAIT_MS = float(os.getenv("RAG_BATCH_MAX_WAIT_MS", "5"))
+
+class _Request:
+    __slots__ = ("query", "k", "embedding", "future", "trace")
+
+    def __init__(self, query: str, k: int, embedding: Optional[np.ndarray]):
+        self.query = query
+        self.k = k  # 0 = solo embedding
+        self.embedding = embedding
+        self.future: Future = Future()
+        # Trace del update que la pide: el hilo del lote no hereda su contexto
+        self.trace = current_trace()
+
+class QueryBatcher:
+    """Agrupa consultas concurrentes: un encode y una búsqueda FAISS por lote
+
+    Los llamadores (hilos del pool de asyncio.to_thread) se bloquean hasta que
+    su lote se procesa; el primer pedido espera como máximo max_wait_ms.
+    Las etapas medidas durante el lote (encode, búsqueda) se suman al trace
+    de cada consulta del lote.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 search_fn: Callable[[np.ndarray, int], List[List[int]]],
+                 max_batch_size: int = RAG_BATCH_MAX_SIZE, max_wait_ms: float = RAG_BATCH_MAX_WAIT_MS):
+        self.encode_fn = encode_fn
+        self.search_fn = search_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.batches = 0
+        self.requests = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rag-query-batcher", daemon=True)
+                self._thread.start()
+
+    def _submit(self, query: str, k: int, embedding: Optional[np.ndarray]) -> Future:
+        self._ensure_started()
+        request = _Request(query, k, embedding)
+        self._queue.put(request)
+        return request.future
+
+    def embed(self, query: str) -> np.ndarray:
+        """Embedding (1, dim) de la consulta, calculado en lote con otras"""
+        return self._submit(query, 0, None).result()
+
+    def search(self, query: str, k: int, embedding: Optional[np.ndarray] = None) -> List[int]:
+        """Ids de los k chunks más similares (reutiliza el embedding si se pasa)"""
+        return self._submit(query, k, embedding).result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch: List[_Request]):
+        batch_trace = Trace()
+        try:
+            with use_trace(batch_trace):
+                # Un solo encode para todas las consultas sin embedding
+                pending = [request for request in batch if request.embedding is None]
+                if pending:
+                    vectors = self.encode_fn([request.query for request in pending])
+                    for request, vector in zip(pending, vectors):
+                        request.embedding = vector.reshape(1, -1)
+
+                # Una sola búsqueda con el mayor k del lote
+                searches = [request for request in batch if request.k > 0]
+                results = []
+                if searches:
+                    query_vectors = np.vstack([request.embedding for request in searches]).astype('float32')
+                    results = self.search_fn(query_vectors, max(request.k for request in searches))
+
+            # Antes de entregar: el llamador puede cerrar su trace en cuanto recibe el resultado
+            self._share_stages(batch, batch_trace)
+            for request, hits in zip(searches, results):
+                request.future.set_result(hits[:request.k])
+            for request in batch:
+                if request.k == 0:
+                    request.future.set_result(request.embedding)
+
+            self.batches += 1
+            self.requests += len(batch)
+
+        except Exception as e:
+            self._share_stages([request for request in batch if not request.future.done()], batch_trace)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    @staticmethod
+    def _share_stages(batch: List[_Request], batch_trace: Trace):
+        """Sumar a cada trace del lote las etapas que se midieron al procesarlo"""
+        for request in batch:
+            if request.trace is not None:
+                for stage, seconds in batch_trace.stages.items():
+                    request.trace.add(stage, seconds)
+        batch_trace.stages.clear()  # Cada etapa se reparte una sola vez
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0
+        }
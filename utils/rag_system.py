@@ -1,179 +1,891 @@
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple, Union, BinaryIO
 import os
 import pickle
 import json
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from .segment_store import SegmentStore, StaleManifestError, ids_to_ranges, ranges_to_ids
+from .chunk_store import ChunkStore
+from .query_batcher import QueryBatcher
+from .embedding_cache import EmbeddingCache, RAG_EMBED_CACHE
+from .metrics import timed
+from .embedders import RAG_EMBED_BACKEND, PARITY_SAMPLE, BACKENDS, Embedder, get_embedder, parity_check
+from .lexical_index import LexicalIndex, PostingsBuilder, tokenize, is_code, reciprocal_rank_fusion
+from .pdf_processor import (Chunk, iter_pdf_pages, iter_token_chunks, extract_pdf_chunks, file_sha256,
+                            approx_token_count)
+from .vector_index import (RAG_INDEX_TYPE, RAG_NPROBE, RAG_EF_SEARCH, RAG_TRAIN_SAMPLE, RAG_VECTOR_STORAGE,
+                           STORAGE_MODES, choose_index_type, choose_storage, create_index, normalize,
+                           search_params, bitmap_selector, index_nbytes)
+
+# Número de segmentos a partir del cual se fusionan en segundo plano
+RAG_MAX_SEGMENTS = int(os.getenv("RAG_MAX_SEGMENTS", "8"))
+# Fracción de chunks borrados de un segmento a partir de la cual se fusiona (purga los tombstones)
+RAG_MAX_DELETED_RATIO = float(os.getenv("RAG_MAX_DELETED_RATIO", "0.2"))
+# Candidatos extra por consulta sobre los que predice la proporción de borrados
+RAG_FETCH_MARGIN = 8
+# Chunks en el índice delta (en memoria) antes de regenerar el snapshot mmap
+RAG_DELTA_MAX_CHUNKS = int(os.getenv("RAG_DELTA_MAX_CHUNKS", "5000"))
+# Vectores por lote al construir índices desde los segmentos mapeados
+RAG_BUILD_BATCH = 16384
+# Ingesta: chunks por llamada a encode y lotes en espera entre extracción y encode
+RAG_ENCODE_BATCH = int(os.getenv("RAG_ENCODE_BATCH", "64"))
+RAG_INGEST_QUEUE = int(os.getenv("RAG_INGEST_QUEUE", "4"))
+# Indexación masiva: procesos de extracción y chunks por llamada a encode
+RAG_BULK_WORKERS = int(os.getenv("RAG_BULK_WORKERS", str(os.cpu_count() or 2)))
+RAG_BULK_ENCODE_BATCH = int(os.getenv("RAG_BULK_ENCODE_BATCH", "256"))
+# Búsqueda híbrida (BM25 + vectores) y candidatos por ranking antes de fusionar
+RAG_HYBRID = os.getenv("RAG_HYBRID", "1") == "1"
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+# Con vectores comprimidos: re-ordenar RAG_RERANK_FACTOR·k candidatos con los vectores exactos del disco
+RAG_RERANK = os.getenv("RAG_RERANK", "1") == "1"
+RAG_RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+# Resultados puntuados: similitud coseno mínima, balance relevancia/diversidad (MMR)
+# y similitud a partir de la cual dos chunks se consideran duplicados
+RAG_MIN_SCORE = float(os.getenv("RAG_MIN_SCORE", "0.3"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_DUPLICATE_THRESHOLD = float(os.getenv("RAG_DUPLICATE_THRESHOLD", "0.95"))
+
+class SearchResult(NamedTuple):
+    """Chunk recuperado con su similitud coseno con la consulta, su relevancia y su origen
+
+    relevance es el score de la fusión híbrida (BM25 + vectores) normalizado a [0, 1]
+    respecto al mejor candidato; es el orden que usa MMR y build_context.
+    """
+    chunk_id: int
+    text: str
+    score: float
+    document: Optional[str]
+    page: int
+    relevance: float = 0.0
 
 class RAGSystem:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
-        self.index = None
-        self.chunks = []
-        self.documents = {}  # Mapeo de documento -> chunks
-        self.db_path = "faiss_db"
+    # Ids reservados de una vez en el contador compartido (los sobrantes quedan como huecos)
+    ID_BLOCK = 1024
+    
+    def __init__(self, model_name="all-MiniLM-L6-v2", index_type: str = RAG_INDEX_TYPE,
+                 vector_storage: str = RAG_VECTOR_STORAGE, embed_backend: str = RAG_EMBED_BACKEND,
+                 db_path: str = "faiss_db", embedder: Optional[Embedder] = None):
+        self.model_name = model_name
+        # Backend de embeddings (torch | onnx | onnx-int8); los pesos se cargan en el primer encode
+        if embedder is not None:
+            self.embedder: Embedder = embedder
+        else:
+            try:
+                self.embedder = get_embedder(model_name, embed_backend)
+            except ImportError as e:
+                print(f"⚠️ Backend {embed_backend} no disponible ({e}), se usa torch")
+                self.embedder = get_embedder(model_name, "torch")
+        self.index = None  # Snapshot base (mmap, solo lectura) con ids estables
+        self.delta_index = None  # Índice plano en memoria con segmentos posteriores al snapshot
+        
+        # Tipo de índice base (auto elige por tamaño) y parámetros de búsqueda
+        self.index_type = index_type
+        self.nprobe = RAG_NPROBE
+        self.ef_search = RAG_EF_SEARCH
+        # Compresión del índice base (float32 | fp16 | int8 | pq) y re-ranking exacto
+        self.vector_storage = vector_storage
+        self.rerank = RAG_RERANK
+        self.rerank_factor = max(1, RAG_RERANK_FACTOR)
+        self.chunks = ChunkStore()  # Tabla columnar por chunk id (texto mapeado, documento, página...)
+        self.lexical = LexicalIndex()  # Índice invertido BM25 por segmento
+        self.documents: Dict[str, List[List[int]]] = {}  # documento -> rangos de chunk ids
+        self.document_hashes: Dict[str, str] = {}  # documento -> SHA-256 del PDF
+        self.document_tags: Dict[str, List[str]] = {}  # documento -> etiquetas (p.ej. producto)
+        # Número de documento en la tabla de chunks (chunk -> documento en O(1))
+        self.document_numbers: Dict[str, int] = {}
+        self._document_names: List[Optional[str]] = []
+        self.next_chunk_id = 0
+        self.db_path = db_path
+        
+        # Persistencia por segmentos inmutables + manifest
+        self.store = SegmentStore(self.db_path)
+        
+        # Embeddings de chunks ya vistos (re-subidas, re-indexados): no se recalculan
+        self.embedding_cache = EmbeddingCache(os.path.join(self.db_path, "embedding_cache"), self.embedder.cache_name) \
+            if RAG_EMBED_CACHE else None
+        self.segments: List[Dict[str, Any]] = []
+        self.deleted_ids: Set[int] = set()  # Tombstones en disco hasta fusionar segmentos
+        self.snapshot: Dict[str, Any] = {}  # {"file": ..., "segments": [...]} cubiertos por self.index
+        self._generation = 0  # Generación del manifest que refleja la memoria de este proceso
+        self._manifest_stamp = None  # (inodo, mtime, tamaño) del manifest al cargarlo
+        self._id_block = (0, 0)  # Ids reservados en disco y aún sin usar: [inicio, fin)
+        
+        # Versión del corpus: cambia con cada subida/borrado (invalida cachés)
+        self.version = 0
+        
+        # Consultas concurrentes: un encode y una búsqueda por lote
+        self.batcher = QueryBatcher(self._encode_queries, self._search_ids)
+        
+        self._write_lock = threading.RLock()
+        self._compaction_thread = None
+        
+        # Selectores FAISS por filtro de documentos (válidos para una versión del corpus)
+        self._filter_cache: Dict[Tuple[int, ...], Any] = {}
+        self._filter_version = None
         
+    @property
+    def tokenizer(self):
+        """Tokenizer del modelo para medir los chunks"""
+        return self.embedder.tokenizer
+    
+    @property
+    def tokenizer_name(self) -> Optional[str]:
+        return self.embedder.tokenizer_name
+    
+    def warm_up(self):
+        """Cargar el modelo y ejecutar una consulta de prueba (la primera real no paga el arranque)"""
+        start = time.perf_counter()
+        if len(self.chunks) > 0:
+            self.search_scored("warm-up", 1)
+        else:
+            self._encode_queries(["warm-up"])
+        print(f"🔥 RAG precalentado en {time.perf_counter() - start:.1f}s")
+    
     def load_database(self):
-        """Cargar base de datos FAISS si existe"""
+        """Cargar base de datos desde el manifest y sus segmentos"""
         try:
-            if os.path.exists(f"{self.db_path}/faiss.index"):
-                self.index = faiss.read_index(f"{self.db_path}/faiss.index")
+            with self._write_lock, self.store.lock():
+                stamp = self.store.manifest_stamp()
+                manifest = self.store.load_manifest()
                 
-            if os.path.exists(f"{self.db_path}/chunks.pkl"):
-                with open(f"{self.db_path}/chunks.pkl", "rb") as f:
-                    self.chunks = pickle.load(f)
-                    
-            if os.path.exists(f"{self.db_path}/documents.json"):
-                with open(f"{self.db_path}/documents.json", "r", encoding="utf-8") as f:
-                    self.documents = json.load(f)
+                if manifest is None and os.path.exists(f"{self.db_path}/faiss.index"):
+                    manifest = self._migrate_legacy_database()
+                    stamp = self.store.manifest_stamp()
+                
+                if manifest is not None:
+                    self._load_from_manifest(manifest)
+                    self._manifest_stamp = stamp
                     
             print(f"✅ Base de datos RAG cargada: {len(self.chunks)} chunks, {len(self.documents)} documentos")
             return True
         except Exception as e:
             print(f"⚠️ Error cargando base de datos RAG: {e}")
             return False
+    
+    def _load_from_manifest(self, manifest: Dict[str, Any]):
+        """Abrir snapshot y segmentos mapeados en memoria; solo el delta se carga en RAM"""
+        segments = list(manifest.get("segments", []))
+        segment_names = {segment["name"] for segment in segments}
+        deleted_ids = set(ranges_to_ids(manifest.get("deleted", [])))
+        deleted_array = np.fromiter(deleted_ids, dtype='int64', count=len(deleted_ids))
+        
+        # Snapshot válido solo si todos sus segmentos siguen en el manifest
+        # (y usa producto interno; los snapshots L2 antiguos se regeneran)
+        snapshot = manifest.get("snapshot") or {}
+        index = None
+        if snapshot and snapshot.get("metric") == "ip" and set(snapshot["segments"]) <= segment_names:
+            index = self.store.read_index(snapshot["file"])
+        else:
+            snapshot = {}
+        
+        covered = set(snapshot.get("segments", []))
+        delta_index = self._build_index([s for s in segments if s["name"] not in covered], deleted_ids)
+        
+        chunks = ChunkStore()
+        lexical = LexicalIndex()
+        for segment in segments:
+            name = segment["name"]
+            ids = self.store.read_ids(name)
+            chunks.attach(name, self.store.segment_dir(name), ids, deleted_array, self.store.read_positions(name))
+            lexical.attach(name, ids, self._segment_postings(name), deleted_array)
+        
+        documents = manifest.get("documents", {})
+        document_names = list(documents)
+        for number, ranges in enumerate(documents.values()):
+            chunks.set_document(ranges, number)
+        
+        with self._write_lock:
+            self.index = index
+            self.delta_index = delta_index
+            self.chunks = chunks
+            self.lexical = lexical
+            self.segments = segments
+            self.snapshot = snapshot
+            self.deleted_ids = deleted_ids
+            self.documents = {name: [list(r) for r in ranges] for name, ranges in documents.items()}
+            self.document_numbers = {name: number for number, name in enumerate(document_names)}
+            self._document_names = document_names
+            self.document_hashes = dict(manifest.get("hashes", {}))
+            self.document_tags = dict(manifest.get("tags", {}))
+            self.next_chunk_id = max(self.next_chunk_id, manifest.get("next_chunk_id", 0))
+            self._generation = manifest.get("generation", 0)
+            self.version += 1
+        
+        self.store.cleanup_orphans(manifest)
+        if self._needs_compaction():
+            self._schedule_compaction()
+    
+    @contextmanager
+    def _transaction(self):
+        """Modificar el corpus con la base bloqueada entre procesos y la memoria al día
+
+        Si otro worker publicó desde nuestra última carga, se recarga su manifest
+        antes de aplicar el cambio: el commit posterior nunca pisa lo suyo.
+        """
+        with self._write_lock, self.store.lock():
+            stamp = self.store.manifest_stamp()
+            if stamp != self._manifest_stamp:
+                manifest = self.store.load_manifest()
+                if manifest is not None and manifest.get("generation", 0) != self._generation:
+                    print(f"🔄 Manifest actualizado por otro proceso (generación {manifest.get('generation')})")
+                    self._load_from_manifest(manifest)
+                self._manifest_stamp = stamp
+            yield
+    
+    def disk_changed(self) -> bool:
+        """Si otro proceso publicó un manifest desde nuestra última carga (solo un stat)"""
+        stamp = self.store.manifest_stamp()
+        return stamp is not None and stamp != self._manifest_stamp
+    
+    def sync_with_disk(self):
+        """Recargar si otro proceso publicó un manifest (subida, borrado o compactación)"""
+        if not self.disk_changed():
+            return
+        try:
+            with self._transaction():
+                pass
+        except Exception as e:
+            print(f"⚠️ No se pudo recargar el manifest: {e}")
+    
+    def _segment_postings(self, name: str) -> Dict[str, np.ndarray]:
+        """Postings BM25 de un segmento (se generan y guardan si el segmento es antiguo)"""
+        arrays = self.store.read_postings(name)
+        if arrays is None:
+            builder = PostingsBuilder()
+            builder.add(self.store.read_texts(name))
+            arrays = builder.arrays()
+            self.store.write_postings(name, arrays)
+        return arrays
+    
+    def _build_index(self, segments: List[Dict[str, Any]], deleted_ids: Set[int], kind: str = "flat",
+                     storage: str = "float32"):
+        """Construir un índice desde los vectores mapeados de los segmentos (sin re-embeber)"""
+        if not segments:
+            return None
+        
+        deleted_array = np.fromiter(deleted_ids, dtype='int64', count=len(deleted_ids))
+        n_live = max(0, sum(segment["count"] for segment in segments) - len(deleted_ids))
+        dimension = self.store.read_vectors(segments[0]["name"]).shape[1]
+        index = create_index(kind, dimension, n_live, storage)
+        
+        if not index.is_trained:
+            index.train(self._training_sample(segments, deleted_array, n_live))
+        
+        for segment in segments:
+            ids = self.store.read_ids(segment["name"])
+            vectors = self.store.read_vectors(segment["name"])
             
+            # Por lotes: nunca hay una segunda copia completa de los vectores en RAM
+            for start in range(0, len(ids), RAG_BUILD_BATCH):
+                batch_ids = ids[start:start + RAG_BUILD_BATCH]
+                keep = np.flatnonzero(~np.isin(batch_ids, deleted_array))
+                if len(keep):
+                    batch = normalize(vectors[start:start + RAG_BUILD_BATCH][keep])
+                    index.add_with_ids(batch, batch_ids[keep])
+        
+        return index
+    
+    def _training_sample(self, segments: List[Dict[str, Any]], deleted_array: np.ndarray, n_live: int) -> np.ndarray:
+        """Muestra aleatoria de vectores vivos para entrenar IVF/PQ"""
+        rng = np.random.default_rng(0)
+        fraction = min(1.0, RAG_TRAIN_SAMPLE / max(n_live, 1))
+        sample = []
+        
+        for segment in segments:
+            ids = self.store.read_ids(segment["name"])
+            rows = np.flatnonzero(~np.isin(ids, deleted_array))
+            if fraction < 1.0:
+                rows = rows[rng.random(len(rows)) < fraction]
+            if len(rows):
+                sample.append(normalize(self.store.read_vectors(segment["name"])[np.sort(rows)]))
+        
+        return np.vstack(sample)
+    
+    def _migrate_legacy_database(self) -> Dict[str, Any]:
+        """Convertir el formato antiguo (faiss.index + chunks.pkl + documents.json) en un segmento"""
+        index = faiss.read_index(f"{self.db_path}/faiss.index")
+        
+        chunks = []
+        if os.path.exists(f"{self.db_path}/chunks.pkl"):
+            with open(f"{self.db_path}/chunks.pkl", "rb") as f:
+                chunks = pickle.load(f)
+        if isinstance(chunks, list):
+            chunks = dict(enumerate(chunks))
+        
+        documents = {}
+        if os.path.exists(f"{self.db_path}/documents.json"):
+            with open(f"{self.db_path}/documents.json", "r", encoding="utf-8") as f:
+                documents = json.load(f)
+        
+        # Los vectores se reconstruyen del índice: no hace falta re-embeber
+        if isinstance(index, faiss.IndexIDMap2):
+            ids = faiss.vector_to_array(index.id_map)
+            vectors = index.index.reconstruct_n(0, index.ntotal)
+        else:
+            ids = np.arange(index.ntotal, dtype='int64')
+            vectors = index.reconstruct_n(0, index.ntotal)
+        
+        texts = [chunks.get(int(i), "") for i in ids]
+        segments = [self.store.write_segment(ids, vectors, texts)] if len(ids) else []
+        
+        manifest = {
+            "next_chunk_id": int(ids.max()) + 1 if len(ids) else 0,
+            "segments": segments,
+            "documents": {name: ids_to_ranges(chunk_ids) for name, chunk_ids in documents.items()},
+            "deleted": ids_to_ranges([int(i) for i, text in zip(ids, texts) if not text.strip()])
+        }
+        self.store.commit(manifest)
+        
+        print(f"🔄 Base RAG migrada a segmentos: {len(ids)} vectores")
+        return manifest
+            
+    @timed("save_database")
     def save_database(self):
-        """Guardar base de datos FAISS"""
+        """Guardar manifest (swap atómico; los segmentos ya están en disco)"""
         try:
-            os.makedirs(self.db_path, exist_ok=True)
-            
-            if self.index is not None:
-                faiss.write_index(self.index, f"{self.db_path}/faiss.index")
-                
-            with open(f"{self.db_path}/chunks.pkl", "wb") as f:
-                pickle.dump(self.chunks, f)
-                
-            with open(f"{self.db_path}/documents.json", "w", encoding="utf-8") as f:
-                json.dump(self.documents, f, indent=2, ensure_ascii=False)
+            with self._write_lock:
+                manifest = {
+                    "generation": self._generation,
+                    "next_chunk_id": self.next_chunk_id,
+                    "segments": self.segments,
+                    "snapshot": self.snapshot,
+                    "documents": self.documents,
+                    "hashes": self.document_hashes,
+                    "tags": self.document_tags,
+                    "deleted": ids_to_ranges(self.deleted_ids)
+                }
+                self._manifest_stamp = self.store.commit(manifest)
+                self._generation = manifest["generation"]
                 
             print("✅ Base de datos RAG guardada")
             return True
+        except StaleManifestError as e:
+            # Cambio hecho fuera de _transaction() sobre una copia vieja: no se pisa el manifest
+            print(f"❌ Base de datos RAG no guardada, otro proceso la modificó ({e})")
+            return False
         except Exception as e:
             print(f"❌ Error guardando base de datos RAG: {e}")
             return False
     
-    def add_pdf_from_upload(self, file_content: bytes, filename: str) -> bool:
-        """Procesar PDF desde upload y agregarlo al sistema"""
+    @timed("ingest_pdf")
+    def add_pdf_from_upload(self, file_content: Union[bytes, BinaryIO], filename: str,
+                            tags: Optional[List[str]] = None) -> bool:
+        """Procesar PDF desde upload (bytes o archivo abierto) y agregarlo al sistema
+
+        Pipeline en streaming: un hilo extrae y trocea páginas mientras este
+        codifica lotes y los vuelca al segmento; la memoria no depende del tamaño del PDF.
+        Las etiquetas (si se indican) permiten filtrar búsquedas por producto o tema.
+        """
         try:
-            from PyPDF2 import PdfReader
-            import io
+            self.sync_with_disk()
+            # Mismo contenido ya indexado: nada que hacer (salvo actualizar etiquetas)
+            content_hash = file_sha256(file_content)
+            if self.document_hashes.get(filename) == content_hash:
+                if tags is not None:
+                    self.set_document_tags(filename, tags)
+                print(f"⏭️ {filename} sin cambios, se omite")
+                return True
             
-            # Leer PDF desde bytes
-            pdf_reader = PdfReader(io.BytesIO(file_content))
+            chunks = iter_token_chunks(iter_pdf_pages(file_content), count_tokens=self._count_tokens)
+            count = self._ingest(self._prefetch_batches(chunks), filename, content_hash, tags)
             
-            # Extraer texto
-            text_content = ""
-            for page in pdf_reader.pages:
-                text_content += page.extract_text() + "\n"
-            
-            if not text_content.strip():
+            if count == 0:
                 print(f"⚠️ No se pudo extraer texto de {filename}")
                 return False
             
-            # Dividir en chunks
-            chunks = self._split_text(text_content, chunk_size=500)
-            
-            if not chunks:
-                print(f"⚠️ No se generaron chunks para {filename}")
-                return False
-            
-            # Agregar al sistema
-            self._add_chunks(chunks, filename)
-            
-            print(f"✅ PDF procesado: {filename} - {len(chunks)} chunks")
+            print(f"✅ PDF procesado: {filename} - {count} chunks")
             return True
             
         except Exception as e:
             print(f"❌ Error procesando PDF {filename}: {e}")
             return False
     
-    def _split_text(self, text: str, chunk_size: int = 500) -> List[str]:
-        """Dividir texto en chunks"""
-        words = text.split()
-        chunks = []
+    def _count_tokens(self, text: str) -> int:
+        if self.tokenizer is None:
+            return approx_token_count(text)
+        return len(self.tokenizer.tokenize(text))
+    
+    def _prefetch_batches(self, chunks: Iterator[Chunk], batch_size: int = RAG_ENCODE_BATCH) -> Iterator[List[Chunk]]:
+        """Producir lotes de chunks en un hilo aparte con una cola acotada"""
+        batches: "queue.Queue[Any]" = queue.Queue(maxsize=RAG_INGEST_QUEUE)
+        done = object()
+        stop = threading.Event()
         
-        for i in range(0, len(words), chunk_size):
-            chunk = " ".join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk.strip())
+        def produce():
+            try:
+                batch = []
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    batch.append(chunk)
+                    if len(batch) == batch_size:
+                        batches.put(batch)
+                        batch = []
+                if batch:
+                    batches.put(batch)
+                batches.put(done)
+            except Exception as e:
+                batches.put(e)
         
-        return chunks
+        producer = threading.Thread(target=produce, name="rag-pdf-extract", daemon=True)
+        producer.start()
+        
+        try:
+            while True:
+                item = batches.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Si el consumidor aborta, desbloquear al productor y esperar a que termine
+            stop.set()
+            while producer.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    producer.join(0.05)
     
-    def _add_chunks(self, chunks: List[str], document_name: str):
-        """Agregar chunks al índice FAISS"""
+    def _allocate_ids(self, count: int) -> np.ndarray:
+        """Reservar ids estables (no cambian aunque se borren otros documentos)
+
+        Salen del contador en disco, por bloques: únicos entre todos los procesos.
+        """
+        with self._write_lock:
+            start, end = self._id_block
+            if end - start < count:
+                block = max(count, self.ID_BLOCK)
+                start = self.store.reserve_ids(block, self.next_chunk_id)
+                end = start + block
+            self._id_block = (start + count, end)
+            self.next_chunk_id = max(self.next_chunk_id, start + count)
+            return np.arange(start, start + count, dtype='int64')
+    
+    def _ingest(self, batches: Iterable[List[Chunk]], document_name: str, content_hash: str = None,
+                tags: Optional[List[str]] = None) -> int:
+        """Codificar lotes y volcarlos a un segmento nuevo; publicarlo al terminar"""
+        writer = self.store.open_segment()
         try:
-            # Generar embeddings
-            embeddings = self.model.encode(chunks)
-            
-            # Crear o extender índice FAISS
-            if self.index is None:
-                dimension = embeddings.shape[1]
-                self.index = faiss.IndexFlatL2(dimension)
+            for batch in batches:
+                texts = [chunk.text for chunk in batch]
+                embeddings = self._embed_chunks(texts, len(texts))
+                writer.append(self._allocate_ids(len(batch)), embeddings, texts, self._positions(batch))
             
-            # Agregar al índice
-            self.index.add(embeddings.astype('float32'))
-            
-            # Guardar chunks y mapeo de documentos
-            start_idx = len(self.chunks)
-            self.chunks.extend(chunks)
+            if writer.count == 0:
+                writer.abort()
+                return 0
+            segment = writer.finish()
+        except Exception:
+            writer.abort()
+            raise
+        
+        hashes = {document_name: content_hash} if content_hash else {}
+        self._publish_segment(segment, {document_name: self.store.read_ids(segment["name"])}, hashes,
+                              {document_name: tags} if tags is not None else None)
+        return segment["count"]
+    
+    def _register_document(self, document_name: str) -> int:
+        """Número de documento en la tabla de chunks (se reutiliza al reemplazar)"""
+        number = self.document_numbers.get(document_name)
+        if number is None:
+            number = len(self._document_names)
+            self._document_names.append(document_name)
+            self.document_numbers[document_name] = number
+        return number
+    
+    def document_of(self, chunk_id: int) -> Optional[str]:
+        """Documento al que pertenece un chunk (None si no existe o está borrado)"""
+        number = self.chunks.document(chunk_id)
+        return self._document_names[number] if number >= 0 else None
+    
+    @staticmethod
+    def _clean_tags(tags: Iterable[str]) -> List[str]:
+        return sorted({tag.strip().lower() for tag in tags if tag and tag.strip()})
+    
+    def set_document_tags(self, document_name: str, tags: Iterable[str]) -> bool:
+        """Reemplazar las etiquetas de un documento"""
+        with self._transaction():
+            if document_name not in self.documents:
+                return False
+            self.document_tags[document_name] = self._clean_tags(tags)
+            self.version += 1
+            return self.save_database()
+    
+    def _publish_segment(self, segment: Dict[str, Any], documents: Dict[str, Sequence[int]],
+                         hashes: Dict[str, str] = None, tags: Dict[str, List[str]] = None):
+        """Hacer visible un segmento ya escrito: delta, textos, mapeo y manifest
+
+        Si un documento ya existía, su versión anterior se reemplaza en el mismo commit.
+        """
+        name = segment["name"]
+        ids = self.store.read_ids(name)
+        vectors = self.store.read_vectors(name)
+        
+        with self._transaction():
+            # Los chunks nuevos van al índice delta (copy-on-write: es pequeño y
+            # las búsquedas concurrentes nunca lo ven a medio modificar)
+            if self.delta_index is None:
+                delta_index = create_index("flat", vectors.shape[1])
+            else:
+                delta_index = faiss.clone_index(self.delta_index)
+            for start in range(0, len(ids), RAG_BUILD_BATCH):
+                delta_index.add_with_ids(np.ascontiguousarray(vectors[start:start + RAG_BUILD_BATCH]),
+                                         ids[start:start + RAG_BUILD_BATCH])
             
-            # Mapear documento -> índices de chunks
-            chunk_indices = list(range(start_idx, start_idx + len(chunks)))
-            self.documents[document_name] = chunk_indices
+            # Guardar chunks y mapeo de documentos (tombstones para versiones anteriores)
+            self.chunks.attach(name, self.store.segment_dir(name), ids, positions=self.store.read_positions(name))
+            self.lexical.attach(name, ids, self._segment_postings(name))
+            for document_name, chunk_ids in documents.items():
+                old_ranges = self.documents.get(document_name)
+                if old_ranges:
+                    old_ids = ranges_to_ids(old_ranges)
+                    self.chunks.discard(old_ids)
+                    self.lexical.discard(old_ids)
+                    self.deleted_ids.update(old_ids)
+                ranges = ids_to_ranges([int(chunk_id) for chunk_id in chunk_ids])
+                self.chunks.set_document(ranges, self._register_document(document_name))
+                self.documents[document_name] = ranges
+            self.document_hashes.update(hashes or {})
+            for document_name, document_tags in (tags or {}).items():
+                self.document_tags[document_name] = self._clean_tags(document_tags)
+            self.segments.append(segment)
+            self.delta_index = delta_index
+            self.version += 1
             
-            # Guardar base de datos
+            # Publicar el segmento con un swap atómico del manifest
             self.save_database()
+        
+        if self._needs_compaction():
+            self._schedule_compaction()
+    
+    @staticmethod
+    def _positions(chunks: List[Chunk]) -> np.ndarray:
+        return np.array([(chunk.page, chunk.start, chunk.end) for chunk in chunks], dtype='int64').reshape(-1, 3)
+    
+    @timed("add_chunks")
+    def _add_chunks(self, chunks: List[Union[str, Chunk]], document_name: str):
+        """Agregar chunks al índice FAISS (texto suelto: sin página ni offsets)"""
+        try:
+            chunks = [chunk if isinstance(chunk, Chunk) else Chunk(chunk, 0, 0, len(chunk)) for chunk in chunks]
+            batches = (chunks[i:i + RAG_ENCODE_BATCH] for i in range(0, len(chunks), RAG_ENCODE_BATCH))
+            self._ingest(batches, document_name)
             
             print(f"✅ Agregado al índice: {len(chunks)} chunks de {document_name}")
             
         except Exception as e:
             print(f"❌ Error agregando chunks: {e}")
     
-    def search_similar(self, query: str, k: int = 3) -> List[str]:
-        """Buscar chunks similares a la consulta"""
-        if self.index is None or len(self.chunks) == 0:
+    @timed("embed_chunks")
+    def _embed_chunks(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Embeddings normalizados de chunks: solo se codifican los que no están en caché"""
+        if self.embedding_cache is None:
+            # Embeddings normalizados: similitud coseno por producto interno
+            return normalize(self.embedder.encode(texts, batch_size=batch_size))
+        
+        keys, embeddings, found = self.embedding_cache.get_many(texts)
+        missing = np.flatnonzero(~found)
+        if len(missing):
+            encoded = normalize(self.embedder.encode([texts[i] for i in missing], batch_size=batch_size))
+            if embeddings is None:
+                embeddings = np.zeros((len(texts), encoded.shape[1]), dtype='float32')
+            embeddings[missing] = encoded
+            self.embedding_cache.put_many([keys[i] for i in missing], encoded)
+        return embeddings
+    
+    @timed("encode_queries")
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        return normalize(self.embedder.encode(queries, batch_size=len(queries)))
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embedding normalizado (1, dim) de una consulta (agrupado con otras en curso)"""
+        return self.batcher.embed(query)
+    
+    def search_similar(self, query: str, k: int = 3, query_embedding: np.ndarray = None,
+                       documents: Optional[Iterable[str]] = None, tags: Optional[Iterable[str]] = None,
+                       min_score: float = RAG_MIN_SCORE) -> List[str]:
+        """Buscar chunks similares a la consulta (textos de search_scored)"""
+        return [result.text for result in self.search_scored(query, k, query_embedding, documents, tags, min_score)]
+    
+    def search_scored(self, query: str, k: int = 3, query_embedding: np.ndarray = None,
+                      documents: Optional[Iterable[str]] = None, tags: Optional[Iterable[str]] = None,
+                      min_score: float = RAG_MIN_SCORE, mmr_lambda: float = RAG_MMR_LAMBDA) -> List[SearchResult]:
+        """Hasta k chunks relevantes, con su similitud coseno y su relevancia híbrida
+
+        Los candidatos de la búsqueda híbrida llegan con su score de fusión (BM25 +
+        vectores); se descartan los que no llegan a min_score de similitud coseno
+        (salvo coincidencias exactas de un código de la consulta) y se eligen por
+        MMR (relevancia fusionada menos parecido con los ya elegidos), saltando
+        casi-duplicados. Puede devolver menos de k, o nada si la consulta no trata
+        de los documentos.
+        documents / tags limitan la búsqueda a esos documentos (o a los que tengan
+        alguna de las etiquetas); el filtro se aplica dentro de la búsqueda FAISS.
+        """
+        self.sync_with_disk()
+        if len(self.chunks) == 0:
             return []
         
         try:
-            # Generar embedding de la consulta
-            query_embedding = self.model.encode([query])
+            search_filter = None
+            if documents is not None or tags is not None:
+                search_filter = self._document_filter(documents, tags)
+                if search_filter is None:
+                    return []
             
-            # Buscar en FAISS
-            distances, indices = self.index.search(query_embedding.astype('float32'), k)
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+            query_vector = np.asarray(query_embedding, dtype='float32').reshape(-1)
             
-            # Obtener chunks relevantes
-            relevant_chunks = []
-            for idx in indices[0]:
-                if 0 <= idx < len(self.chunks):
-                    relevant_chunks.append(self.chunks[idx])
+            candidates = self._hybrid_search(query, k, query_embedding, search_filter,
+                                             fetch=max(k * 3, RAG_HYBRID_CANDIDATES))
+            fused = {chunk_id: (score, exact) for chunk_id, score, exact in candidates}
+            ids, vectors = self.chunks.vectors([chunk_id for chunk_id, _, _ in candidates])
+            if not len(ids):
+                return []
+            vectors = normalize(vectors)
+            scores = vectors @ query_vector
+            relevance = np.array([fused[int(chunk_id)][0] for chunk_id in ids], dtype='float32')
+            relevance /= max(float(relevance.max()), 1e-9)
+            exact = np.array([fused[int(chunk_id)][1] for chunk_id in ids], dtype=bool)
             
-            return relevant_chunks
+            relevant = np.flatnonzero((scores >= min_score) | exact)
+            selected = self._mmr(relevance[relevant], vectors[relevant], k, mmr_lambda)
+            
+            results = []
+            for i in relevant[np.array(selected, dtype='int64')]:
+                chunk_id = int(ids[i])
+                text = self.chunks.get(chunk_id)
+                if text is not None:
+                    position = self.chunks.position(chunk_id)
+                    results.append(SearchResult(chunk_id, text, float(scores[i]), self.document_of(chunk_id),
+                                                position[0] if position else 0, float(relevance[i])))
+            return results
             
         except Exception as e:
             print(f"❌ Error en búsqueda: {e}")
             return []
     
+    @staticmethod
+    def _mmr(scores: np.ndarray, vectors: np.ndarray, k: int, mmr_lambda: float) -> List[int]:
+        """Selección por Maximal Marginal Relevance (posiciones en scores)"""
+        selected: List[int] = []
+        redundancy = np.full(len(scores), -1.0, dtype='float32')  # máxima similitud con los elegidos
+        available = np.ones(len(scores), dtype=bool)
+        while len(selected) < k and available.any():
+            mmr = mmr_lambda * scores - (1 - mmr_lambda) * np.maximum(redundancy, 0.0)
+            mmr[~available] = -np.inf
+            best = int(np.argmax(mmr))
+            available[best] = False
+            if redundancy[best] >= RAG_DUPLICATE_THRESHOLD:
+                continue  # Casi idéntico a uno ya elegido (p.ej. solapamiento entre chunks)
+            selected.append(best)
+            redundancy = np.maximum(redundancy, vectors @ vectors[best])
+        return selected
+    
+    def build_context(self, results: Sequence[SearchResult], max_tokens: int) -> str:
+        """Concatenar resultados (de más a menos relevante) sin pasar de max_tokens"""
+        parts = []
+        used = 0
+        for result in sorted(results, key=lambda result: result.relevance, reverse=True):
+            source = f"[{result.document}, p. {result.page}]" if result.page else f"[{result.document}]"
+            part = f"{source}\n{result.text}"
+            tokens = self._count_tokens(part)
+            if used + tokens > max_tokens:
+                if parts:
+                    continue  # Puede caber otro más corto
+                # Ni el primero cabe: se recorta por palabras
+                words = part.split()
+                part = " ".join(words[:max(1, len(words) * max_tokens // max(tokens, 1))])
+                tokens = self._count_tokens(part)
+            parts.append(part)
+            used += tokens
+        return "\n\n".join(parts)
+    
+    def _document_filter(self, documents: Optional[Iterable[str]], tags: Optional[Iterable[str]]):
+        """(selector FAISS, bitmap) de los chunks vivos de los documentos elegidos
+
+        None si ningún documento coincide. Se cachea por combinación de documentos
+        mientras no cambie la versión del corpus.
+        """
+        with self._write_lock:
+            names = set(documents or [])
+            if tags is not None:
+                wanted = set(self._clean_tags(tags))
+                names.update(name for name, doc_tags in self.document_tags.items() if wanted & set(doc_tags))
+            numbers = tuple(sorted(self.document_numbers[name] for name in names
+                                   if name in self.documents and name in self.document_numbers))
+            if not numbers:
+                return None
+            
+            if self._filter_version != self.version:
+                self._filter_cache = {}
+                self._filter_version = self.version
+            cached = self._filter_cache.get(numbers)
+            if cached is None:
+                cached = bitmap_selector(self.chunks.live_mask(numbers))
+                if len(self._filter_cache) >= 32:
+                    self._filter_cache.pop(next(iter(self._filter_cache)))
+                self._filter_cache[numbers] = cached
+            return cached
+    
+    def _hybrid_search(self, query: str, k: int, query_embedding: np.ndarray = None, search_filter=None,
+                       fetch: int = 0) -> List[Tuple[int, float, bool]]:
+        """Fusionar BM25 y vectores por Reciprocal Rank Fusion
+
+        Devuelve hasta max(k, fetch) candidatos (chunk id, score fusionado, coincidencia
+        exacta de un código de la consulta). k son los resultados que pide el usuario:
+        si hay al menos k coincidencias exactas no se consulta el índice vectorial.
+        """
+        fetch = max(k, fetch)
+        if not RAG_HYBRID:
+            vector_ids = self._vector_search(query, fetch, query_embedding, search_filter)
+            return [(chunk_id, score, False) for chunk_id, score in reciprocal_rank_fusion([vector_ids], fetch)]
+        
+        if search_filter is None:
+            is_live = self.chunks.__contains__
+        else:
+            bits = search_filter[1]
+            is_live = lambda chunk_id: (chunk_id >> 3) < len(bits) and bool(bits[chunk_id >> 3] >> (chunk_id & 7) & 1)
+        
+        candidates = max(fetch, RAG_HYBRID_CANDIDATES)
+        lexical_hits = self.lexical.search(query, candidates, is_live)
+        lexical_ids = [chunk_id for chunk_id, _, _ in lexical_hits]
+        
+        # Códigos exactos (errores, modelos, piezas) encontrados completos: no hace falta el vector
+        rankings = [lexical_ids]
+        exact: Set[int] = set()
+        codes = [token for token in tokenize(query) if is_code(token)]
+        if codes:
+            # Exacto: el chunk contiene todos los códigos de la consulta (el resto de palabras da igual)
+            code_hits = self.lexical.search(" ".join(codes), candidates, is_live)
+            exact = {chunk_id for chunk_id, _, coverage in code_hits if coverage == 1.0}
+            # Ordenados por BM25 de la consulta completa; los que no entraron en ese top, detrás
+            ranking = [chunk_id for chunk_id in lexical_ids if chunk_id in exact]
+            ranked = set(ranking)
+            ranking += [chunk_id for chunk_id, _, coverage in code_hits if coverage == 1.0 and chunk_id not in ranked]
+            if len(exact) >= k:
+                return [(chunk_id, score, True) for chunk_id, score in reciprocal_rank_fusion([ranking], fetch)]
+            if ranking:
+                rankings.append(ranking)
+        
+        vector_ids = self._vector_search(query, candidates, query_embedding, search_filter)
+        return [(chunk_id, score, chunk_id in exact)
+                for chunk_id, score in reciprocal_rank_fusion([vector_ids] + rankings, fetch)]
+    
+    def _vector_search(self, query: str, k: int, query_embedding: np.ndarray = None, search_filter=None) -> List[int]:
+        if search_filter is None:
+            # Embedding + búsqueda FAISS (snapshot + delta) en lote con otras consultas
+            return self.batcher.search(query, k, query_embedding)
+        
+        # Con filtro el selector es propio de la consulta: solo el embedding va en lote
+        if query_embedding is None:
+            query_embedding = self.batcher.embed(query)
+        return self._search_ids(np.asarray(query_embedding, dtype='float32').reshape(1, -1), k, search_filter[0])[0]
+    
+    @timed("faiss_search")
+    def _search_ids(self, query_vectors: np.ndarray, k: int, selector=None) -> List[List[int]]:
+        """Buscar en snapshot y delta, fusionar por similitud y descartar borrados
+
+        Con selector, solo se visitan los ids permitidos (que ya excluye los borrados).
+        """
+        # Snapshot comprimido: pedir más candidatos y re-ordenarlos con los vectores exactos
+        rerank = self.rerank and self.index is not None and self.snapshot.get("storage", "float32") != "float32"
+        if rerank:
+            k, final_k = k * self.rerank_factor, k
+        
+        indexes = [index for index in (self.index, self.delta_index) if index is not None and index.ntotal > 0]
+        if not indexes:
+            return [[] for _ in range(len(query_vectors))]
+        
+        # Tombstones que los índices aún contienen: pedir solo el extra esperado por su
+        # proporción y ampliar si alguna consulta se queda corta (nunca k + todos los borrados)
+        deleted = 0 if selector is not None else len(self.deleted_ids)
+        limit = min(k + deleted, max(index.ntotal for index in indexes))
+        fetch_k = k
+        if deleted:
+            live_ratio = max(1.0 - deleted / sum(index.ntotal for index in indexes), 0.1)
+            fetch_k = min(int(k / live_ratio) + RAG_FETCH_MARGIN, limit)
+        
+        while True:
+            rows = self._collect_hits(indexes, query_vectors, k, fetch_k, selector)
+            if fetch_k >= limit or all(len(hits) == k for hits in rows):
+                break
+            fetch_k = min(fetch_k * 2, limit)
+        
+        results = []
+        for row, hits in enumerate(rows):
+            if rerank:
+                hits = self._rerank(query_vectors[row], hits, final_k)
+            results.append(hits)
+        
+        return results
+    
+    def _collect_hits(self, indexes: List[Any], query_vectors: np.ndarray, k: int, fetch_k: int,
+                      selector=None) -> List[List[int]]:
+        """Hasta k ids vivos por consulta, fusionando los índices por similitud"""
+        scores, ids = [], []
+        for index in indexes:
+            params = search_params(index, self.nprobe, self.ef_search, selector)
+            D, I = index.search(query_vectors, min(fetch_k, index.ntotal), params=params)
+            scores.append(D)
+            ids.append(I)
+        
+        scores = np.hstack(scores)
+        ids = np.hstack(ids)
+        # Producto interno: mayor es mejor
+        order = np.argsort(-scores, axis=1, kind="stable")
+        
+        rows = []
+        for row, row_order in enumerate(order):
+            hits = []
+            for col in row_order:
+                chunk_id = int(ids[row, col])
+                if chunk_id >= 0 and chunk_id in self.chunks:
+                    hits.append(chunk_id)
+                    if len(hits) == k:
+                        break
+            rows.append(hits)
+        return rows
+    
+    def _rerank(self, query_vector: np.ndarray, candidates: List[int], k: int) -> List[int]:
+        """Re-ordenar candidatos por producto interno exacto con los vectores de los segmentos"""
+        try:
+            ids, vectors = self.chunks.vectors(candidates)
+        except Exception as e:
+            # P.ej. un segmento recién fusionado y borrado: se usa el orden aproximado
+            print(f"⚠️ Re-ranking no disponible: {e}")
+            return candidates[:k]
+        if not len(ids):
+            return candidates[:k]
+        scores = normalize(vectors) @ np.asarray(query_vector, dtype='float32').reshape(-1)
+        return [int(ids[i]) for i in np.argsort(-scores, kind="stable")[:k]]
+    
     def delete_document(self, filename: str) -> bool:
-        """Eliminar documento del sistema"""
+        """Eliminar documento del sistema (sin re-embeber el resto)"""
         try:
-            if filename not in self.documents:
-                return False
-            
-            # Obtener índices de chunks a eliminar
-            chunk_indices = self.documents[filename]
-            
-            # Eliminar chunks (marcar como vacíos)
-            for idx in chunk_indices:
-                if 0 <= idx < len(self.chunks):
-                    self.chunks[idx] = ""  # Marcar como eliminado
-            
-            # Eliminar del mapeo
-            del self.documents[filename]
+            with self._transaction():
+                if filename not in self.documents:
+                    return False
+                
+                # Tombstones: los vectores se purgan al compactar en segundo plano (por fracción de borrados)
+                chunk_ids = ranges_to_ids(self.documents.pop(filename))
+                self.document_hashes.pop(filename, None)
+                self.document_tags.pop(filename, None)
+                self.chunks.discard(chunk_ids)
+                self.lexical.discard(chunk_ids)
+                self.deleted_ids.update(chunk_ids)
+                self.version += 1
+                
+                self.save_database()
             
-            # Reconstruir índice (simplificado - en producción sería más eficiente)
-            self._rebuild_index()
+            if self._needs_compaction():
+                self._schedule_compaction()
             
             print(f"✅ Documento eliminado: {filename}")
             return True
@@ -182,70 +894,380 @@ class RAGSystem:
             print(f"❌ Error eliminando documento {filename}: {e}")
             return False
     
-    def _rebuild_index(self):
-        """Reconstruir índice FAISS sin chunks eliminados"""
+    def _schedule_compaction(self):
+        """Lanzar compactación en segundo plano (si no hay una en curso)"""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        self._compaction_thread = threading.Thread(target=self._compact, name="rag-compaction", daemon=True)
+        self._compaction_thread.start()
+    
+    def _compact(self):
+        """Fusionar segmentos en disco y regenerar el snapshot del índice"""
+        # Repetir si llegaron borrados/subidas mientras se compactaba
+        for _ in range(3):
+            merged = self._merge_segments()
+            if merged or self._delta_size() > 0 or not self.snapshot or self._storage_outdated():
+                self._rebuild_snapshot()
+            if not self._needs_compaction():
+                break
+    
+    def _delta_size(self) -> int:
+        delta_index = self.delta_index
+        return delta_index.ntotal if delta_index is not None else 0
+    
+    def _needs_compaction(self) -> bool:
+        """Compactar si hay segmentos que fusionar, el delta creció o falta snapshot"""
+        if self._merge_candidates() or self._delta_size() > RAG_DELTA_MAX_CHUNKS or self._storage_outdated():
+            return True
+        return bool(self.segments) and not self.snapshot
+    
+    def _storage_outdated(self) -> bool:
+        """El snapshot usa otra compresión que la configurada (p.ej. tras cambiar RAG_VECTOR_STORAGE)"""
+        snapshot = self.snapshot
+        if not snapshot:
+            return False
+        expected = choose_storage(snapshot.get("trained_on", 0), snapshot.get("type", "flat"), self.vector_storage)
+        return snapshot.get("storage", "float32") != expected
+    
+    def _rebuild_snapshot(self):
+        """Construir el índice base desde los segmentos y publicarlo como snapshot mmap"""
         try:
-            # Filtrar chunks no vacíos
-            valid_chunks = [chunk for chunk in self.chunks if chunk.strip()]
+            with self._write_lock:
+                segments = list(self.segments)
+                deleted = set(self.deleted_ids)
+            
+            # Tipo según el tamaño actual: el (re)entrenamiento ocurre aquí, en segundo plano
+            n_live = max(0, sum(segment["count"] for segment in segments) - len(deleted))
+            kind = choose_index_type(n_live, self.index_type)
+            storage = choose_storage(n_live, kind, self.vector_storage)
             
-            if not valid_chunks:
-                self.index = None
-                self.chunks = []
-                self.documents = {}
+            # Construcción y escritura fuera del lock: las subidas siguen yendo al delta
+            index = self._build_index(segments, deleted, kind, storage)
+            snapshot = {}
+            if index is not None and index.ntotal > 0:
+                snapshot = {
+                    "file": self.store.write_index(index),
+                    "segments": [s["name"] for s in segments],
+                    "type": kind,
+                    "storage": storage,
+                    "metric": "ip",
+                    "trained_on": n_live
+                }
+            del index  # Liberar la copia de construcción: se reabre con mmap
+            
+            with self._transaction():
+                current = {segment["name"] for segment in self.segments}
+                if not set(snapshot.get("segments", [])) <= current:
+                    # Un merge concurrente (de este u otro proceso) invalidó este snapshot
+                    if snapshot:
+                        self.store.remove_index(snapshot["file"])
+                    return
+                
+                covered = set(snapshot.get("segments", []))
+                self.index = self.store.read_index(snapshot["file"]) if snapshot else None
+                self.delta_index = self._build_index([s for s in self.segments if s["name"] not in covered], self.deleted_ids)
+                self.snapshot = snapshot
                 self.save_database()
-                return
+                manifest = self.store.load_manifest()
             
-            # Regenerar embeddings e índice
-            embeddings = self.model.encode(valid_chunks)
-            dimension = embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(dimension)
-            self.index.add(embeddings.astype('float32'))
+            self.store.cleanup_orphans(manifest)
+            print(f"📦 Snapshot del índice regenerado ({snapshot.get('type', '-')}/{snapshot.get('storage', '-')}): "
+                  f"{len(self.chunks)} chunks")
             
-            # Actualizar chunks y mapeo
-            self.chunks = valid_chunks
+        except Exception as e:
+            print(f"❌ Error regenerando snapshot: {e}")
+    
+    def _merge_candidates(self) -> List[str]:
+        """Segmentos a fusionar: los que acumulan borrados y, si hay demasiados, los más pequeños
+
+        Un segmento entra por borrados cuando su fracción de tombstones llega a
+        RAG_MAX_DELETED_RATIO; mientras tanto la búsqueda los filtra.
+        """
+        with self._write_lock:
+            segments = list(self.segments)
+            deleted = np.array(sorted(self.deleted_ids), dtype='int64')
+        
+        names = set()
+        for segment in segments:
+            # Tombstones en el rango de ids del segmento (cota superior si se intercala con otros)
+            n_deleted = (np.searchsorted(deleted, segment["max_id"], side="right")
+                         - np.searchsorted(deleted, segment["min_id"]))
+            if n_deleted and n_deleted >= RAG_MAX_DELETED_RATIO * segment["count"]:
+                names.add(segment["name"])
+        
+        excess = len(segments) - RAG_MAX_SEGMENTS
+        if excess > 0:
+            smallest = sorted(segments, key=lambda seg: seg["count"])[:excess + 1]
+            names.update(segment["name"] for segment in smallest)
+        
+        return [segment["name"] for segment in segments if segment["name"] in names]
+    
+    def _merge_segments(self) -> bool:
+        """Fusionar segmentos en uno nuevo sin filas borradas (sin bloquear las subidas)"""
+        try:
+            names = self._merge_candidates()
+            if not names:
+                return False
             
-            # Recalcular mapeo de documentos
-            new_documents = {}
-            current_idx = 0
+            with self._write_lock:
+                deleted = set(self.deleted_ids)
             
-            for doc_name, old_indices in self.documents.items():
-                valid_count = sum(1 for idx in old_indices if 0 <= idx < len(self.chunks) and self.chunks[idx].strip())
-                if valid_count > 0:
-                    new_documents[doc_name] = list(range(current_idx, current_idx + valid_count))
-                    current_idx += valid_count
+            # La escritura del segmento fusionado ocurre fuera del lock
+            merged, purged = self.store.merge_segments(names, deleted)
             
-            self.documents = new_documents
-            self.save_database()
+            with self._transaction():
+                merged_names = set(names)
+                if not merged_names <= {segment["name"] for segment in self.segments}:
+                    # Otro proceso ya fusionó (o purgó) alguno de estos segmentos
+                    if merged is not None:
+                        self.store.remove_segments([merged["name"]])
+                    return False
+                segments = [segment for segment in self.segments if segment["name"] not in merged_names]
+                if merged is not None:
+                    segments.append(merged)
+                    # Re-apuntar los textos al segmento fusionado
+                    merged_ids = self.store.read_ids(merged["name"])
+                    deleted_array = np.fromiter(self.deleted_ids, dtype='int64', count=len(self.deleted_ids))
+                    self.chunks.attach(merged["name"], self.store.segment_dir(merged["name"]), merged_ids,
+                                       deleted_array, self.store.read_positions(merged["name"]))
+                    self.lexical.attach(merged["name"], merged_ids, self._segment_postings(merged["name"]),
+                                        deleted_array)
+                self.chunks.detach(names)
+                self.lexical.detach(names)
+                self.segments = segments
+                self.deleted_ids -= purged
+                # El snapshot referenciaba los segmentos viejos: deja de ser válido
+                self.snapshot = {}
+                saved = self.save_database()
+            
+            # Los archivos viejos solo se borran cuando el manifest ya no los referencia
+            # (los mapeos abiertos siguen siendo válidos hasta cerrarse)
+            if saved:
+                self.store.remove_segments(names)
+                print(f"🧹 Segmentos fusionados: {len(names)} → {1 if merged else 0} ({len(purged)} chunks purgados)")
+            return True
             
         except Exception as e:
-            print(f"❌ Error reconstruyendo índice: {e}")
+            print(f"❌ Error fusionando segmentos: {e}")
+            return False
     
     def get_stats(self) -> Dict[str, Any]:
         """Obtener estadísticas del sistema RAG"""
         return {
             "pdf_count": len(self.documents),
-            "chunks_count": len([c for c in self.chunks if c.strip()]),
-            "rag_status": self.index is not None,
-            "db_status": os.path.exists(f"{self.db_path}/faiss.index")
+            "chunks_count": len(self.chunks),
+            "rag_status": self.index is not None or self.delta_index is not None,
+            "index_type": self.snapshot.get("type", "flat"),
+            "vector_storage": self.snapshot.get("storage", "float32"),
+            "embed_backend": self.embedder.backend,
+            "chunk_table_bytes": self.chunks.nbytes,
+            "query_batching": self.batcher.stats(),
+            "embedding_cache": self.embedding_cache.stats() if self.embedding_cache is not None else None,
+            "db_status": self.store.exists()
         }
     
+    def quantization_report(self, k: int = 10, n_queries: int = 200,
+                            modes: Sequence[str] = STORAGE_MODES) -> List[Dict[str, Any]]:
+        """Memoria vs recall@k de cada modo de almacenamiento sobre el corpus actual
+
+        Construye un índice por modo (con el tipo que tocaría por tamaño) y lo compara
+        con la búsqueda exacta en float32. Las consultas son chunks del propio corpus
+        (sin contarse a sí mismos). Es costoso: pensado para ejecutarse fuera de línea.
+        Los modos que este corpus no admite (p.ej. pq sin datos para entrenar) no se
+        miden: su fila lleva "fallback" con el modo que se usaría en su lugar.
+        """
+        with self._write_lock:
+            segments = list(self.segments)
+            deleted = set(self.deleted_ids)
+        live_ids = np.flatnonzero(self.chunks.live_mask())
+        if not segments or len(live_ids) <= k:
+            return []
+        
+        rng = np.random.default_rng(0)
+        query_ids = np.sort(rng.choice(live_ids, size=min(n_queries, len(live_ids)), replace=False))
+        query_ids, queries = self.chunks.vectors(query_ids)
+        queries = normalize(queries)
+        
+        def top_k(index, fetch: int) -> List[List[int]]:
+            params = search_params(index, self.nprobe, self.ef_search)
+            _, I = index.search(queries, min(fetch + 1, index.ntotal), params=params)
+            return [[int(i) for i in row if i >= 0 and i != query_id] for row, query_id in zip(I, query_ids)]
+        
+        exact_index = self._build_index(segments, deleted, "flat", "float32")
+        exact = [hits[:k] for hits in top_k(exact_index, k)]
+        baseline = index_nbytes(exact_index)
+        del exact_index
+        
+        n_live = len(live_ids)
+        kind = choose_index_type(n_live, self.index_type)
+        report = []
+        for mode in modes:
+            storage = choose_storage(n_live, kind, mode)
+            if storage != mode:
+                report.append({"storage": mode, "type": kind, "fallback": storage})
+                continue
+            index = self._build_index(segments, deleted, kind, storage)
+            nbytes = index_nbytes(index)
+            
+            start = time.perf_counter()
+            approx = top_k(index, k)
+            search_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            candidates = top_k(index, k * self.rerank_factor)
+            del index
+            
+            reranked = [self._rerank(query, hits, k) for query, hits in zip(queries, candidates)]
+            recall = np.mean([len(set(a[:k]) & set(e)) / len(e) for a, e in zip(approx, exact) if e])
+            recall_rerank = np.mean([len(set(r) & set(e)) / len(e) for r, e in zip(reranked, exact) if e])
+            report.append({
+                "storage": storage,
+                "type": kind,
+                "index_bytes": nbytes,
+                "bytes_per_vector": round(nbytes / n_live, 1),
+                "memory_saved": round(1 - nbytes / baseline, 3),
+                f"recall@{k}": round(float(recall), 4),
+                f"recall@{k}_rerank": round(float(recall_rerank), 4),
+                "search_ms": round(search_ms, 3)
+            })
+        
+        print(f"📊 Compresión de vectores ({n_live} chunks, {len(queries)} consultas, tipo {kind}):")
+        for row in report:
+            if "fallback" in row:
+                print(f"   {row['storage']:>7}: no aplicable a este corpus (se usaría {row['fallback']})")
+                continue
+            print(f"   {row['storage']:>7}: {row['bytes_per_vector']:>7} B/vector, ahorro {row['memory_saved']:.0%}, "
+                  f"recall@{k} {row[f'recall@{k}']:.3f} (re-rank {row[f'recall@{k}_rerank']:.3f})")
+        return report
+    
+    def embedder_report(self, k: int = 10, n_texts: int = 200,
+                        backends: Sequence[str] = BACKENDS) -> List[Dict[str, Any]]:
+        """Deriva coseno, velocidad y recall@k de cada backend de embeddings frente a torch
+
+        Los textos son chunks del propio corpus (o frases de ejemplo si está vacío);
+        el recall compara la búsqueda con los vectores del backend contra la de torch.
+        """
+        live_ids = np.flatnonzero(self.chunks.live_mask())
+        if len(live_ids):
+            rng = np.random.default_rng(0)
+            sample = rng.choice(live_ids, size=min(n_texts, len(live_ids)), replace=False)
+            texts = [self.chunks.get(int(chunk_id), "") for chunk_id in sample]
+        else:
+            texts = list(PARITY_SAMPLE)
+        
+        reference = get_embedder(self.model_name, "torch")
+        expected = None
+        if len(live_ids) > k:
+            expected = self._search_ids(normalize(reference.encode(texts)), k)
+        
+        report = []
+        for backend in backends:
+            try:
+                candidate = get_embedder(self.model_name, backend)
+                row = parity_check(reference, candidate, texts)
+            except ImportError as e:
+                print(f"⚠️ Backend {backend} no disponible: {e}")
+                continue
+            if expected is not None:
+                found = self._search_ids(normalize(candidate.encode(texts)), k)
+                row[f"recall@{k}"] = round(float(np.mean(
+                    [len(set(f) & set(e)) / len(e) for f, e in zip(found, expected) if e])), 4)
+            report.append(row)
+        
+        print(f"📊 Backends de embeddings ({len(texts)} textos, referencia torch):")
+        for row in report:
+            recall = f", recall@{k} {row[f'recall@{k}']:.3f}" if f"recall@{k}" in row else ""
+            print(f"   {row['backend']:>9}: coseno medio {row['cosine_mean']:.4f} (mín. {row['cosine_min']:.4f}), "
+                  f"{row['ms_per_text']} ms/texto, x{row['speedup']}{recall}")
+        return report
+    
     def list_documents(self) -> List[str]:
-        """Listar documentos cargados"""
+        """Listar documentos cargados (incluidos los que publicaron otros workers)"""
+        self.sync_with_disk()
         return list(self.documents.keys())
     
-    def create_vector_database(self, pdf_folder: str):
-        """Crear base de datos desde carpeta de PDFs (para compatibilidad)"""
+    def create_vector_database(self, pdf_folder: str, workers: int = RAG_BULK_WORKERS):
+        """Indexar una carpeta de PDFs en bloque
+
+        Omite los PDFs sin cambios (por hash), extrae texto en un pool de procesos,
+        codifica en lotes grandes y publica todo en un único segmento al final.
+        """
         if not os.path.exists(pdf_folder):
             print(f"⚠️ Carpeta {pdf_folder} no existe")
             return
         
-        pdf_files = [f for f in os.listdir(pdf_folder) if f.endswith('.pdf')]
+        self.sync_with_disk()
+        pdf_files = sorted(f for f in os.listdir(pdf_folder) if f.endswith('.pdf'))
         
+        # Huella por contenido: solo se procesan PDFs nuevos o modificados
+        pending: Dict[str, str] = {}
         for pdf_file in pdf_files:
-            pdf_path = os.path.join(pdf_folder, pdf_file)
-            try:
-                with open(pdf_path, 'rb') as f:
-                    file_content = f.read()
-                self.add_pdf_from_upload(file_content, pdf_file)
-            except Exception as e:
-                print(f"❌ Error procesando {pdf_file}: {e}")
\ No newline at end of file
+            content_hash = file_sha256(os.path.join(pdf_folder, pdf_file))
+            if self.document_hashes.get(pdf_file) != content_hash:
+                pending[pdf_file] = content_hash
+        
+        skipped = len(pdf_files) - len(pending)
+        if not pending:
+            print(f"⏭️ {skipped} PDFs sin cambios, nada que indexar")
+            return
+        
+        writer = self.store.open_segment()
+        documents: Dict[str, List[int]] = {}
+        hashes: Dict[str, str] = {}
+        buffer: List[Any] = []  # (documento, chunk) pendientes de codificar
+        
+        def flush():
+            chunks = [chunk for _, chunk in buffer]
+            texts = [chunk.text for chunk in chunks]
+            embeddings = self._embed_chunks(texts, RAG_ENCODE_BATCH)
+            ids = self._allocate_ids(len(texts))
+            writer.append(ids, embeddings, texts, self._positions(chunks))
+            for (document_name, _), chunk_id in zip(buffer, ids.tolist()):
+                documents.setdefault(document_name, []).append(chunk_id)
+            buffer.clear()
+        
+        try:
+            # spawn: un fork con los hilos de torch/FAISS y el batcher vivos puede bloquearse
+            with ProcessPoolExecutor(max_workers=max(1, workers),
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = {
+                    executor.submit(extract_pdf_chunks, os.path.join(pdf_folder, pdf_file),
+                                    tokenizer_name=self.tokenizer_name): pdf_file
+                    for pdf_file in pending
+                }
+                for future in as_completed(futures):
+                    pdf_file = futures[future]
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        print(f"❌ Error procesando {pdf_file}: {e}")
+                        continue
+                    
+                    if not chunks:
+                        print(f"⚠️ No se pudo extraer texto de {pdf_file}")
+                        continue
+                    
+                    hashes[pdf_file] = pending[pdf_file]
+                    buffer.extend((pdf_file, chunk) for chunk in chunks)
+                    while len(buffer) >= RAG_BULK_ENCODE_BATCH:
+                        # Lote completo; el resto queda para el siguiente
+                        rest = buffer[RAG_BULK_ENCODE_BATCH:]
+                        del buffer[RAG_BULK_ENCODE_BATCH:]
+                        flush()
+                        buffer.extend(rest)
+                    print(f"📄 Extraído: {pdf_file} - {len(chunks)} chunks")
+            
+            if buffer:
+                flush()
+            
+            if writer.count == 0:
+                writer.abort()
+                return
+            segment = writer.finish()
+            
+        except Exception as e:
+            writer.abort()
+            print(f"❌ Error en indexación masiva: {e}")
+            return
+        
+        # Una sola publicación (y un solo manifest) para todo el lote
+        self._publish_segment(segment, documents, hashes)
+        print(f"✅ Indexación masiva: {len(documents)} PDFs, {segment['count']} chunks ({skipped} sin cambios)")
@@ -0,0 +1,138 @@
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import os
+import re
+import threading
+import time
+import unicodedata
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Similitud coseno mínima para reutilizar la respuesta de otra pregunta
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+
+def normalize_text(text: str) -> str:
+    """Normalizar pregunta: minúsculas, sin tildes, sin signos y espacios colapsados"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+class ResponseCache:
+    """Caché LRU/TTL de respuestas por texto normalizado y similitud de embedding
+
+    Todas las entradas pertenecen a una versión del corpus; al cambiar la
+    versión (subida o borrado de PDFs) la caché se vacía.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 threshold: float = RESPONSE_CACHE_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # clave -> entrada (orden LRU)
+        self._vectors: Optional[np.ndarray] = None  # Embeddings por slot
+        self._slot_keys = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self._version = None
+
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _sync_version(self, version: Any):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._clear()
+            self._version = version
+
+    def _clear(self):
+        self._entries.clear()
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._slot_keys[entry["slot"]] = None
+        self._free_slots.append(entry["slot"])
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return time.monotonic() - entry["created"] > self.ttl
+
+    def get_exact(self, text: str, version: Any) -> Optional[str]:
+        """Buscar por texto normalizado (no requiere embedding)"""
+        key = normalize_text(text)
+        with self._lock:
+            self._sync_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            self.hits_exact += 1
+            return entry["reply"]
+
+    def get_similar(self, embedding: np.ndarray, version: Any) -> Optional[str]:
+        """Buscar la pregunta cacheada más parecida (embedding normalizado)"""
+        with self._lock:
+            self._sync_version(version)
+            if not self._entries or self._vectors is None:
+                self.misses += 1
+                return None
+
+            occupied = np.array([key is not None for key in self._slot_keys])
+            scores = self._vectors @ np.asarray(embedding, dtype='float32').reshape(-1)
+            scores[~occupied] = -1.0
+            slot = int(np.argmax(scores))
+
+            key = self._slot_keys[slot]
+            if key is None or scores[slot] < self.threshold or self._expired(self._entries[key]):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits_semantic += 1
+            return self._entries[key]["reply"]
+
+    def put(self, text: str, embedding: Optional[np.ndarray], version: Any, reply: str):
+        """Guardar respuesta (expulsando la menos usada si está llena)"""
+        key = normalize_text(text)
+        with self._lock:
+            self._sync_version(version)
+            if key in self._entries:
+                self._remove(key)
+            if not self._free_slots:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+            slot = self._free_slots.pop()
+            if embedding is not None:
+                embedding = np.asarray(embedding, dtype='float32').reshape(-1)
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_entries, embedding.shape[0]), dtype='float32')
+                self._vectors[slot] = embedding
+            elif self._vectors is not None:
+                self._vectors[slot] = 0.0
+
+            self._slot_keys[slot] = key
+            self._entries[key] = {"reply": reply, "slot": slot, "created": time.monotonic()}
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_exact + self.hits_semantic) / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
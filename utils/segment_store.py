@@ -0,0 +1,384 @@
+import faiss
+import numpy as np
+from typing import List, Dict, Any, Optional, Set, Tuple
+import os
+import json
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from .lexical_index import PostingsBuilder, save_postings, load_postings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "manifest.lock"
+NEXT_ID_FILE = "next_chunk_id"
+STORE_FORMAT = 2
+
+def ids_to_ranges(ids: List[int]) -> List[List[int]]:
+    """Comprimir ids en rangos [inicio, fin] (los chunks de un documento son consecutivos)"""
+    ranges = []
+    for chunk_id in sorted(ids):
+        if ranges and chunk_id == ranges[-1][1] + 1:
+            ranges[-1][1] = chunk_id
+        else:
+            ranges.append([chunk_id, chunk_id])
+    return ranges
+
+class StaleManifestError(RuntimeError):
+    """Otro proceso publicó un manifest más nuevo que el que se quería reemplazar"""
+
+def ranges_to_ids(ranges: List[List[int]]) -> List[int]:
+    """Expandir rangos [inicio, fin] a lista de ids"""
+    ids = []
+    for start, end in ranges:
+        ids.extend(range(start, end + 1))
+    return ids
+
+class SegmentStore:
+    """Almacenamiento en disco por segmentos inmutables + manifest con swap atómico
+
+    Cada upload escribe un segmento nuevo (ids, vectores y textos) y luego se
+    reemplaza el manifest; un crash a mitad deja el manifest anterior intacto.
+    Varios procesos (workers de gunicorn) pueden compartir db_path: los commits
+    y la reserva de ids se hacen bajo lock(), un flock exclusivo entre procesos.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.segments_path = os.path.join(db_path, "segments")
+        self.manifest_path = os.path.join(db_path, MANIFEST_FILE)
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    @contextmanager
+    def lock(self):
+        """Lock exclusivo entre procesos sobre la base (reentrante dentro del proceso)"""
+        with self._lock:
+            if self._lock_depth == 0:
+                os.makedirs(self.db_path, exist_ok=True)
+                self._lock_file = open(os.path.join(self.db_path, LOCK_FILE), "a")
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    if fcntl is not None:
+                        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def manifest_stamp(self) -> Optional[Tuple[int, int, int]]:
+        """(inodo, mtime, tamaño) del manifest: cambia con cada commit de cualquier proceso"""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def reserve_ids(self, count: int, floor: int = 0) -> int:
+        """Reservar `count` ids consecutivos para este proceso y devolver el primero
+
+        El contador vive en disco (no en la memoria de cada worker): dos procesos
+        nunca reciben los mismos ids aunque ninguno haya publicado aún su segmento.
+        """
+        path = os.path.join(self.db_path, NEXT_ID_FILE)
+        with self.lock():
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    next_id = int(f.read().strip() or 0)
+            else:
+                manifest = self.load_manifest() or {}
+                next_id = manifest.get("next_chunk_id", 0)
+            start = max(next_id, floor)
+            tmp_path = f"{path}.tmp-{os.getpid()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(str(start + count))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            return start
+
+    def load_manifest(self) -> Optional[Dict[str, Any]]:
+        """Leer el manifest actual (None si la base no existe)"""
+        if not self.exists():
+            return None
+        with open(self.manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def commit(self, manifest: Dict[str, Any]):
+        """Escribir el manifest de forma atómica (tmp + fsync + rename)
+
+        Compare-and-swap: manifest["generation"] debe ser la generación que hay en
+        disco; si otro proceso publicó entre medias se lanza StaleManifestError.
+        Devuelve el manifest_stamp() del archivo recién publicado.
+        """
+        with self.lock():
+            current = self.load_manifest()
+            on_disk = current.get("generation", 0) if current is not None else 0
+            if current is not None and manifest.get("generation", 0) != on_disk:
+                raise StaleManifestError(f"manifest en generación {on_disk}, "
+                                         f"se esperaba {manifest.get('generation', 0)}")
+            manifest["format"] = STORE_FORMAT
+            manifest["generation"] = on_disk + 1
+            # Tmp propio de cada escritor: nunca se reemplaza el archivo a medio escribir de otro
+            tmp_path = f"{self.manifest_path}.tmp-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.manifest_path)
+            return self.manifest_stamp()
+
+    def segment_dir(self, name: str) -> str:
+        return os.path.join(self.segments_path, name)
+
+    def open_segment(self) -> "SegmentWriter":
+        """Abrir un segmento para escritura incremental (por lotes)"""
+        return SegmentWriter(self)
+
+    def write_segment(self, ids: np.ndarray, vectors: np.ndarray, texts: List[str],
+                      positions: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        """Escribir un segmento inmutable y devolver su entrada para el manifest"""
+        writer = self.open_segment()
+        try:
+            writer.append(ids, vectors, texts, positions)
+            return writer.finish()
+        except Exception:
+            writer.abort()
+            raise
+
+    def read_ids(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.segment_dir(name), "ids.npy"))
+
+    def read_vectors(self, name: str) -> np.ndarray:
+        """Vectores del segmento mapeados en memoria (solo lectura)"""
+        return np.load(os.path.join(self.segment_dir(name), "vectors.npy"), mmap_mode="r")
+
+    def read_texts(self, name: str) -> List[str]:
+        seg_dir = self.segment_dir(name)
+        offsets = np.load(os.path.join(seg_dir, "offsets.npy"))
+        with open(os.path.join(seg_dir, "texts.bin"), "rb") as f:
+            blob = f.read()
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+    def read_positions(self, name: str) -> np.ndarray:
+        """Origen de cada chunk: (página, inicio, fin) en el documento; ceros si se desconoce"""
+        path = os.path.join(self.segment_dir(name), "positions.npy")
+        if os.path.exists(path):
+            return np.load(path)
+        return np.zeros((len(self.read_ids(name)), 3), dtype='int64')
+
+    def read_postings(self, name: str) -> Optional[Dict[str, np.ndarray]]:
+        """Índice invertido del segmento (None en segmentos anteriores a su introducción)"""
+        path = os.path.join(self.segment_dir(name), "lexical.npz")
+        return load_postings(path) if os.path.exists(path) else None
+
+    def write_postings(self, name: str, arrays: Dict[str, np.ndarray]):
+        """Añadir el índice invertido (dato derivado) a un segmento existente"""
+        tmp_path = os.path.join(self.segment_dir(name), ".tmp-lexical.npz")
+        save_postings(tmp_path, arrays)
+        os.replace(tmp_path, os.path.join(self.segment_dir(name), "lexical.npz"))
+
+    def read_segment(self, name: str) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        return self.read_ids(name), self.read_vectors(name), self.read_texts(name)
+
+    def merge_segments(self, names: List[str], deleted: Set[int]) -> Tuple[Optional[Dict[str, Any]], Set[int]]:
+        """Fusionar segmentos descartando filas borradas
+
+        Devuelve la entrada del nuevo segmento (None si no queda nada vivo)
+        y los ids borrados que se purgaron físicamente.
+        """
+        deleted_array = np.fromiter(deleted, dtype='int64', count=len(deleted))
+        live_ids, live_vectors, live_texts, live_positions = [], [], [], []
+        purged: Set[int] = set()
+
+        for name in names:
+            ids, vectors, texts = self.read_segment(name)
+            dead = np.isin(ids, deleted_array)
+            purged.update(int(i) for i in ids[dead])
+            keep = np.flatnonzero(~dead)
+            live_ids.append(ids[keep])
+            live_vectors.append(np.asarray(vectors[keep]))
+            live_positions.append(self.read_positions(name)[keep])
+            live_texts.extend(texts[i] for i in keep)
+
+        if not live_texts:
+            return None, purged
+
+        # Ordenar por id para que cada segmento quede con ids crecientes
+        ids = np.concatenate(live_ids)
+        order = np.argsort(ids, kind="stable")
+        vectors = np.concatenate(live_vectors)[order]
+        texts = [live_texts[i] for i in order]
+        positions = np.concatenate(live_positions)[order]
+
+        segment = self.write_segment(ids[order], vectors, texts, positions)
+        return segment, purged
+
+    def write_index(self, index) -> str:
+        """Guardar un snapshot del índice FAISS y devolver su nombre de archivo"""
+        name = f"index-{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}.faiss"
+        tmp_path = os.path.join(self.db_path, f".tmp-{name}")
+        faiss.write_index(index, tmp_path)
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.db_path, name))
+        return name
+
+    def read_index(self, name: str):
+        """Abrir un snapshot del índice mapeado en memoria (compartido entre workers)"""
+        path = os.path.join(self.db_path, name)
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception as e:
+            # No todos los tipos de índice soportan mmap en todas las versiones de faiss
+            print(f"⚠️ Índice sin mmap ({e}), cargando en memoria")
+            return faiss.read_index(path)
+
+    def remove_index(self, name: str):
+        try:
+            os.remove(os.path.join(self.db_path, name))
+        except FileNotFoundError:
+            pass
+
+    def remove_segments(self, names: List[str]):
+        """Borrar archivos de segmentos que ya no están en el manifest"""
+        for name in names:
+            shutil.rmtree(self.segment_dir(name), ignore_errors=True)
+
+    def cleanup_orphans(self, manifest: Dict[str, Any], min_age: float = 3600.0):
+        """Eliminar segmentos huérfanos (p.ej. de un crash antes del swap del manifest)
+
+        Solo se borran los antiguos para no pisar una escritura en curso de otro worker.
+        """
+        now = time.time()
+
+        if os.path.isdir(self.segments_path):
+            referenced = {segment["name"] for segment in manifest.get("segments", [])}
+            orphans = [
+                name for name in os.listdir(self.segments_path)
+                if name not in referenced and now - os.path.getmtime(self.segment_dir(name)) > min_age
+            ]
+            if orphans:
+                self.remove_segments(orphans)
+                print(f"🧹 {len(orphans)} segmentos huérfanos eliminados")
+
+        snapshot = (manifest.get("snapshot") or {}).get("file")
+        for name in os.listdir(self.db_path):
+            path = os.path.join(self.db_path, name)
+            if now - os.path.getmtime(path) <= min_age:
+                continue
+            if name.endswith(".faiss") and name != snapshot:
+                self.remove_index(name)
+            elif name.startswith(f"{MANIFEST_FILE}.tmp-"):
+                self.remove_index(name)  # Manifest a medio escribir de un proceso que murió
+
+class SegmentWriter:
+    """Escritura incremental de un segmento: memoria acotada a un lote
+
+    Vectores y textos se vuelcan a disco en cada append; en memoria quedan
+    ids, offsets, posiciones y las postings del índice invertido hasta finish().
+    """
+
+    def __init__(self, store: SegmentStore):
+        self.store = store
+        self.name = f"seg-{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        self.tmp_dir = store.segment_dir(f".tmp-{self.name}")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._ids: List[np.ndarray] = []
+        self._lengths: List[int] = []
+        self._positions: List[np.ndarray] = []
+        self._count = 0
+        self._dim = None
+        self._vectors_file = open(os.path.join(self.tmp_dir, "vectors.npy"), "wb")
+        self._texts_file = open(os.path.join(self.tmp_dir, "texts.bin"), "wb")
+        self._data_offset = None
+        self._postings = PostingsBuilder()
+
+    def _write_vectors_header(self):
+        # Cabecera .npy de tamaño fijo: se reescribe con la forma final en finish()
+        np.lib.format.write_array_header_1_0(
+            self._vectors_file, {"descr": "<f4", "fortran_order": False, "shape": (self._count, self._dim)}
+        )
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray, texts: List[str],
+               positions: Optional[np.ndarray] = None):
+        """Añadir un lote; positions = (página, inicio, fin) por chunk si se conoce"""
+        if not len(ids):
+            return
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        if self._dim is None:
+            self._dim = vectors.shape[1]
+            self._write_vectors_header()
+            self._data_offset = self._vectors_file.tell()
+
+        self._vectors_file.write(vectors.tobytes())
+        for text in texts:
+            encoded = text.encode("utf-8")
+            self._texts_file.write(encoded)
+            self._lengths.append(len(encoded))
+        self._postings.add(texts)
+        self._ids.append(np.ascontiguousarray(ids, dtype='int64'))
+        if positions is None:
+            positions = np.zeros((len(ids), 3), dtype='int64')
+        self._positions.append(np.asarray(positions, dtype='int64').reshape(len(ids), 3))
+        self._count += len(ids)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def finish(self) -> Dict[str, Any]:
+        """Cerrar archivos, publicar el directorio y devolver la entrada del manifest"""
+        if self._dim is None:
+            self._dim = 0
+            self._write_vectors_header()
+        else:
+            self._vectors_file.seek(0)
+            self._write_vectors_header()
+            if self._vectors_file.tell() != self._data_offset:
+                raise RuntimeError("Cabecera .npy de tamaño inesperado")
+
+        for f in (self._vectors_file, self._texts_file):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+
+        ids = np.concatenate(self._ids) if self._ids else np.zeros(0, dtype='int64')
+        offsets = np.zeros(len(self._lengths) + 1, dtype='int64')
+        offsets[1:] = np.cumsum(self._lengths)
+        np.save(os.path.join(self.tmp_dir, "ids.npy"), ids)
+        np.save(os.path.join(self.tmp_dir, "offsets.npy"), offsets)
+        positions = np.concatenate(self._positions) if self._positions else np.zeros((0, 3), dtype='int64')
+        np.save(os.path.join(self.tmp_dir, "positions.npy"), positions)
+        save_postings(os.path.join(self.tmp_dir, "lexical.npz"), self._postings.arrays())
+
+        # Visible solo cuando está completo
+        os.rename(self.tmp_dir, self.store.segment_dir(self.name))
+
+        return {
+            "name": self.name,
+            "count": int(len(ids)),
+            "min_id": int(ids.min()) if len(ids) else 0,
+            "max_id": int(ids.max()) if len(ids) else -1
+        }
+
+    def abort(self):
+        """Descartar el segmento a medio escribir"""
+        for f in (self._vectors_file, self._texts_file):
+            if not f.closed:
+                f.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
@@ -0,0 +1,125 @@
+import asyncio
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+from .http_clients import get_client
+from .metrics import span
+
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+TELEGRAM_API = f"{TELEGRAM_API_BASE}/bot{TELEGRAM_TOKEN}"
+
+# Respuestas en streaming: se publica la primera oración y se edita el mensaje
+# como mucho cada TELEGRAM_EDIT_INTERVAL segundos (límite de Telegram ~1 msg/s por chat)
+TELEGRAM_STREAM = os.getenv("TELEGRAM_STREAM", "1") == "1"
+TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.0"))
+TELEGRAM_MAX_LENGTH = 4096  # Máximo de caracteres por mensaje
+TYPING_REFRESH = 4.5  # "escribiendo..." dura 5 s en el cliente
+
+# Primera oración publicable: termina en puntuación o salto de línea y no es trivial
+_SENTENCE_END_RE = re.compile(r"[.!?…:](?=\s)|\n")
+_FIRST_MIN_CHARS = 20
+_FIRST_MAX_CHARS = 160  # Sin puntuación a la vista: se publica igualmente
+
+async def telegram_call(method: str, payload: Dict[str, Any], timeout: float = 15.0) -> Optional[Dict[str, Any]]:
+    """Llamar un método de la Bot API reutilizando el pool de conexiones"""
+    client = get_client("telegram", timeout=timeout)
+    try:
+        with span(f"telegram_{method}"):
+            response = await client.post(f"{TELEGRAM_API}/{method}", json=payload, timeout=timeout)
+        if response.status_code != 200:
+            print(f"⚠️ Telegram {method}: {response.status_code}")
+        return response.json()
+    except Exception as e:
+        print(f"❌ Error Telegram {method}: {e}")
+        return None
+
+async def send_message(chat_id: int, text: str) -> Optional[Dict[str, Any]]:
+    """Enviar mensaje de texto a un chat"""
+    return await telegram_call("sendMessage", {"chat_id": chat_id, "text": text})
+
+async def set_webhook(url: str) -> Optional[Dict[str, Any]]:
+    """Registrar la URL del webhook en Telegram"""
+    return await telegram_call("setWebhook", {"url": url}, timeout=10.0)
+
+async def send_chat_action(chat_id: int, action: str = "typing") -> Optional[Dict[str, Any]]:
+    """Mostrar un indicador de actividad ("escribiendo...") en el chat"""
+    return await telegram_call("sendChatAction", {"chat_id": chat_id, "action": action}, timeout=5.0)
+
+async def edit_message_text(chat_id: int, message_id: int, text: str) -> Optional[Dict[str, Any]]:
+    """Reemplazar el texto de un mensaje ya enviado"""
+    return await telegram_call("editMessageText", {"chat_id": chat_id, "message_id": message_id, "text": text})
+
+def _retry_after(result: Optional[Dict[str, Any]]) -> float:
+    """Segundos de espera pedidos por Telegram en un 429 (0 si no aplica)"""
+    if result and result.get("error_code") == 429:
+        return float((result.get("parameters") or {}).get("retry_after", 1))
+    return 0.0
+
+def _publishable_prefix(text: str) -> str:
+    """Texto hasta la última oración completa (o un corte largo si no hay puntuación)"""
+    end = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        if match.end() >= _FIRST_MIN_CHARS:
+            end = match.end()
+    if not end and len(text) >= _FIRST_MAX_CHARS:
+        end = text.rfind(" ", 0, _FIRST_MAX_CHARS) + 1 or _FIRST_MAX_CHARS
+    return text[:end].strip()
+
+async def _keep_typing(chat_id: int):
+    while True:
+        await send_chat_action(chat_id)
+        await asyncio.sleep(TYPING_REFRESH)
+
+async def stream_message(chat_id: int, deltas: AsyncIterator[str],
+                         edit_interval: float = TELEGRAM_EDIT_INTERVAL) -> Optional[Dict[str, Any]]:
+    """Entregar una respuesta que llega por fragmentos
+    
+    Muestra "escribiendo..." al instante, publica la primera oración en cuanto
+    llega y edita el mensaje a ritmo limitado (respetando los 429 de Telegram).
+    """
+    typing = asyncio.create_task(_keep_typing(chat_id))
+    text = ""
+    shown = ""
+    message_id = None
+    result = None
+    next_edit = 0.0
+    
+    async def publish(new_text: str):
+        nonlocal shown, message_id, result, next_edit
+        new_text = new_text[:TELEGRAM_MAX_LENGTH]
+        if message_id is None:
+            result = await send_message(chat_id, new_text)
+            if result and result.get("ok"):
+                message_id = result["result"]["message_id"]
+                typing.cancel()
+        else:
+            result = await edit_message_text(chat_id, message_id, new_text)
+        wait = _retry_after(result)
+        if not wait and result and result.get("ok"):
+            shown = new_text
+        next_edit = time.monotonic() + max(edit_interval, wait)
+    
+    try:
+        async for delta in deltas:
+            # Se publica lo recibido antes de este fragmento: si todo llega de una vez
+            # (respuesta cacheada), sale en un solo mensaje sin ediciones
+            if text and time.monotonic() >= next_edit:
+                pending = _publishable_prefix(text) if message_id is None else text.strip()
+                if pending and pending != shown:
+                    await publish(pending)
+            text += delta
+        
+        # Texto final: esperar el turno de edición para no provocar un 429
+        final = text.strip()
+        if final and final[:TELEGRAM_MAX_LENGTH] != shown:
+            if message_id is not None:
+                await asyncio.sleep(max(0.0, next_edit - time.monotonic()))
+            await publish(final)
+            if _retry_after(result):
+                await asyncio.sleep(max(0.0, next_edit - time.monotonic()))
+                await publish(final)
+    finally:
+        typing.cancel()
+    return result
@@ -0,0 +1,128 @@
+import faiss
+import numpy as np
+from typing import Optional
+import math
+import os
+
+# Tipo de índice base: auto | flat | ivf | hnsw | ivfpq
+RAG_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto")
+# Umbrales de la selección automática (número de chunks)
+RAG_IVF_THRESHOLD = int(os.getenv("RAG_IVF_THRESHOLD", "50000"))
+RAG_IVFPQ_THRESHOLD = int(os.getenv("RAG_IVFPQ_THRESHOLD", "1000000"))
+# Parámetros de búsqueda: listas IVF visitadas (0 = RAG_NPROBE_FRACTION de las listas del índice)
+RAG_NPROBE = int(os.getenv("RAG_NPROBE", "0"))
+RAG_NPROBE_FRACTION = float(os.getenv("RAG_NPROBE_FRACTION", "0.1"))
+RAG_EF_SEARCH = int(os.getenv("RAG_EF_SEARCH", "64"))
+RAG_HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+# Máximo de vectores usados para entrenar (k-means / PQ)
+RAG_TRAIN_SAMPLE = int(os.getenv("RAG_TRAIN_SAMPLE", "100000"))
+# Almacenamiento de vectores en el índice base: float32 | fp16 | int8 | pq
+RAG_VECTOR_STORAGE = os.getenv("RAG_VECTOR_STORAGE", "float32")
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+STORAGE_MODES = ("float32", "fp16", "int8", "pq")
+
+def choose_index_type(n_vectors: int, configured: str = RAG_INDEX_TYPE) -> str:
+    """Elegir tipo de índice según configuración o tamaño del corpus"""
+    if configured in INDEX_TYPES:
+        kind = configured
+    elif n_vectors >= RAG_IVFPQ_THRESHOLD:
+        kind = "ivfpq"
+    elif n_vectors >= RAG_IVF_THRESHOLD:
+        kind = "ivf"
+    else:
+        kind = "flat"
+
+    # Sin datos suficientes para entrenar: PQ necesita 256 centroides por sub-espacio
+    if kind == "ivfpq" and n_vectors < 39 * 256:
+        kind = "ivf"
+    if kind == "ivf" and n_vectors < 39 * 16:
+        kind = "flat"
+    return kind
+
+def choose_storage(n_vectors: int, kind: str, configured: str = RAG_VECTOR_STORAGE) -> str:
+    """Compresión de los vectores del índice base (ivfpq siempre es PQ)"""
+    if kind == "ivfpq":
+        return "pq"
+    storage = configured if configured in STORAGE_MODES else "float32"
+    # PQ necesita datos para entrenar 256 centroides por sub-espacio
+    if storage == "pq" and n_vectors < 39 * 256:
+        storage = "int8"
+    return storage
+
+def _nlist(n_vectors: int) -> int:
+    # ~4·sqrt(n) listas, con al menos 39 puntos de entrenamiento por centroide
+    return max(16, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39, 65536))
+
+def auto_nprobe(nlist: int, fraction: float = RAG_NPROBE_FRACTION) -> int:
+    """Listas a visitar proporcionales a nlist: un nprobe fijo pierde recall al crecer el índice"""
+    return max(1, min(nlist, max(16, math.ceil(nlist * fraction))))
+
+def _pq_m(dim: int) -> int:
+    # Subcuantizadores que dividan la dimensión (~8 dims por sub-vector)
+    for m in (dim // 8, 64, 48, 32, 24, 16, 12, 8, 4):
+        if m > 0 and dim % m == 0:
+            return m
+    return 1
+
+def _codec(storage: str, dim: int) -> str:
+    return {"fp16": "SQfp16", "int8": "SQ8", "pq": f"PQ{_pq_m(dim)}"}.get(storage, "Flat")
+
+def factory_string(kind: str, dim: int, n_vectors: int, storage: str = "float32") -> str:
+    codec = _codec(storage, dim)
+    if kind == "ivf":
+        return f"IVF{_nlist(n_vectors)},{codec}"
+    if kind == "ivfpq":
+        return f"IVF{_nlist(n_vectors)},PQ{_pq_m(dim)}"
+    if kind == "hnsw":
+        return f"IDMap2,HNSW{RAG_HNSW_M}" if codec == "Flat" else f"IDMap2,HNSW{RAG_HNSW_M},{codec}"
+    if storage == "pq":
+        # IndexPQ no admite selectores: una sola lista IVF equivale a recorrerlo entero y sí los admite
+        return f"IVF1,{codec}"
+    return f"IDMap2,{codec}"
+
+def create_index(kind: str, dim: int, n_vectors: int = 0, storage: str = "float32"):
+    """Crear índice vacío de producto interno (coseno con vectores normalizados)"""
+    return faiss.index_factory(dim, factory_string(kind, dim, n_vectors, storage), faiss.METRIC_INNER_PRODUCT)
+
+def index_nbytes(index) -> int:
+    """Tamaño serializado del índice (aprox. su memoria residente)"""
+    return int(faiss.serialize_index(index).nbytes)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Copia float32 normalizada (L2) para similitud coseno"""
+    vectors = np.array(vectors, dtype='float32', copy=True, order='C')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def search_params(index, nprobe: int = RAG_NPROBE, ef_search: int = RAG_EF_SEARCH,
+                  selector=None) -> Optional[faiss.SearchParameters]:
+    """Parámetros de búsqueda por llamada (nprobe / efSearch) según el tipo de índice
+
+    nprobe <= 0 se calcula a partir de las listas del índice (auto_nprobe).
+    """
+    inner = index
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        inner = faiss.downcast_index(index.index)
+
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe if nprobe > 0 else auto_nprobe(inner.nlist)
+    elif isinstance(inner, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search
+    else:
+        params = faiss.SearchParameters()
+
+    if selector is not None:
+        params.sel = selector
+    return params
+
+def bitmap_selector(mask: np.ndarray):
+    """Selector de ids para filtrar dentro de la búsqueda (mask[id] = permitido)
+
+    Devuelve (selector, bits): el bitmap debe mantenerse vivo mientras se use el selector.
+    """
+    bits = np.packbits(np.asarray(mask, dtype=bool), bitorder='little')
+    # IDSelectorBitmap recibe el tamaño del bitmap en bytes
+    return faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits)), bits